@@ -4,18 +4,27 @@ Configura la aplicación, las extensiones y registra los namespaces.
 """
 
 from flask import Flask
-from .extensions import api, db
+from sqlalchemy import event
+from .extensions import activar_claves_foraneas, api, db, tablas_sin_cascada
 from .resources import ns
 from .config import get_config
+from .sharding import favoritos_shards
+from .cache import cache_identidad
+from .tendencias import tendencias
+from .playlists import rebalanceador
+from .instantanea import instantanea
+from . import codificacion, coalescencia, comandos, perfilado, trabajos
 
 
-def create_app(config_name=None):
+def create_app(config_name=None, config_extra=None):
     """
     Crea y configura la aplicación Flask con sus extensiones.
 
     Args:
         config_name (str): Nombre de la configuración a utilizar (default, development, testing, production).
                           Si es None, se utiliza la configuración según las variables de entorno.
+        config_extra (dict, optional): Valores que sobrescriben la configuración antes de
+                          inicializar las extensiones (útil en pruebas).
 
     Returns:
         Flask: La aplicación Flask configurada y lista para usar.
@@ -26,16 +35,46 @@ def create_app(config_name=None):
     # Aplicar configuración según entorno
     config_obj = get_config(config_name)  # Usa el método para obtener la configuración
     app.config.from_object(config_obj)
+    if config_extra:
+        app.config.update(config_extra)
 
     # Inicialización de extensiones
     db.init_app(app)
+    favoritos_shards.init_app(app)
+    cache_identidad.init_app(app)
+    tendencias.init_app(app)
+    rebalanceador.init_app(app)
+    trabajos.init_app(app)
+    instantanea.init_app(app)
     api.init_app(app)
+    # Opcional (PERFILADO_ACTIVO); se registra primero para medir también la
+    # espera de las peticiones coalescidas
+    perfilado.init_app(app)
+    codificacion.init_app(app)
+    coalescencia.init_app(app)
+
+    # Comandos de línea de órdenes (flask <comando>)
+    comandos.init_app(app)
 
     # Registro de namespaces
     api.add_namespace(ns)
 
     # Crear todas las tablas en la base de datos
     with app.app_context():
+        sqlite = db.engine.dialect.name == "sqlite"
+        if sqlite:
+            event.listen(db.engine, "connect", activar_claves_foraneas)
         db.create_all()
+        # Una base creada sin ON DELETE CASCADE rechazaría los borrados con
+        # las claves foráneas activas: se dejan como antes hasta migrarla
+        faltan = tablas_sin_cascada(db.engine) if sqlite else []
+        if faltan:
+            app.logger.warning(
+                "Claves foráneas de SQLite desactivadas: %s sin ON DELETE "
+                "CASCADE; ejecute `flask migrar-cascadas`",
+                ", ".join(faltan),
+            )
+            event.remove(db.engine, "connect", activar_claves_foraneas)
+            db.engine.dispose()
 
     return app
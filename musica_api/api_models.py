@@ -113,6 +113,33 @@ cancion_simple = api.model(
 )
 """Modelo simple para representar una Canción con campos básicos."""
 
+duplicado_model = api.inherit(
+    "Duplicado",
+    cancion_simple,
+    {
+        "similitud": fields.Float(
+            description="Similitud estimada de título y artista (0 a 1)"
+        ),
+    },
+)
+"""Modelo de una canción que probablemente duplica a otra."""
+
+cancion_creada_model = api.inherit(
+    "CancionCreada",
+    cancion_model,
+    {
+        "posibles_duplicados": fields.List(
+            fields.Nested(duplicado_model),
+            description="Canciones del catálogo que probablemente son la misma",
+        ),
+    },
+)
+"""Modelo de respuesta al crear una canción.
+
+Incluye los campos de `Cancion` y las canciones existentes que probablemente
+son duplicados de la nueva.
+"""
+
 usuario_simple = api.model(
     "UsuarioSimple",
     {
@@ -155,3 +182,301 @@ Campos:
 - usuario (UsuarioSimple): Datos básicos del usuario.
 - canciones_favoritas (list): Lista de canciones favoritas (CancionSimple).
 """
+
+cancion_popular_model = api.inherit(
+    "CancionPopular",
+    cancion_simple,
+    {
+        "favoritos": fields.Integer(
+            description="Número de usuarios que marcaron la canción como favorita"
+        ),
+    },
+)
+"""Modelo para el ranking de canciones más populares.
+
+Campos adicionales:
+- favoritos (int): Número de veces que la canción fue marcada como favorita.
+"""
+
+metrica_cache_model = api.model(
+    "MetricaCache",
+    {
+        "modelo": fields.String(description="Modelo cacheado (Usuario o Cancion)"),
+        "ids": fields.Integer(description="IDs registrados en la caché"),
+        "memoria_bytes": fields.Integer(description="Memoria ocupada en bytes"),
+        "bytes_por_millon": fields.Integer(
+            description="Memoria por cada millón de IDs registrados"
+        ),
+        "aciertos": fields.Integer(description="Consultas resueltas en memoria"),
+        "fallos": fields.Integer(description="Consultas verificadas en la base"),
+    },
+)
+"""Modelo con las métricas de la caché de identidad de un modelo."""
+
+metrica_instantanea_model = api.model(
+    "MetricaInstantanea",
+    {
+        "ruta": fields.String(description="Archivo de la instantánea"),
+        "activa": fields.Boolean(description="Si se están sirviendo lecturas"),
+        "version": fields.Integer(description="Último evento incluido"),
+        "generada": fields.DateTime(description="Fecha de generación"),
+        "canciones": fields.Integer(description="Canciones en la instantánea"),
+        "bytes": fields.Integer(description="Tamaño del archivo mapeado"),
+        "invalidadas": fields.Integer(
+            description="Canciones modificadas desde la versión (se leen de la base)"
+        ),
+        "aciertos": fields.Integer(description="Lecturas servidas por la instantánea"),
+        "fallos": fields.Integer(description="Lecturas resueltas en la base"),
+    },
+)
+"""Modelo con el estado y las métricas de la instantánea de canciones."""
+
+evento_model = api.model(
+    "Evento",
+    {
+        "id": fields.Integer(description="Secuencia del evento"),
+        "tabla": fields.String(
+            description="Tabla afectada (usuario, cancion, favorito)"
+        ),
+        "operacion": fields.String(
+            description="Operación (crear, actualizar, eliminar)"
+        ),
+        "id_registro": fields.Integer(description="ID del registro afectado"),
+        "datos": fields.Raw(description="Estado del registro tras el cambio"),
+        "fecha": fields.String(description="Fecha del cambio (ISO 8601)"),
+    },
+)
+"""Modelo para un evento del registro de cambios."""
+
+eventos_model = api.model(
+    "Eventos",
+    {
+        "eventos": fields.List(fields.Nested(evento_model)),
+        "ultimo": fields.Integer(
+            description="Secuencia a enviar como `desde` en la siguiente petición"
+        ),
+    },
+)
+"""Modelo para una página del registro de cambios.
+
+Campos:
+- eventos (list): Eventos posteriores a la secuencia solicitada.
+- ultimo (int): Última secuencia entregada.
+"""
+
+canciones_eliminar_input = api.model(
+    "CancionesEliminarInput",
+    {
+        "ids": fields.List(fields.Integer, description="IDs de las canciones"),
+        "titulo": fields.String(description="Título (búsqueda parcial)"),
+        "artista": fields.String(description="Artista (búsqueda parcial)"),
+        "genero": fields.String(description="Género musical (búsqueda exacta)"),
+    },
+)
+"""Modelo de entrada para eliminar canciones en lote.
+
+Se eliminan las canciones que cumplan todos los criterios indicados; se
+requiere al menos uno.
+"""
+
+usuarios_eliminar_input = api.model(
+    "UsuariosEliminarInput",
+    {
+        "ids": fields.List(fields.Integer, description="IDs de los usuarios"),
+        "correo": fields.String(description="Correo electrónico (búsqueda parcial)"),
+    },
+)
+"""Modelo de entrada para eliminar usuarios en lote.
+
+Se eliminan los usuarios que cumplan todos los criterios indicados; se
+requiere al menos uno.
+"""
+
+eliminacion_model = api.model(
+    "Eliminacion",
+    {"eliminados": fields.Integer(description="Cantidad de registros eliminados")},
+)
+"""Modelo de respuesta de una eliminación en lote."""
+
+metrica_coalescencia_model = api.model(
+    "MetricaCoalescencia",
+    {
+        "ejecutadas": fields.Integer(description="Peticiones GET ejecutadas"),
+        "coalescidas": fields.Integer(
+            description="Peticiones GET respondidas con el resultado de otra idéntica"
+        ),
+        "proporcion": fields.Float(description="Proporción de peticiones coalescidas"),
+    },
+)
+"""Modelo con las métricas de coalescencia de peticiones GET."""
+
+distribucion_model = api.model(
+    "Distribucion",
+    {
+        "nombre": fields.String(description="Género, década o artista"),
+        "canciones": fields.Integer(description="Canciones favoritas del grupo"),
+    },
+)
+"""Modelo de un grupo dentro de las estadísticas de un usuario."""
+
+estadisticas_model = api.model(
+    "EstadisticasUsuario",
+    {
+        "usuario": fields.Nested(usuario_simple),
+        "canciones": fields.Integer(description="Cantidad de canciones favoritas"),
+        "duracion_segundos": fields.Integer(
+            description="Duración total de los favoritos en segundos"
+        ),
+        "duracion_total": fields.String(description="Duración total en formato mm:ss"),
+        "generos": fields.List(fields.Nested(distribucion_model)),
+        "decadas": fields.List(fields.Nested(distribucion_model)),
+        "artistas_principales": fields.List(fields.Nested(distribucion_model)),
+    },
+)
+"""Modelo con las estadísticas de la biblioteca de favoritos de un usuario.
+
+Incluye:
+- totales de canciones y duración,
+- distribución por género (de mayor a menor) y por década (cronológica),
+- los artistas con más canciones favoritas.
+"""
+
+ruta_perfilada_model = api.model(
+    "RutaPerfilada",
+    {
+        "ruta": fields.String(description="Método y regla de la ruta"),
+        "peticiones": fields.Integer(description="Peticiones perfiladas"),
+        "muestras": fields.Integer(description="Pilas muestreadas"),
+    },
+)
+"""Modelo con el resumen del perfilado de una ruta."""
+
+playlist_input = api.model(
+    "PlaylistInput",
+    {"nombre": fields.String(required=True, description="Nombre de la playlist")},
+)
+"""Modelo de entrada para crear o renombrar una playlist."""
+
+playlist_model = api.model(
+    "Playlist",
+    {
+        "id": fields.Integer(description="ID de la playlist"),
+        "id_usuario": fields.Integer(description="ID del usuario dueño"),
+        "nombre": fields.String(description="Nombre de la playlist"),
+        "fecha_creacion": fields.DateTime(description="Fecha de creación"),
+    },
+)
+"""Modelo completo de una Playlist (sin sus canciones)."""
+
+playlists_pagina_model = api.model(
+    "PlaylistsPagina",
+    {
+        "playlists": fields.List(fields.Nested(playlist_model)),
+        "siguiente": fields.Integer(
+            description="Valor de `despues` para la página siguiente (null si no hay más)"
+        ),
+    },
+)
+"""Modelo de una página de playlists de un usuario."""
+
+playlist_posicion_input = api.model(
+    "PlaylistPosicionInput",
+    {
+        "antes_de": fields.Integer(
+            description="ID del elemento delante del cual se coloca la canción"
+        ),
+        "despues_de": fields.Integer(
+            description="ID del elemento detrás del cual se coloca la canción"
+        ),
+    },
+)
+"""Modelo de entrada para mover una canción dentro de una playlist.
+
+Se indica como mucho uno de los campos; sin ninguno, la canción va al final.
+"""
+
+playlist_item_input = api.inherit(
+    "PlaylistItemInput",
+    playlist_posicion_input,
+    {"id_cancion": fields.Integer(required=True, description="ID de la canción")},
+)
+"""Modelo de entrada para agregar una canción a una playlist."""
+
+playlist_item_model = api.model(
+    "PlaylistItem",
+    {
+        "id": fields.Integer(description="ID del elemento de la playlist"),
+        "id_cancion": fields.Integer(description="ID de la canción"),
+        "rango": fields.String(description="Clave de orden dentro de la playlist"),
+        "fecha_agregado": fields.DateTime(description="Fecha en que se agregó"),
+        "cancion": fields.Nested(cancion_simple, description="Datos de la canción"),
+    },
+)
+"""Modelo de una canción dentro de una playlist."""
+
+playlist_items_pagina_model = api.model(
+    "PlaylistItemsPagina",
+    {
+        "canciones": fields.List(fields.Nested(playlist_item_model)),
+        "siguiente": fields.Integer(
+            description="Valor de `despues` para la página siguiente (null si no hay más)"
+        ),
+    },
+)
+"""Modelo de una página de canciones de una playlist, en orden."""
+
+trabajo_model = api.model(
+    "Trabajo",
+    {
+        "id": fields.Integer(description="ID del trabajo"),
+        "tipo": fields.String(description="Tipo de trabajo"),
+        "argumentos": fields.Raw(description="Argumentos de la tarea"),
+        "estado": fields.String(
+            description="pendiente, en_curso, completado o fallido"
+        ),
+        "intentos": fields.Integer(description="Intentos realizados"),
+        "max_intentos": fields.Integer(description="Intentos permitidos"),
+        "resultado": fields.Raw(description="Resultado de la tarea (si terminó)"),
+        "error": fields.String(description="Error del último intento fallido"),
+        "trabajador": fields.String(description="Trabajador que lo tomó"),
+        "disponible_desde": fields.DateTime(
+            description="Momento a partir del cual puede ejecutarse"
+        ),
+        "fecha_creacion": fields.DateTime(description="Fecha en que se encoló"),
+        "fecha_inicio": fields.DateTime(description="Inicio del último intento"),
+        "fecha_fin": fields.DateTime(description="Fecha en que terminó"),
+    },
+)
+"""Modelo de un trabajo en segundo plano."""
+
+trabajo_aceptado_model = api.model(
+    "TrabajoAceptado",
+    {
+        "id_trabajo": fields.Integer(description="ID del trabajo encolado"),
+        "estado": fields.String(description="Estado del trabajo"),
+        "url": fields.String(description="URL para consultar el estado del trabajo"),
+    },
+)
+"""Modelo de la respuesta 202 de una operación encolada."""
+
+canciones_importar_input = api.model(
+    "CancionesImportarInput",
+    {
+        "canciones": fields.List(
+            fields.Nested(cancion_base),
+            required=True,
+            description="Canciones a crear",
+        ),
+    },
+)
+"""Modelo de entrada para importar un catálogo de canciones."""
+
+estadisticas_reconstruir_input = api.model(
+    "EstadisticasReconstruirInput",
+    {
+        "id_usuario": fields.Integer(
+            description="Reconstruir solo este usuario (por defecto, todos)"
+        ),
+    },
+)
+"""Modelo de entrada para reconstruir las estadísticas de usuario."""
@@ -0,0 +1,274 @@
+"""
+Módulo de caché de identidad para usuarios y canciones.
+
+Los recursos de favoritos solo necesitan saber si un `Usuario` o una `Cancion`
+existen. En lugar de cargar la fila completa en cada petición, se mantiene en
+memoria un mapa de bits con los IDs existentes de cada modelo (un bit por ID,
+125 KB por millón de IDs). El mapa se carga la primera vez que se usa y se
+mantiene coherente con las altas y bajas confirmadas en la sesión.
+
+La caché es local a cada proceso. Como mucho cada `CACHE_IDENTIDAD_REVISION`
+segundos se leen del registro de cambios (`Evento`) las altas y bajas
+posteriores a la última leída, de modo que las bajas hechas por otros procesos
+(por ejemplo, los trabajadores de la cola) también se reflejan. Entre
+revisiones un acierto se responde solo con el mapa, sin consultar la base; si
+la fila ya no existe, la clave foránea rechaza la escritura que depende de ella
+y el recurso responde 404. Un ID ausente del mapa se verifica además en la base
+de datos y, si existe, se añade al mapa.
+"""
+
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from .extensions import db
+from .models import Evento, Usuario, Cancion
+
+
+class MapaBitsIds:
+    """
+    Conjunto de IDs enteros positivos representado como un mapa de bits.
+
+    Los IDs mayores que `max_id` no se guardan y se consideran desconocidos,
+    lo que acota la memoria usada por el mapa.
+    """
+
+    def __init__(self, max_id):
+        self.max_id = max_id
+        self._bits = bytearray()
+        self._total = 0
+
+    def __contains__(self, id):
+        byte = id >> 3
+        return (
+            0 < id <= self.max_id
+            and byte < len(self._bits)
+            and bool(self._bits[byte] & (1 << (id & 7)))
+        )
+
+    def __len__(self):
+        return self._total
+
+    def agregar(self, id):
+        """
+        Marca un ID como existente.
+
+        Returns:
+            bool: False si el ID queda fuera del rango cubierto por el mapa
+        """
+        if not 0 < id <= self.max_id:
+            return False
+        byte = id >> 3
+        if byte >= len(self._bits):
+            # Crecer por bloques para no reasignar en cada alta
+            self._bits.extend(bytes(max(byte + 1 - len(self._bits), 4096)))
+        if not self._bits[byte] & (1 << (id & 7)):
+            self._bits[byte] |= 1 << (id & 7)
+            self._total += 1
+        return True
+
+    def descartar(self, id):
+        """Marca un ID como inexistente."""
+        if id in self:
+            self._bits[id >> 3] &= ~(1 << (id & 7)) & 0xFF
+            self._total -= 1
+
+    @property
+    def memoria_bytes(self):
+        """int: Bytes ocupados por el mapa de bits."""
+        return len(self._bits)
+
+
+class CacheIdentidad:
+    """
+    Extensión que responde si un usuario o una canción existen sin cargar la fila.
+    """
+
+    modelos = (Usuario, Cancion)
+
+    def init_app(self, app):
+        """
+        Prepara los mapas de bits de la aplicación.
+
+        Args:
+            app (Flask): Aplicación a la que se asocia la caché.
+        """
+        app.extensions["cache_identidad"] = {
+            modelo: {
+                "ids": MapaBitsIds(app.config.get("CACHE_IDENTIDAD_MAX_ID", 1 << 26)),
+                "cargado": False,
+                "ultimo_evento": 0,
+                "revisado": 0.0,
+                "revisando": False,
+                "aciertos": 0,
+                "fallos": 0,
+                "lock": threading.Lock(),
+            }
+            for modelo in self.modelos
+        }
+
+    @property
+    def _estado(self):
+        return current_app.extensions["cache_identidad"]
+
+    def _cargar(self, estado, modelo):
+        # Los eventos posteriores a esta marca se vuelven a aplicar al revisar
+        estado["ultimo_evento"] = db.session.query(func.max(Evento.id)).scalar() or 0
+        for (id,) in db.session.query(modelo.id):
+            estado["ids"].agregar(id)
+        estado["revisado"] = time.monotonic()
+        estado["cargado"] = True
+
+    def _revisar(self, estado, modelo):
+        """
+        Aplica las altas y bajas registradas desde el último evento leído.
+
+        Solo lee el registro si pasaron `CACHE_IDENTIDAD_REVISION` segundos
+        desde la última lectura y ningún otro hilo lo está leyendo. La lectura
+        se hace sin tomar el lock del modelo, para no serializar las
+        comprobaciones de existencia detrás de la consulta.
+        """
+        intervalo = current_app.config.get("CACHE_IDENTIDAD_REVISION", 1.0)
+        with estado["lock"]:
+            if estado["revisando"] or (
+                time.monotonic() - estado["revisado"] < intervalo
+            ):
+                return
+            estado["revisando"] = True
+            desde = estado["ultimo_evento"]
+
+        try:
+            eventos = (
+                db.session.query(Evento.id, Evento.operacion, Evento.id_registro)
+                .filter(Evento.id > desde, Evento.tabla == modelo.__tablename__)
+                .order_by(Evento.id)
+                .all()
+            )
+        finally:
+            with estado["lock"]:
+                estado["revisando"] = False
+
+        with estado["lock"]:
+            for id_evento, operacion, id in eventos:
+                if operacion == "crear":
+                    estado["ids"].agregar(id)
+                elif operacion == "eliminar":
+                    estado["ids"].descartar(id)
+                estado["ultimo_evento"] = max(estado["ultimo_evento"], id_evento)
+            estado["revisado"] = time.monotonic()
+
+    def existe(self, modelo, id):
+        """
+        Indica si existe una fila del modelo con el ID dado.
+
+        Args:
+            modelo (type): `Usuario` o `Cancion`
+            id (int): ID a comprobar
+
+        Returns:
+            bool: True si la fila existe; False también si el ID no es un entero
+        """
+        if not isinstance(id, int) or isinstance(id, bool):
+            return False
+        estado = self._estado[modelo]
+        with estado["lock"]:
+            if not estado["cargado"]:
+                self._cargar(estado, modelo)
+        self._revisar(estado, modelo)
+        with estado["lock"]:
+            if id in estado["ids"]:
+                estado["aciertos"] += 1
+                return True
+            estado["fallos"] += 1
+
+        existe = db.session.query(modelo.id).filter_by(id=id).first() is not None
+        if existe:
+            with estado["lock"]:
+                estado["ids"].agregar(id)
+        return existe
+
+    def registrar(self, modelo, id, existe):
+        """
+        Actualiza la caché tras un alta o baja confirmada.
+
+        Args:
+            modelo (type): `Usuario` o `Cancion`
+            id (int): ID afectado
+            existe (bool): True si se creó, False si se eliminó
+        """
+        estado = self._estado[modelo]
+        with estado["lock"]:
+            if existe:
+                estado["ids"].agregar(id)
+            else:
+                estado["ids"].descartar(id)
+
+    def metricas(self):
+        """
+        Obtiene las métricas de uso y memoria de la caché.
+
+        Returns:
+            list: Un diccionario por modelo
+        """
+        resultado = []
+        for modelo, estado in self._estado.items():
+            ids = estado["ids"]
+            resultado.append(
+                {
+                    "modelo": modelo.__name__,
+                    "ids": len(ids),
+                    "memoria_bytes": ids.memoria_bytes,
+                    "bytes_por_millon": (
+                        round(ids.memoria_bytes * 1_000_000 / len(ids)) if ids else 0
+                    ),
+                    "aciertos": estado["aciertos"],
+                    "fallos": estado["fallos"],
+                }
+            )
+        return resultado
+
+
+cache_identidad = CacheIdentidad()
+"""Instancia de CacheIdentidad usada por los recursos de la API."""
+
+
+def anotar_bajas(modelo, ids):
+    """
+    Anota bajas hechas con SQL masivo para aplicarlas a la caché al confirmar.
+
+    Args:
+        modelo (type): `Usuario` o `Cancion`
+        ids (list): IDs eliminados en la transacción actual de `db.session`
+    """
+    pendientes = db.session.info.setdefault("identidad_pendiente", [])
+    pendientes.extend((modelo, id, False) for id in ids)
+
+
+@event.listens_for(Session, "after_flush")
+def _anotar_cambios(session, flush_context):
+    """Anota las altas y bajas de usuarios y canciones pendientes de confirmar."""
+    pendientes = session.info.setdefault("identidad_pendiente", [])
+    for instancia in session.new:
+        if isinstance(instancia, CacheIdentidad.modelos):
+            pendientes.append((type(instancia), instancia.id, True))
+    for instancia in session.deleted:
+        if isinstance(instancia, CacheIdentidad.modelos):
+            pendientes.append((type(instancia), instancia.id, False))
+
+
+@event.listens_for(Session, "after_commit")
+def _aplicar_cambios(session):
+    """Aplica a la caché los cambios confirmados."""
+    pendientes = session.info.pop("identidad_pendiente", [])
+    if pendientes and has_app_context() and "cache_identidad" in current_app.extensions:
+        for modelo, id, existe in pendientes:
+            cache_identidad.registrar(modelo, id, existe)
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_cambios(session):
+    """Descarta los cambios anotados de una transacción revertida."""
+    session.info.pop("identidad_pendiente", None)
@@ -0,0 +1,159 @@
+"""
+Módulo de coalescencia de peticiones GET idénticas (single-flight).
+
+Cuando llegan a la vez varias peticiones GET idénticas (misma ruta, mismos
+parámetros y mismas cabeceras de negociación), solo la primera ejecuta el
+recurso. Las demás esperan a que termine y responden con una copia de los
+bytes ya serializados, sin consultar la base de datos ni volver a serializar.
+
+La coalescencia ocurre dentro de cada proceso, así que solo tiene efecto con
+servidores que atienden varias peticiones concurrentes por proceso (hilos).
+La compresión de `codificacion` se aplica después, según el `Accept-Encoding`
+de cada cliente.
+
+Un recurso puede excluirse definiendo el atributo de clase `coalescer = False`.
+"""
+
+import threading
+
+from flask import Response, current_app, g, request
+
+
+class _Vuelo:
+    """Cómputo en curso de una petición, compartido con las idénticas."""
+
+    def __init__(self):
+        self.listo = threading.Event()
+        self.respuesta = None  # (cuerpo, estado, cabeceras)
+
+
+class Coalescedor:
+    """
+    Registro de las peticiones en curso y métricas de coalescencia.
+
+    Args:
+        espera (float): Segundos que una petición espera al cómputo en curso
+            antes de ejecutarse por su cuenta
+    """
+
+    def __init__(self, espera):
+        self.espera = espera
+        self.lideres = 0
+        self.seguidores = 0
+        self._lock = threading.Lock()
+        self._vuelos = {}
+
+    def entrar(self, clave):
+        """
+        Registra una petición.
+
+        Returns:
+            tuple: (vuelo, True si esta petición debe ejecutar el recurso)
+        """
+        with self._lock:
+            vuelo = self._vuelos.get(clave)
+            if vuelo is None:
+                vuelo = self._vuelos[clave] = _Vuelo()
+                self.lideres += 1
+                return vuelo, True
+            return vuelo, False
+
+    def esperar(self, vuelo):
+        """
+        Espera el resultado de un cómputo en curso.
+
+        Returns:
+            tuple: Respuesta compartida, o None si no llegó a tiempo
+        """
+        if vuelo.listo.wait(self.espera) and vuelo.respuesta is not None:
+            with self._lock:
+                self.seguidores += 1
+            return vuelo.respuesta
+        return None
+
+    def salir(self, clave, vuelo, respuesta):
+        """Publica el resultado de un cómputo y lo retira de los vuelos en curso."""
+        vuelo.respuesta = respuesta
+        with self._lock:
+            if self._vuelos.get(clave) is vuelo:
+                del self._vuelos[clave]
+        vuelo.listo.set()
+
+    def metricas(self):
+        """
+        Obtiene las métricas de coalescencia.
+
+        Returns:
+            dict: Peticiones ejecutadas, coalescidas y proporción coalescida
+        """
+        total = self.lideres + self.seguidores
+        return {
+            "ejecutadas": self.lideres,
+            "coalescidas": self.seguidores,
+            "proporcion": self.seguidores / total if total else 0.0,
+        }
+
+
+def _clave_peticion():
+    """Construye la clave que identifica peticiones GET idénticas."""
+    if request.method != "GET":
+        return None
+    vista = current_app.view_functions.get(request.endpoint)
+    if not getattr(getattr(vista, "view_class", None), "coalescer", True):
+        return None
+    return (
+        request.path,
+        tuple(sorted(request.args.items(multi=True))),
+        request.headers.get("Accept", ""),
+        request.headers.get(current_app.config["RESTX_MASK_HEADER"], ""),
+    )
+
+
+def init_app(app):
+    """
+    Registra la coalescencia de peticiones GET en la aplicación.
+
+    Debe llamarse después de `codificacion.init_app` para compartir el cuerpo
+    antes de comprimirlo.
+
+    Args:
+        app (Flask): Aplicación en la que se activa la coalescencia.
+    """
+    coalescedor = Coalescedor(app.config.get("COALESCENCIA_ESPERA", 10))
+    app.extensions["coalescencia"] = coalescedor
+
+    @app.before_request
+    def unirse_a_vuelo():
+        clave = _clave_peticion()
+        if clave is None:
+            return None
+        vuelo, lider = coalescedor.entrar(clave)
+        if lider:
+            g.vuelo = (clave, vuelo)
+            return None
+        respuesta = coalescedor.esperar(vuelo)
+        if respuesta is None:
+            return None
+        cuerpo, estado, cabeceras = respuesta
+        return Response(cuerpo, status=estado, headers=cabeceras)
+
+    @app.after_request
+    def publicar_vuelo(response):
+        if "vuelo" in g:
+            clave, vuelo = g.pop("vuelo")
+            compartible = not (response.is_streamed or response.direct_passthrough)
+            coalescedor.salir(
+                clave,
+                vuelo,
+                (response.get_data(), response.status_code, list(response.headers))
+                if compartible
+                else None,
+            )
+        return response
+
+    @app.teardown_request
+    def liberar_vuelo(exc):
+        # Si la petición falló antes de after_request, las demás se ejecutan solas
+        if "vuelo" in g:
+            clave, vuelo = g.pop("vuelo")
+            coalescedor.salir(clave, vuelo, None)
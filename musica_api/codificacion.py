@@ -0,0 +1,164 @@
+"""
+Módulo de codificación de respuestas.
+
+Añade a la API:
+
+- Compresión de las respuestas grandes según la cabecera `Accept-Encoding`
+  (zstd y brotli si las bibliotecas están instaladas, gzip siempre).
+- Una representación MessagePack (`application/msgpack`) negociada con la
+  cabecera `Accept`. Se registra como representación de Flask-RESTX, por lo que
+  se aplica sobre los datos ya serializados con los modelos de `api_models` y
+  ambos formatos comparten el mismo esquema.
+
+Las bibliotecas `msgpack`, `zstandard` y `brotli` están en `requirements.txt`,
+pero el módulo funciona sin ellas: sin la biblioteca, el formato o la
+compresión correspondiente simplemente no se ofrece.
+"""
+
+import gzip
+import json
+import time
+
+from flask import make_response, request
+
+from .extensions import api
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - depende del entorno
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - depende del entorno
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depende del entorno
+    brotli = None
+
+MIME_MSGPACK = "application/msgpack"
+"""Tipo de contenido de las respuestas MessagePack."""
+
+_TIPOS_COMPRIMIBLES = {"application/json", MIME_MSGPACK, "text/plain", "text/html"}
+
+
+def _compresores(nivel):
+    """
+    Obtiene los compresores disponibles en orden de preferencia.
+
+    Args:
+        nivel (int): Nivel de compresión de gzip (1-9)
+
+    Returns:
+        dict: Nombre de la codificación -> función que comprime bytes
+    """
+    compresores = {}
+    if zstandard is not None:
+        compresores["zstd"] = zstandard.ZstdCompressor(level=3).compress
+    if brotli is not None:
+        compresores["br"] = lambda datos: brotli.compress(datos, quality=4)
+    compresores["gzip"] = lambda datos: gzip.compress(
+        datos, compresslevel=nivel, mtime=0
+    )
+    return compresores
+
+
+def elegir_codificacion(aceptadas, compresores):
+    """
+    Elige la codificación aceptada con mayor calidad (`q`).
+
+    El orden de `compresores` solo desempata entre calidades iguales, así que
+    `gzip;q=1, br;q=0.1` recibe gzip aunque brotli esté disponible.
+
+    Args:
+        aceptadas (Accept): Cabecera `Accept-Encoding` de la petición
+        compresores (dict): Codificaciones disponibles en orden de preferencia
+
+    Returns:
+        str: Codificación elegida, o None si el cliente no acepta ninguna
+    """
+    candidatas = [
+        (aceptadas[codificacion], -orden, codificacion)
+        for orden, codificacion in enumerate(compresores)
+        if aceptadas[codificacion] > 0
+    ]
+    return max(candidatas)[2] if candidatas else None
+
+
+def _salida_msgpack(data, code, headers=None):
+    """Representación MessagePack para Flask-RESTX."""
+    resp = make_response(msgpack.packb(data, default=str), code)
+    resp.headers.extend(headers or {})
+    return resp
+
+
+def init_app(app):
+    """
+    Registra la compresión de respuestas y la representación MessagePack.
+
+    Args:
+        app (Flask): Aplicación a la que se aplica la codificación.
+    """
+    if msgpack is not None:
+        api.representation(MIME_MSGPACK)(_salida_msgpack)
+
+    minimo = app.config.get("COMPRESION_MINIMA", 1024)
+    compresores = _compresores(app.config.get("COMPRESION_NIVEL", 6))
+
+    @app.after_request
+    def comprimir(response):
+        if (
+            response.direct_passthrough
+            or response.is_streamed
+            or response.status_code < 200
+            or response.status_code in (204, 304)
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in _TIPOS_COMPRIMIBLES
+        ):
+            return response
+
+        response.vary.add("Accept-Encoding")
+        datos = response.get_data()
+        if len(datos) < minimo:
+            return response
+
+        codificacion = elegir_codificacion(request.accept_encodings, compresores)
+        if codificacion is not None:
+            response.set_data(compresores[codificacion](datos))
+            response.headers["Content-Encoding"] = codificacion
+        return response
+
+
+def comparar_codificaciones(datos, repeticiones=20):
+    """
+    Mide el tamaño y el costo de CPU de cada combinación de formato y compresión.
+
+    Args:
+        datos (list | dict): Datos ya serializados con un modelo de `api_models`
+        repeticiones (int): Veces que se repite cada medición
+
+    Returns:
+        list: Un diccionario por combinación con bytes y milisegundos por respuesta
+    """
+    formatos = {"json": lambda d: json.dumps(d).encode()}
+    if msgpack is not None:
+        formatos["msgpack"] = lambda d: msgpack.packb(d, default=str)
+    compresores = {"identity": lambda b: b, **_compresores(6)}
+
+    resultados = []
+    for formato, serializar in formatos.items():
+        for codificacion, comprimir_datos in compresores.items():
+            inicio = time.perf_counter()
+            for _ in range(repeticiones):
+                cuerpo = comprimir_datos(serializar(datos))
+            resultados.append(
+                {
+                    "formato": formato,
+                    "codificacion": codificacion,
+                    "bytes": len(cuerpo),
+                    "ms": (time.perf_counter() - inicio) * 1000 / repeticiones,
+                }
+            )
+    return resultados
@@ -0,0 +1,154 @@
+"""
+Módulo de comandos de línea de órdenes (Flask CLI) de la aplicación.
+
+Los comandos se ejecutan con `flask <comando>` desde la raíz del proyecto.
+"""
+
+import os
+import signal
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from flask_restx import marshal
+
+from .api_models import cancion_model
+from .codificacion import comparar_codificaciones
+from .duplicados import agrupar_duplicados, indexar_pendientes
+from .estadisticas import reconstruir
+from .extensions import db, reconstruir_cascadas
+from .instantanea import escribir, ruta_archivo
+from .models import Cancion
+from .trabajos import iniciar_trabajadores
+
+
+@click.command("benchmark-codificacion")
+@click.option("--canciones", default=1000, help="Canciones en la respuesta de prueba")
+@click.option("--repeticiones", default=20, help="Repeticiones por medición")
+def benchmark_codificacion(canciones, repeticiones):
+    """Compara bytes y CPU de JSON/MessagePack con y sin compresión."""
+    datos = marshal(
+        [
+            {
+                "id": i,
+                "titulo": f"Canción {i}",
+                "artista": f"Artista {i % 50}",
+                "album": f"Álbum {i % 200}",
+                "duracion": 120 + i % 240,
+                "año": 1960 + i % 60,
+                "genero": ("Rock", "Pop", "Jazz", "Salsa")[i % 4],
+                "fecha_creacion": datetime(2025, 1, 1),
+            }
+            for i in range(1, canciones + 1)
+        ],
+        cancion_model,
+    )
+
+    click.echo(f"{'formato':<10}{'codificación':<14}{'bytes':>10}{'ms':>10}")
+    for fila in comparar_codificaciones(datos, repeticiones):
+        click.echo(
+            f"{fila['formato']:<10}{fila['codificacion']:<14}"
+            f"{fila['bytes']:>10}{fila['ms']:>10.3f}"
+        )
+
+
+@click.command("reconstruir-estadisticas")
+@click.option("--usuario", type=int, help="Reconstruir solo este usuario")
+@with_appcontext
+def reconstruir_estadisticas(usuario):
+    """Recalcula las estadísticas de usuario a partir de los favoritos."""
+    usuarios = reconstruir(usuario)
+    click.echo(f"Estadísticas reconstruidas para {usuarios} usuario(s)")
+
+
+@click.command("reporte-duplicados")
+@click.option("--umbral", type=float, help="Similitud mínima (0 a 1)")
+@with_appcontext
+def reporte_duplicados(umbral):
+    """Indexa las canciones sin firma y lista los grupos de casi duplicados."""
+    indexadas = indexar_pendientes()
+    grupos = agrupar_duplicados(umbral)
+    click.echo(f"Canciones indexadas: {indexadas}")
+    click.echo(f"Grupos de posibles duplicados: {len(grupos)}")
+    for grupo in grupos:
+        canciones = Cancion.query.filter(Cancion.id.in_(grupo)).order_by(Cancion.id)
+        click.echo("")
+        for cancion in canciones:
+            click.echo(f"  {cancion.id:>8}  {cancion.titulo} - {cancion.artista}")
+
+
+@click.command("instantanea")
+@click.option(
+    "--canciones", type=int, help="Canciones a incluir (INSTANTANEA_CANCIONES)"
+)
+@click.option(
+    "--ruta", help="Archivo de salida (por defecto, el que mapea la aplicación)"
+)
+@with_appcontext
+def instantanea(canciones, ruta):
+    """Escribe la instantánea de las canciones más populares."""
+    ruta = ruta or ruta_archivo(current_app)
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+    try:
+        datos = escribir(
+            ruta, canciones or current_app.config.get("INSTANTANEA_CANCIONES", 10000)
+        )
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(
+        f"Instantánea escrita en {ruta}: {datos['canciones']} canciones, "
+        f"{datos['bytes']} bytes, versión {datos['version']}"
+    )
+    click.echo("Los procesos la mapean al reiniciarse")
+
+
+@click.command("trabajadores")
+@click.option("--procesos", type=int, help="Procesos trabajadores (TRABAJOS_PROCESOS)")
+@with_appcontext
+def trabajadores(procesos):
+    """Ejecuta los trabajos en segundo plano hasta recibir Ctrl+C o SIGTERM."""
+    lista, detener = iniciar_trabajadores(procesos)
+    # Cada proceso termina su trabajo en curso antes de salir
+    signal.signal(signal.SIGTERM, lambda *_: detener.set())
+    click.echo(f"{len(lista)} trabajador(es) iniciado(s). Ctrl+C para detener.")
+    try:
+        for proceso in lista:
+            proceso.join()
+    except KeyboardInterrupt:
+        detener.set()
+        for proceso in lista:
+            proceso.join()
+    click.echo("Trabajadores detenidos")
+
+
+@click.command("migrar-cascadas")
+@with_appcontext
+def migrar_cascadas():
+    """Reconstruye las tablas SQLite creadas sin ON DELETE CASCADE."""
+    tablas, huerfanas = reconstruir_cascadas(db.engine)
+    if not tablas:
+        click.echo("Todas las tablas tienen ON DELETE CASCADE")
+        return
+    click.echo(f"Tablas reconstruidas: {', '.join(tablas)}")
+    if huerfanas:
+        click.echo(
+            f"Se eliminaron {huerfanas} filas huérfanas; "
+            "ejecute `flask reconstruir-estadisticas`"
+        )
+    click.echo("Reinicie la aplicación para activar las claves foráneas")
+
+
+def init_app(app):
+    """
+    Registra los comandos en la CLI de la aplicación.
+
+    Args:
+        app (Flask): Aplicación a la que se añaden los comandos.
+    """
+    app.cli.add_command(benchmark_codificacion)
+    app.cli.add_command(reconstruir_estadisticas)
+    app.cli.add_command(reporte_duplicados)
+    app.cli.add_command(instantanea)
+    app.cli.add_command(trabajadores)
+    app.cli.add_command(migrar_cascadas)
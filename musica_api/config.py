@@ -22,6 +22,70 @@ class Config:
         os.getenv("SQLALCHEMY_TRACK_MODIFICATIONS", "False").lower() == "true"
     )
 
+    # Base SQLite de la cola de trabajos en segundo plano (relativa a instance/)
+    SQLALCHEMY_BINDS = {
+        "trabajos": os.getenv("TRABAJOS_URI", "sqlite:///trabajos.db"),
+    }
+
+    # Particiones de la tabla de favoritos (URIs separadas por comas).
+    # Si está vacía, los favoritos se guardan en la base de datos principal.
+    FAVORITOS_SHARDS = [
+        uri.strip()
+        for uri in os.getenv("FAVORITOS_SHARDS", "").split(",")
+        if uri.strip()
+    ]
+
+    # Mayor ID cubierto por la caché de identidad (un bit por ID)
+    CACHE_IDENTIDAD_MAX_ID = int(os.getenv("CACHE_IDENTIDAD_MAX_ID", 1 << 26))
+    # Segundos entre lecturas del registro de cambios (0: en cada comprobación)
+    CACHE_IDENTIDAD_REVISION = float(os.getenv("CACHE_IDENTIDAD_REVISION", 1.0))
+
+    # Compresión de respuestas: tamaño mínimo en bytes y nivel de gzip
+    COMPRESION_MINIMA = int(os.getenv("COMPRESION_MINIMA", 1024))
+    COMPRESION_NIVEL = int(os.getenv("COMPRESION_NIVEL", 6))
+
+    # Segundos que una petición GET espera a otra idéntica en curso
+    COALESCENCIA_ESPERA = float(os.getenv("COALESCENCIA_ESPERA", 10))
+
+    # Segundos entre compactaciones de las cubetas de tendencias
+    TENDENCIAS_COMPACTACION = int(os.getenv("TENDENCIAS_COMPACTACION", 60))
+
+    # Similitud mínima (0 a 1) para señalar dos canciones como duplicadas
+    DUPLICADOS_UMBRAL = float(os.getenv("DUPLICADOS_UMBRAL", 0.9))
+    # Canciones máximas de una cubeta LSH para compararlas en el reporte
+    DUPLICADOS_CUBETA_MAXIMA = int(os.getenv("DUPLICADOS_CUBETA_MAXIMA", 100))
+
+    # Longitud de clave de orden a partir de la cual se rebalancea una playlist
+    PLAYLIST_RANGO_MAXIMO = int(os.getenv("PLAYLIST_RANGO_MAXIMO", 12))
+
+    # Cola de trabajos: procesos trabajadores, intentos por trabajo, segundos
+    # base de espera entre reintentos (se duplica en cada intento), segundos
+    # entre consultas de una cola vacía y segundos tras los que un trabajo en
+    # curso se considera abandonado (el trabajador murió) y se reintenta
+    TRABAJOS_PROCESOS = int(os.getenv("TRABAJOS_PROCESOS", 2))
+    TRABAJOS_INTENTOS = int(os.getenv("TRABAJOS_INTENTOS", 3))
+    TRABAJOS_ESPERA_BASE = float(os.getenv("TRABAJOS_ESPERA_BASE", 2))
+    TRABAJOS_SONDEO = float(os.getenv("TRABAJOS_SONDEO", 1))
+    TRABAJOS_TIEMPO_MAXIMO = int(os.getenv("TRABAJOS_TIEMPO_MAXIMO", 3600))
+
+    # Instantánea de arranque en caliente (flask instantanea): archivo relativo
+    # a instance/, canciones que incluye y segundos entre revisiones del
+    # registro de cambios para descartar las canciones modificadas (0 revisa en
+    # cada lectura; con más, los cambios de otros procesos tardan hasta ese
+    # tiempo en verse)
+    INSTANTANEA_RUTA = os.getenv("INSTANTANEA_RUTA", "instantanea.bin")
+    INSTANTANEA_CANCIONES = int(os.getenv("INSTANTANEA_CANCIONES", 10000))
+    INSTANTANEA_REVISION = float(os.getenv("INSTANTANEA_REVISION", 0))
+
+    # Perfilado estadístico de peticiones (opcional): fracción de peticiones
+    # perfiladas, cabecera que fuerza el perfilado, segundos entre muestras y
+    # token exigido por la cabecera y por /api/perfilado (vacío: no se activa)
+    PERFILADO_ACTIVO = os.getenv("PERFILADO_ACTIVO", "False").lower() == "true"
+    PERFILADO_FRACCION = float(os.getenv("PERFILADO_FRACCION", 0.01))
+    PERFILADO_CABECERA = os.getenv("PERFILADO_CABECERA", "X-Perfilar")
+    PERFILADO_INTERVALO = float(os.getenv("PERFILADO_INTERVALO", 0.005))
+    PERFILADO_TOKEN = os.getenv("PERFILADO_TOKEN", "")
+
     # Configuración de la API
     API_TITLE = os.getenv("API_TITLE", "API de Música")
     API_VERSION = os.getenv("API_VERSION", "1.0")
@@ -41,6 +105,8 @@ class TestingConfig(Config):
 
     TESTING = True
     SQLALCHEMY_DATABASE_URI = "sqlite:///musica_test.db"
+    SQLALCHEMY_BINDS = {"trabajos": "sqlite:///trabajos_test.db"}
+    INSTANTANEA_RUTA = "instantanea_test.bin"
 
 
 class ProductionConfig(Config):
@@ -0,0 +1,291 @@
+"""
+Módulo de detección de canciones casi duplicadas.
+
+Las cargas masivas de catálogo traen la misma canción escrita de varias formas
+("Canción (Remastered)", "CANCION", "cancion"). Comparar cada par de canciones
+es O(n²), así que se usa MinHash con LSH (locality-sensitive hashing):
+
+1. El título y el artista se normalizan (sin acentos, sin calificadores entre
+   paréntesis o corchetes y con `utils.generar_slug`) y se dividen en
+   fragmentos de tres caracteres (shingles).
+2. La firma MinHash de esos fragmentos tiene `BANDAS * FILAS` valores; la
+   proporción de valores iguales entre dos firmas estima la similitud de
+   Jaccard de los fragmentos.
+3. La firma se divide en `BANDAS` bandas de `FILAS` valores. Cada banda se
+   guarda en `BandaCancion` con un índice, y dos canciones que coinciden en
+   alguna banda son candidatas. Solo las candidatas se comparan con su firma
+   completa (`FirmaCancion`).
+
+Con 16 bandas de 4 filas, un par con similitud 0.7 es candidato con una
+probabilidad del 98 % y uno con similitud 0.3, del 12 %.
+
+Las canciones creadas o editadas con la API se indexan al guardarse; las
+cargadas por otros medios se indexan con `flask reporte-duplicados`.
+"""
+
+import random
+import re
+import struct
+import unicodedata
+import zlib
+
+from flask import current_app
+from sqlalchemy import and_, func, or_
+
+from utils import generar_slug
+
+from .extensions import db
+from .models import BandaCancion, Cancion, FirmaCancion
+
+BANDAS = 16
+"""Cantidad de bandas LSH de cada firma."""
+
+FILAS = 4
+"""Valores MinHash por banda."""
+
+TAMANO_LOTE = 500
+"""Canciones por lote al indexar el catálogo."""
+
+_PRIMO = (1 << 61) - 1
+_MASCARA = 0xFFFFFFFF
+_aleatorio = random.Random(20250601)  # Semilla fija: las firmas deben ser estables
+_PERMUTACIONES = [
+    (_aleatorio.randrange(1, _PRIMO), _aleatorio.randrange(0, _PRIMO))
+    for _ in range(BANDAS * FILAS)
+]
+_FORMATO = f"<{BANDAS * FILAS}I"
+
+_CALIFICADORES = re.compile(r"\([^)]*\)|\[[^\]]*\]")
+
+
+def normalizar(texto):
+    """
+    Normaliza un título o artista para compararlo.
+
+    Args:
+        texto (str): Texto original, p. ej. "Canción (Remastered 2011)"
+
+    Returns:
+        str: Slug sin acentos ni calificadores, p. ej. "cancion"
+    """
+    texto = unicodedata.normalize("NFKD", texto or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return generar_slug(_CALIFICADORES.sub(" ", texto))
+
+
+def _fragmentos(prefijo, texto):
+    """Fragmentos de tres caracteres de un texto normalizado."""
+    slug = normalizar(texto)
+    if len(slug) <= 3:
+        return {f"{prefijo}:{slug}"}
+    return {f"{prefijo}:{slug[i : i + 3]}" for i in range(len(slug) - 2)}
+
+
+def calcular_firma(titulo, artista):
+    """
+    Calcula la firma MinHash de una canción.
+
+    Args:
+        titulo (str): Título de la canción
+        artista (str): Artista de la canción
+
+    Returns:
+        tuple: `BANDAS * FILAS` enteros de 32 bits
+    """
+    hashes = [
+        zlib.crc32(fragmento.encode())
+        for fragmento in _fragmentos("t", titulo) | _fragmentos("a", artista)
+    ]
+    return tuple(
+        min((a * x + b) % _PRIMO for x in hashes) & _MASCARA for a, b in _PERMUTACIONES
+    )
+
+
+def similitud(firma_a, firma_b):
+    """
+    Estima la similitud de Jaccard entre dos canciones a partir de sus firmas.
+
+    Returns:
+        float: Proporción de valores MinHash iguales (0 a 1)
+    """
+    iguales = sum(1 for a, b in zip(firma_a, firma_b) if a == b)
+    return iguales / len(firma_a)
+
+
+def _bandas(firma):
+    """Hash de cada banda de la firma (entero positivo de 31 bits)."""
+    return [
+        zlib.crc32(struct.pack(f"<{FILAS}I", *firma[i * FILAS : (i + 1) * FILAS]))
+        & 0x7FFFFFFF
+        for i in range(BANDAS)
+    ]
+
+
+def _leer_firma(datos):
+    return struct.unpack(_FORMATO, datos)
+
+
+def indexar(cancion):
+    """
+    Guarda la firma y las bandas de una canción en la transacción actual.
+
+    Args:
+        cancion (Cancion): Canción con ID asignado
+
+    Returns:
+        tuple: Firma de la canción
+    """
+    firma = calcular_firma(cancion.titulo, cancion.artista)
+    db.session.merge(
+        FirmaCancion(id_cancion=cancion.id, firma=struct.pack(_FORMATO, *firma))
+    )
+    BandaCancion.query.filter_by(id_cancion=cancion.id).delete(
+        synchronize_session=False
+    )
+    db.session.add_all(
+        BandaCancion(id_cancion=cancion.id, banda=banda, valor=valor)
+        for banda, valor in enumerate(_bandas(firma))
+    )
+    return firma
+
+
+def buscar_duplicados(cancion, umbral=None):
+    """
+    Busca las canciones que probablemente son duplicados de otra.
+
+    Solo se comparan las canciones que coinciden en alguna banda LSH, de modo
+    que el costo no depende del tamaño del catálogo.
+
+    Args:
+        cancion (Cancion): Canción de referencia
+        umbral (float, optional): Similitud mínima. Por defecto
+            `DUPLICADOS_UMBRAL` de la configuración.
+
+    Returns:
+        list: Pares (Cancion, similitud) ordenados de mayor a menor similitud
+    """
+    if umbral is None:
+        umbral = current_app.config.get("DUPLICADOS_UMBRAL", 0.9)
+    firma = calcular_firma(cancion.titulo, cancion.artista)
+
+    condicion = or_(
+        *(
+            and_(BandaCancion.banda == banda, BandaCancion.valor == valor)
+            for banda, valor in enumerate(_bandas(firma))
+        )
+    )
+    candidatas = (
+        db.session.query(FirmaCancion)
+        .filter(
+            FirmaCancion.id_cancion.in_(
+                db.session.query(BandaCancion.id_cancion).filter(condicion)
+            ),
+            FirmaCancion.id_cancion != cancion.id,
+        )
+        .all()
+    )
+    similares = {
+        candidata.id_cancion: valor
+        for candidata in candidatas
+        if (valor := similitud(firma, _leer_firma(candidata.firma))) >= umbral
+    }
+    if not similares:
+        return []
+    canciones = Cancion.query.filter(Cancion.id.in_(similares)).all()
+    return sorted(
+        ((c, similares[c.id]) for c in canciones),
+        key=lambda par: (-par[1], par[0].id),
+    )
+
+
+def indexar_pendientes():
+    """
+    Indexa por lotes las canciones que aún no tienen firma.
+
+    Returns:
+        int: Cantidad de canciones indexadas
+    """
+    total = 0
+    while True:
+        lote = (
+            Cancion.query.outerjoin(FirmaCancion, FirmaCancion.id_cancion == Cancion.id)
+            .filter(FirmaCancion.id_cancion.is_(None))
+            .order_by(Cancion.id)
+            .limit(TAMANO_LOTE)
+            .all()
+        )
+        if not lote:
+            return total
+        for cancion in lote:
+            indexar(cancion)
+        db.session.commit()
+        total += len(lote)
+
+
+def agrupar_duplicados(umbral=None):
+    """
+    Agrupa el catálogo en conjuntos de canciones probablemente duplicadas.
+
+    Solo se comparan las canciones que comparten alguna cubeta LSH. Las
+    cubetas con más de `DUPLICADOS_CUBETA_MAXIMA` canciones se ignoran: se
+    forman con valores de banda muy comunes (títulos genéricos) y compararlas
+    todas entre sí sería cuadrático; los duplicados reales coinciden además en
+    otras bandas. Dentro de cada cubeta, los pares que ya están en el mismo
+    grupo no se vuelven a comparar.
+
+    Args:
+        umbral (float, optional): Similitud mínima. Por defecto
+            `DUPLICADOS_UMBRAL` de la configuración.
+
+    Returns:
+        list: Listas de IDs de canción (de dos o más) ordenadas por ID
+    """
+    if umbral is None:
+        umbral = current_app.config.get("DUPLICADOS_UMBRAL", 0.9)
+    maximo = current_app.config.get("DUPLICADOS_CUBETA_MAXIMA", 100)
+
+    cubetas = (
+        db.session.query(BandaCancion.banda, BandaCancion.valor)
+        .group_by(BandaCancion.banda, BandaCancion.valor)
+        .having(func.count() > 1, func.count() <= maximo)
+        .subquery()
+    )
+    miembros = {}
+    for banda, valor, id_cancion in db.session.query(
+        BandaCancion.banda, BandaCancion.valor, BandaCancion.id_cancion
+    ).join(
+        cubetas,
+        and_(
+            BandaCancion.banda == cubetas.c.banda,
+            BandaCancion.valor == cubetas.c.valor,
+        ),
+    ):
+        miembros.setdefault((banda, valor), []).append(id_cancion)
+
+    ids = {id for grupo in miembros.values() for id in grupo}
+    firmas = {}
+    ids_ordenados = sorted(ids)
+    for inicio in range(0, len(ids_ordenados), TAMANO_LOTE):
+        lote = ids_ordenados[inicio : inicio + TAMANO_LOTE]
+        for f in FirmaCancion.query.filter(FirmaCancion.id_cancion.in_(lote)):
+            firmas[f.id_cancion] = _leer_firma(f.firma)
+
+    # Unión de conjuntos disjuntos sobre los pares que superan el umbral
+    padre = {}
+
+    def raiz(id):
+        while padre.setdefault(id, id) != id:
+            id = padre[id]
+        return id
+
+    for grupo in miembros.values():
+        grupo.sort()
+        for i, a in enumerate(grupo):
+            for b in grupo[i + 1 :]:
+                if raiz(a) != raiz(b) and similitud(firmas[a], firmas[b]) >= umbral:
+                    padre[raiz(b)] = raiz(a)
+
+    grupos = {}
+    for id in list(padre):
+        grupos.setdefault(raiz(id), set()).add(id)
+    return sorted(sorted(grupo) for grupo in grupos.values() if len(grupo) > 1)
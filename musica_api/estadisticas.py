@@ -0,0 +1,317 @@
+"""
+Módulo de estadísticas de la biblioteca de favoritos de cada usuario.
+
+En lugar de calcular las estadísticas con joins en cada petición, se
+mantienen filas agregadas en `EstadisticaUsuario` que se ajustan de forma
+incremental:
+
+- al marcar o desmarcar un favorito, con la contribución de la canción;
+- al editar una canción, con la diferencia entre su contribución anterior y
+  la nueva, para todos los usuarios que la tienen como favorita;
+- al eliminar una canción, restando su contribución.
+
+Los ajustes se hacen en SQL (upserts y sentencias que unen favoritos con
+canciones), sin traer a Python los favoritos de cada canción. Con sharding los
+favoritos viven en otras bases y no se pueden unir con las canciones: al
+editar o eliminar canciones se encola el trabajo `reconstruir_estadisticas`.
+
+Si los agregados se desvían (por ejemplo, por cambios hechos fuera de la API)
+se pueden reconstruir con `flask reconstruir-estadisticas`.
+"""
+
+from collections import Counter, defaultdict
+
+from sqlalchemy import String, cast, func, insert, literal, select
+from sqlalchemy.dialects import sqlite
+
+from utils import formatear_duracion
+
+from .extensions import db
+from .models import Cancion, EstadisticaUsuario, Favorito
+from .sharding import favoritos_shards
+
+TAMANO_LOTE = 500
+"""Cantidad de usuarios (o canciones) por sentencia al ajustar agregados."""
+
+ARTISTAS_PRINCIPALES = 5
+"""Cantidad de artistas que se muestran en las estadísticas."""
+
+_DIMENSIONES = {
+    "canciones": (literal(""), literal(1), ()),
+    "artista": (Cancion.artista, literal(1), ()),
+    "duracion": (literal(""), func.coalesce(Cancion.duracion, 0), ()),
+    "genero": (
+        func.coalesce(func.nullif(Cancion.genero, ""), "Sin género"),
+        literal(1),
+        (),
+    ),
+    "decada": (
+        cast(Cancion.año // 10 * 10, String).concat("s"),
+        literal(1),
+        (Cancion.año.isnot(None), Cancion.año != 0),
+    ),
+}
+"""Versión SQL de `contribucion`: dimensión -> (clave, cantidad, filtros)."""
+
+
+def contribucion(cancion):
+    """
+    Calcula lo que aporta una canción a las estadísticas de un usuario.
+
+    Args:
+        cancion (Cancion): Canción marcada como favorita
+
+    Returns:
+        Counter: (dimensión, clave) -> cantidad
+    """
+    aporte = Counter({("canciones", ""): 1, ("artista", cancion.artista): 1})
+    aporte[("duracion", "")] += cancion.duracion or 0
+    aporte[("genero", cancion.genero or "Sin género")] += 1
+    if cancion.año:
+        aporte[("decada", f"{cancion.año // 10 * 10}s")] += 1
+    return aporte
+
+
+def diferencia(antes, despues):
+    """
+    Calcula el ajuste necesario para pasar de una contribución a otra.
+
+    Returns:
+        dict: (dimensión, clave) -> cantidad a sumar (puede ser negativa)
+    """
+    claves = set(antes) | set(despues)
+    return {
+        clave: despues.get(clave, 0) - antes.get(clave, 0)
+        for clave in claves
+        if despues.get(clave, 0) != antes.get(clave, 0)
+    }
+
+
+def negar(aporte):
+    """Invierte el signo de una contribución."""
+    return {clave: -cantidad for clave, cantidad in aporte.items()}
+
+
+def _insertar_o_sumar(sentencia):
+    """Convierte un INSERT de agregados en un upsert que suma a la fila existente."""
+    return sentencia.on_conflict_do_update(
+        index_elements=["id_usuario", "dimension", "clave"],
+        set_={"total": EstadisticaUsuario.total + sentencia.excluded.total},
+    )
+
+
+def ajustar(ids_usuarios, cambios):
+    """
+    Suma los cambios a los agregados de varios usuarios con SQL por lotes.
+
+    Cada lote es un único upsert (`INSERT ... ON CONFLICT DO UPDATE`), así que
+    dos peticiones concurrentes no pueden insertar la misma fila. Los cambios
+    se añaden a la transacción actual de `db.session`; las filas que quedan en
+    cero se eliminan.
+
+    Args:
+        ids_usuarios (iterable): IDs de los usuarios afectados
+        cambios (dict): (dimensión, clave) -> cantidad a sumar
+    """
+    ids = sorted(set(ids_usuarios))
+    cambios = {clave: cantidad for clave, cantidad in cambios.items() if cantidad}
+    for inicio in range(0, len(ids), TAMANO_LOTE):
+        lote = ids[inicio : inicio + TAMANO_LOTE]
+        filas = [
+            {
+                "id_usuario": id_usuario,
+                "dimension": dimension,
+                "clave": clave,
+                "total": cantidad,
+            }
+            for id_usuario in lote
+            for (dimension, clave), cantidad in cambios.items()
+        ]
+        if not filas:
+            continue
+        db.session.execute(_insertar_o_sumar(sqlite.insert(EstadisticaUsuario)), filas)
+        db.session.query(EstadisticaUsuario).filter(
+            EstadisticaUsuario.id_usuario.in_(lote), EstadisticaUsuario.total <= 0
+        ).delete(synchronize_session=False)
+
+
+def sumar_favoritos(signo, *condiciones):
+    """
+    Suma (o resta) a sus usuarios las canciones de los favoritos indicados.
+
+    Se ejecuta una sentencia por dimensión que une los favoritos con sus
+    canciones y agrupa por usuario, sin traer filas a Python. Solo sirve para
+    favoritos de la base principal (sin sharding). Para restar, debe llamarse
+    antes de borrar los favoritos.
+
+    Args:
+        signo (int): 1 para sumar, -1 para restar
+        *condiciones: Filtros sobre `Favorito`
+    """
+    for dimension, (clave, cantidad, filtro) in _DIMENSIONES.items():
+        aportes = (
+            select(
+                Favorito.id_usuario,
+                literal(dimension),
+                clave,
+                signo * func.sum(cantidad),
+            )
+            .join(Cancion, Cancion.id == Favorito.id_cancion)
+            .where(*condiciones, *filtro)
+            .group_by(Favorito.id_usuario, clave)
+            .having(func.sum(cantidad) != 0)
+        )
+        db.session.execute(
+            _insertar_o_sumar(
+                sqlite.insert(EstadisticaUsuario).from_select(
+                    ["id_usuario", "dimension", "clave", "total"], aportes
+                )
+            )
+        )
+    if signo < 0:
+        usuarios = select(Favorito.id_usuario).where(*condiciones)
+        db.session.query(EstadisticaUsuario).filter(
+            EstadisticaUsuario.id_usuario.in_(usuarios), EstadisticaUsuario.total <= 0
+        ).delete(synchronize_session=False)
+
+
+def ajustar_favorito(id_usuario, id_cancion, signo):
+    """
+    Suma o resta un favorito a las estadísticas de su usuario.
+
+    Sin sharding, el favorito y la canción se unen en la misma sentencia; para
+    restar debe llamarse antes de borrar el favorito. Con sharding solo se
+    leen de la base principal las columnas que aportan a las estadísticas.
+
+    Args:
+        id_usuario (int): ID del usuario
+        id_cancion (int): ID de la canción
+        signo (int): 1 al marcar, -1 al desmarcar
+    """
+    if not favoritos_shards.activo:
+        sumar_favoritos(
+            signo, Favorito.id_usuario == id_usuario, Favorito.id_cancion == id_cancion
+        )
+        return
+    cancion = (
+        db.session.query(Cancion.artista, Cancion.duracion, Cancion.genero, Cancion.año)
+        .filter(Cancion.id == id_cancion)
+        .one()
+    )
+    aporte = contribucion(cancion)
+    ajustar([id_usuario], aporte if signo > 0 else negar(aporte))
+
+
+def descontar_canciones(ids_canciones):
+    """
+    Resta las canciones que se van a eliminar de las estadísticas de sus usuarios.
+
+    Debe llamarse antes de borrar las canciones, mientras sus favoritos existen.
+    Con sharding no hace nada: quien elimina encola `reconstruir_estadisticas`.
+
+    Args:
+        ids_canciones (list): IDs de las canciones
+    """
+    if favoritos_shards.activo:
+        return
+    for inicio in range(0, len(ids_canciones), TAMANO_LOTE):
+        lote = ids_canciones[inicio : inicio + TAMANO_LOTE]
+        sumar_favoritos(-1, Favorito.id_cancion.in_(lote))
+
+
+def reconstruir(id_usuario=None):
+    """
+    Recalcula los agregados a partir de los favoritos.
+
+    Sin sharding, los agregados se borran y se vuelven a sumar con
+    `sumar_favoritos` (una sentencia por dimensión). Con sharding se leen los
+    favoritos de cada partición y sus canciones se cargan por lotes.
+
+    Args:
+        id_usuario (int, optional): Reconstruir solo este usuario
+
+    Returns:
+        int: Cantidad de usuarios con estadísticas
+    """
+    query = db.session.query(EstadisticaUsuario)
+    if id_usuario is not None:
+        query = query.filter_by(id_usuario=id_usuario)
+
+    if not favoritos_shards.activo:
+        query.delete(synchronize_session=False)
+        condiciones = [] if id_usuario is None else [Favorito.id_usuario == id_usuario]
+        sumar_favoritos(1, *condiciones)
+        usuarios = query.with_entities(
+            func.count(EstadisticaUsuario.id_usuario.distinct())
+        ).scalar()
+        db.session.commit()
+        return usuarios
+
+    def consultar(sesion):
+        favoritos = sesion.query(Favorito.id_usuario, Favorito.id_cancion)
+        if id_usuario is not None:
+            favoritos = favoritos.filter_by(id_usuario=id_usuario)
+        return favoritos.all()
+
+    filas = [
+        fila for filas in favoritos_shards.en_paralelo(consultar) for fila in filas
+    ]
+    ids = sorted({id_cancion for _, id_cancion in filas})
+    canciones = {}
+    for inicio in range(0, len(ids), TAMANO_LOTE):
+        lote = db.session.query(
+            Cancion.id, Cancion.artista, Cancion.duracion, Cancion.genero, Cancion.año
+        ).filter(Cancion.id.in_(ids[inicio : inicio + TAMANO_LOTE]))
+        canciones.update((cancion.id, contribucion(cancion)) for cancion in lote)
+
+    agregados = defaultdict(Counter)
+    for usuario, id_cancion in filas:
+        if id_cancion in canciones:
+            agregados[usuario].update(canciones[id_cancion])
+
+    query.delete(synchronize_session=False)
+    filas = [
+        {"id_usuario": usuario, "dimension": dimension, "clave": clave, "total": total}
+        for usuario, aporte in agregados.items()
+        for (dimension, clave), total in aporte.items()
+        if total > 0
+    ]
+    if filas:
+        db.session.execute(insert(EstadisticaUsuario.__table__), filas)
+    db.session.commit()
+    return len(agregados)
+
+
+def resumen(usuario):
+    """
+    Arma las estadísticas de un usuario a partir de sus agregados.
+
+    Args:
+        usuario (Usuario): Usuario consultado
+
+    Returns:
+        dict: Datos para serializar con `estadisticas_model`
+    """
+    totales = defaultdict(dict)
+    for fila in EstadisticaUsuario.query.filter_by(id_usuario=usuario.id):
+        totales[fila.dimension][fila.clave] = fila.total
+
+    def distribucion(dimension, por_nombre=False):
+        orden = (
+            (lambda item: item[0]) if por_nombre else (lambda item: (-item[1], item[0]))
+        )
+        return [
+            {"nombre": nombre, "canciones": total}
+            for nombre, total in sorted(totales[dimension].items(), key=orden)
+        ]
+
+    segundos = totales["duracion"].get("", 0)
+    return {
+        "usuario": usuario,
+        "canciones": totales["canciones"].get("", 0),
+        "duracion_segundos": segundos,
+        "duracion_total": formatear_duracion(segundos),
+        "generos": distribucion("genero"),
+        "decadas": distribucion("decada", por_nombre=True),
+        "artistas_principales": distribucion("artista")[:ARTISTAS_PRINCIPALES],
+    }
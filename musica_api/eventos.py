@@ -0,0 +1,257 @@
+"""
+Módulo de captura de cambios (change data capture) de catálogo y favoritos.
+
+Cada alta, modificación o baja de `Usuario`, `Cancion` o `Favorito` que pasa
+por una sesión de SQLAlchemy queda registrada en la tabla `Evento`. Para la
+base principal el evento se inserta en la misma transacción que el cambio, de
+modo que solo se publican cambios confirmados. Los favoritos guardados en una
+partición (ver `sharding`) se registran en la base principal tras confirmar la
+transacción de la partición.
+
+Los consumidores leen el registro por secuencia (`Evento.id`) y solo reciben
+los cambios posteriores al último evento que procesaron.
+
+Los favoritos que se borran sin pasar por la sesión (en cascada al eliminar un
+usuario o una canción, o con `DELETE` masivos) se registran antes del borrado
+con `registrar_bajas_favoritos`, con una sola sentencia `INSERT ... SELECT`.
+"""
+
+import json
+import threading
+import time
+
+from flask import has_app_context
+from sqlalchemy import event, func, insert, literal, select
+from sqlalchemy.orm import Session
+
+from .extensions import db
+from .models import Usuario, Cancion, Favorito, Evento
+from .sharding import favoritos_shards
+
+ESPERA_MAXIMA = 30
+"""Segundos máximos que una petición puede esperar nuevos eventos."""
+
+INTERVALO_SONDEO = 0.5
+"""Segundos entre lecturas de la tabla mientras se esperan eventos de otros procesos."""
+
+_nuevos_eventos = threading.Condition()
+"""Condición notificada cuando este proceso confirma nuevos eventos."""
+
+_lock_publicacion = threading.Lock()
+"""Serializa la escritura de los eventos de las particiones en la base principal."""
+
+_tablas = {Usuario: "usuario", Cancion: "cancion", Favorito: "favorito"}
+
+
+def _fila_evento(instancia, operacion):
+    """
+    Construye la fila de `Evento` que describe el cambio de una instancia.
+
+    Args:
+        instancia (db.Model): Usuario, canción o favorito modificado
+        operacion (str): crear, actualizar o eliminar
+
+    Returns:
+        dict: Valores para insertar en la tabla de eventos
+    """
+    datos = {
+        atributo.key: getattr(instancia, atributo.key)
+        for atributo in instancia.__mapper__.column_attrs
+    }
+    if isinstance(instancia, Favorito):
+        datos["id"] = favoritos_shards.id_global(instancia)
+    return {
+        "tabla": _tablas[type(instancia)],
+        "operacion": operacion,
+        "id_registro": datos["id"],
+        "datos": json.dumps(datos, default=str),
+    }
+
+
+@event.listens_for(Session, "after_flush")
+def _capturar_cambios(session, flush_context):
+    """Registra los cambios de la sesión en la tabla de eventos."""
+    if not has_app_context():
+        return
+
+    # Las altas se registran de padres a hijos y las bajas de hijos a padres,
+    # igual que el orden en que las aplica la base de datos
+    orden = list(_tablas)
+    filas = []
+    for instancia in sorted(
+        (i for i in session.new if type(i) in _tablas),
+        key=lambda i: (orden.index(type(i)), i.id),
+    ):
+        filas.append(_fila_evento(instancia, "crear"))
+    for instancia in session.dirty:
+        if type(instancia) in _tablas and session.is_modified(
+            instancia, include_collections=False
+        ):
+            filas.append(_fila_evento(instancia, "actualizar"))
+    for instancia in sorted(
+        (i for i in session.deleted if type(i) in _tablas),
+        key=lambda i: (-orden.index(type(i)), i.id),
+    ):
+        filas.append(_fila_evento(instancia, "eliminar"))
+    if not filas:
+        return
+
+    # La sesión puede estar ligada al engine o a una conexión suya
+    if session.get_bind().engine is db.engine:
+        # Misma transacción que el cambio: el evento se confirma o revierte con él
+        session.connection().execute(insert(Evento.__table__), filas)
+        session.info["eventos_nuevos"] = True
+    else:
+        session.info.setdefault("eventos_pendientes", []).extend(filas)
+
+
+@event.listens_for(Session, "after_commit")
+def _publicar_cambios(session):
+    """Escribe los eventos de particiones y despierta a los consumidores en espera."""
+    pendientes = session.info.pop("eventos_pendientes", None)
+    nuevos = session.info.pop("eventos_nuevos", False)
+    if pendientes and has_app_context():
+        # Las particiones se confirman en paralelo (`en_paralelo`): sus
+        # eventos se escriben de a uno en la base principal
+        with _lock_publicacion, db.engine.begin() as conexion:
+            conexion.execute(insert(Evento.__table__), pendientes)
+    if pendientes or nuevos:
+        with _nuevos_eventos:
+            _nuevos_eventos.notify_all()
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_cambios(session):
+    """Descarta los eventos de una transacción revertida."""
+    session.info.pop("eventos_pendientes", None)
+    session.info.pop("eventos_nuevos", None)
+
+
+def registrar_bajas(tabla, ids):
+    """
+    Registra la baja de varios registros eliminados con SQL masivo.
+
+    Los borrados masivos no pasan por las instancias de la sesión, así que sus
+    eventos se insertan explícitamente en la transacción actual de `db.session`.
+
+    Args:
+        tabla (str): Tabla afectada (usuario o cancion)
+        ids (list): IDs eliminados
+    """
+    if not ids:
+        return
+    db.session.execute(
+        insert(Evento.__table__),
+        [
+            {
+                "tabla": tabla,
+                "operacion": "eliminar",
+                "id_registro": id,
+                "datos": json.dumps({"id": id}),
+            }
+            for id in ids
+        ],
+    )
+    db.session.info["eventos_nuevos"] = True
+
+
+def registrar_bajas_favoritos(sesion, *condiciones):
+    """
+    Registra la baja de los favoritos que se van a borrar en cascada o en masa.
+
+    Debe llamarse antes del borrado. En la base principal los eventos se
+    insertan con un único `INSERT ... SELECT` en la transacción de la sesión,
+    sin traer los favoritos a Python. En una partición se leen sus favoritos y
+    los eventos se publican al confirmar la sesión de la partición.
+
+    Args:
+        sesion (Session): Sesión donde viven los favoritos
+        *condiciones: Filtros sobre `Favorito`
+    """
+    if sesion.get_bind().engine is db.engine:
+        datos = func.json_object(
+            "id",
+            Favorito.id,
+            "id_usuario",
+            Favorito.id_usuario,
+            "id_cancion",
+            Favorito.id_cancion,
+            "fecha_marcado",
+            Favorito.fecha_marcado,
+        )
+        bajas = (
+            select(literal("favorito"), literal("eliminar"), Favorito.id, datos)
+            .where(*condiciones)
+            .order_by(Favorito.id)
+        )
+        sesion.execute(
+            insert(Evento.__table__).from_select(
+                ["tabla", "operacion", "id_registro", "datos"], bajas
+            )
+        )
+        sesion.info["eventos_nuevos"] = True
+    else:
+        sesion.info.setdefault("eventos_pendientes", []).extend(
+            _fila_evento(favorito, "eliminar")
+            for favorito in sesion.query(Favorito).filter(*condiciones)
+        )
+
+
+def leer_eventos(desde, limite):
+    """
+    Lee los eventos posteriores a una secuencia.
+
+    Args:
+        desde (int): Última secuencia procesada por el consumidor
+        limite (int): Número máximo de eventos a devolver
+
+    Returns:
+        list: Eventos ordenados por secuencia
+    """
+    return (
+        Evento.query.filter(Evento.id > desde).order_by(Evento.id).limit(limite).all()
+    )
+
+
+def esperar_eventos(desde, limite, espera):
+    """
+    Lee los eventos posteriores a una secuencia, esperando si todavía no hay.
+
+    Args:
+        desde (int): Última secuencia procesada por el consumidor
+        limite (int): Número máximo de eventos a devolver
+        espera (float): Segundos a esperar como máximo (long-poll)
+
+    Returns:
+        list: Eventos ordenados por secuencia (vacía si venció la espera)
+    """
+    vencimiento = time.monotonic() + min(espera, ESPERA_MAXIMA)
+    while True:
+        eventos = leer_eventos(desde, limite)
+        restante = vencimiento - time.monotonic()
+        if eventos or restante <= 0:
+            return eventos
+        # Terminar la transacción de lectura para ver los cambios de otros procesos
+        db.session.rollback()
+        with _nuevos_eventos:
+            _nuevos_eventos.wait(min(restante, INTERVALO_SONDEO))
+
+
+def serializar_evento(evento):
+    """
+    Convierte un evento en un diccionario apto para JSON.
+
+    Args:
+        evento (Evento): Evento leído del registro
+
+    Returns:
+        dict: Evento con los datos del registro ya decodificados
+    """
+    return {
+        "id": evento.id,
+        "tabla": evento.tabla,
+        "operacion": evento.operacion,
+        "id_registro": evento.id_registro,
+        "datos": json.loads(evento.datos) if evento.datos else None,
+        "fecha": evento.fecha.isoformat() if evento.fecha else None,
+    }
@@ -7,6 +7,7 @@ a lo largo del proyecto, tales como la API RESTful y el ORM para la base de dato
 
 from flask_sqlalchemy import SQLAlchemy
 from flask_restx import Api
+from sqlalchemy.schema import CreateIndex, CreateTable
 
 api = Api(
     title="API de Música",
@@ -29,3 +30,117 @@ db = SQLAlchemy()
 Actualmente no está inicializada con la aplicación Flask.
 Se requiere configuración adicional para vincularla.
 """
+
+
+def activar_claves_foraneas(dbapi_connection, connection_record):
+    """Activa las claves foráneas (y ON DELETE CASCADE) en cada conexión SQLite.
+
+    SQLite las tiene desactivadas por defecto. Se registra como evento
+    `connect` del motor principal en `create_app`.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def tablas_sin_cascada(engine):
+    """
+    Busca las tablas de la base principal a las que les falta el
+    ON DELETE CASCADE que declaran los modelos.
+
+    `create_all` no modifica las tablas existentes, así que una base creada
+    antes de declarar las cascadas las conserva sin ellas. Con las claves
+    foráneas activas, borrar un usuario o una canción con favoritos fallaría.
+
+    Args:
+        engine (Engine): Motor SQLite de la base principal
+
+    Returns:
+        list: Nombres de las tablas que hay que reconstruir
+    """
+    faltan = []
+    with engine.connect() as conexion:
+        for tabla in db.metadata.sorted_tables:
+            esperadas = {
+                fk.parent.name
+                for fk in tabla.foreign_keys
+                if (fk.ondelete or "").upper() == "CASCADE"
+            }
+            if not esperadas:
+                continue
+            filas = conexion.exec_driver_sql(
+                f'PRAGMA foreign_key_list("{tabla.name}")'
+            ).mappings()
+            en_base = {f["from"] for f in filas if f["on_delete"].upper() == "CASCADE"}
+            if esperadas - en_base:
+                faltan.append(tabla.name)
+    return faltan
+
+
+def _reconstruir_tabla(conexion, tabla):
+    """Recrea una tabla con el esquema del modelo y copia sus filas."""
+    preparador = conexion.dialect.identifier_preparer
+    nombre = preparador.format_table(tabla)
+    nueva = preparador.quote(f"{tabla.name}_nueva")
+    ddl = str(CreateTable(tabla).compile(dialect=conexion.dialect))
+    conexion.exec_driver_sql(
+        ddl.replace(f"CREATE TABLE {nombre}", f"CREATE TABLE {nueva}", 1)
+    )
+
+    existentes = {
+        fila[1] for fila in conexion.exec_driver_sql(f"PRAGMA table_info({nombre})")
+    }
+    columnas = ", ".join(
+        preparador.quote(c.name) for c in tabla.columns if c.name in existentes
+    )
+    conexion.exec_driver_sql(
+        f"INSERT INTO {nueva} ({columnas}) SELECT {columnas} FROM {nombre}"
+    )
+    conexion.exec_driver_sql(f"DROP TABLE {nombre}")
+    conexion.exec_driver_sql(f"ALTER TABLE {nueva} RENAME TO {nombre}")
+    for indice in tabla.indexes:
+        conexion.execute(CreateIndex(indice))
+
+
+def reconstruir_cascadas(engine):
+    """
+    Reconstruye las tablas SQLite a las que les falta ON DELETE CASCADE.
+
+    SQLite no permite cambiar una clave foránea con ALTER TABLE: se sigue el
+    procedimiento de su documentación (claves foráneas desactivadas, tabla
+    nueva, copia, borrado y renombre) en una sola transacción. Las filas que
+    apuntan a filas ya borradas (posibles mientras las claves foráneas
+    estaban desactivadas) se eliminan, como lo habría hecho la cascada.
+
+    Args:
+        engine (Engine): Motor SQLite de la base principal
+
+    Returns:
+        tuple: Tablas reconstruidas y cantidad de filas huérfanas eliminadas
+    """
+    tablas = tablas_sin_cascada(engine)
+    if not tablas:
+        return [], 0
+
+    with engine.connect() as conexion:
+        sqlite = conexion.connection.driver_connection
+        nivel = sqlite.isolation_level
+        # Transacción explícita: pysqlite no debe abrir ni confirmar la suya
+        sqlite.isolation_level = None
+        conexion.exec_driver_sql("PRAGMA foreign_keys=OFF")
+        try:
+            conexion.exec_driver_sql("BEGIN")
+            for nombre in tablas:
+                _reconstruir_tabla(conexion, db.metadata.tables[nombre])
+            huerfanas = conexion.exec_driver_sql("PRAGMA foreign_key_check").all()
+            for tabla, rowid, _, _ in huerfanas:
+                conexion.exec_driver_sql(
+                    f'DELETE FROM "{tabla}" WHERE rowid = ?', (rowid,)
+                )
+            conexion.exec_driver_sql("COMMIT")
+        except Exception:
+            conexion.exec_driver_sql("ROLLBACK")
+            raise
+        finally:
+            sqlite.isolation_level = nivel
+    return tablas, len(huerfanas)
@@ -0,0 +1,433 @@
+"""
+Módulo de instantánea de las canciones más consultadas (arranque en caliente).
+
+Un proceso recién iniciado tiene vacía la caché de páginas de SQLite, y las
+primeras peticiones a `/api/canciones/<id>` tras un despliegue son lentas.
+`flask instantanea` escribe las canciones más populares en un archivo binario
+que cada proceso mapea en memoria (`mmap`) al arrancar. Todos los procesos de
+la máquina comparten las mismas páginas del archivo y las búsquedas por ID no
+copian el índice.
+
+Formato (little-endian):
+
+- Cabecera (`_CABECERA`): firma, versión del formato, cantidad de canciones,
+  versión de los datos (último `Evento.id` al escribir), huella de la base
+  (fecha de ese evento) y fecha de generación.
+- Índice: IDs ordenados (`uint32`) y, en el mismo orden, el desplazamiento
+  de cada registro (`uint32`). Se buscan por bisección sobre el `mmap`.
+- Registros: duración, año y fecha de creación (`_FIJOS`), seguidos de
+  título, artista, álbum y género (longitud `uint16` y UTF-8). Los nulos se
+  guardan como `_NULO_*`.
+
+Con `INSTANTANEA_REVISION = 0` (el valor por defecto) la instantánea no sirve
+datos desactualizados: en cada lectura se consulta el último `Evento.id` (una
+búsqueda por el índice de la clave primaria) y, si hay eventos nuevos, se leen
+las canciones modificadas o eliminadas, que pasan a consultarse en la base.
+Con un valor mayor, la revisión se hace como mucho cada esos segundos y los
+cambios de otros procesos pueden tardar ese tiempo en verse; los cambios del
+propio proceso se descartan siempre de inmediato.
+
+Si el evento de la versión no existe o su fecha no coincide con la huella (la
+instantánea es de otra base), no se usa. Una base sin eventos no tiene con qué
+fecharse, así que no se escriben ni se usan instantáneas de versión 0.
+"""
+
+import bisect
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from .extensions import db
+from .models import Cancion, Evento, Favorito
+from .sharding import favoritos_shards
+
+FIRMA = b"MUSICAPI"
+"""Primeros bytes de todo archivo de instantánea."""
+
+FORMATO = 1
+"""Versión del formato del archivo."""
+
+TAMANO_LOTE = 500
+"""Canciones por consulta al escribir la instantánea."""
+
+_CABECERA = struct.Struct("<8sIIQqd")
+_FIJOS = struct.Struct("<iiq")
+_LONGITUD = struct.Struct("<H")
+_NULO_ENTERO = -(1 << 31)
+_NULO_FECHA = -(1 << 63)
+_NULO_TEXTO = 0xFFFF
+_EPOCA = datetime(1970, 1, 1)
+_TEXTOS = ("titulo", "artista", "album", "genero")
+
+
+def _codificar(cancion):
+    """Empaqueta una canción como registro de la instantánea."""
+    fecha = (
+        (cancion.fecha_creacion - _EPOCA) // timedelta(microseconds=1)
+        if cancion.fecha_creacion
+        else _NULO_FECHA
+    )
+    partes = [
+        _FIJOS.pack(
+            _NULO_ENTERO if cancion.duracion is None else cancion.duracion,
+            _NULO_ENTERO if cancion.año is None else cancion.año,
+            fecha,
+        )
+    ]
+    for campo in _TEXTOS:
+        valor = getattr(cancion, campo)
+        if valor is None:
+            partes.append(_LONGITUD.pack(_NULO_TEXTO))
+        else:
+            datos = valor.encode()
+            partes.append(_LONGITUD.pack(len(datos)) + datos)
+    return b"".join(partes)
+
+
+def _decodificar(datos, posicion, id):
+    """Lee el registro que empieza en `posicion` como diccionario de columnas."""
+    duracion, año, fecha = _FIJOS.unpack_from(datos, posicion)
+    cancion = {
+        "id": id,
+        "duracion": None if duracion == _NULO_ENTERO else duracion,
+        "año": None if año == _NULO_ENTERO else año,
+        "fecha_creacion": (
+            None if fecha == _NULO_FECHA else _EPOCA + timedelta(microseconds=fecha)
+        ),
+    }
+    posicion += _FIJOS.size
+    for campo in _TEXTOS:
+        (longitud,) = _LONGITUD.unpack_from(datos, posicion)
+        posicion += _LONGITUD.size
+        if longitud == _NULO_TEXTO:
+            cancion[campo] = None
+        else:
+            cancion[campo] = str(datos[posicion : posicion + longitud], "utf-8")
+            posicion += longitud
+    return cancion
+
+
+def _huella(version):
+    """Fecha del evento `version` en microsegundos (0 si no existe)."""
+    fecha = db.session.query(Evento.fecha).filter_by(id=version).scalar()
+    return (fecha - _EPOCA) // timedelta(microseconds=1) if fecha else 0
+
+
+def ruta_archivo(app):
+    """
+    Obtiene la ruta de la instantánea de una aplicación.
+
+    Args:
+        app (Flask): Aplicación cuya configuración define `INSTANTANEA_RUTA`
+            (relativa a la carpeta instance)
+
+    Returns:
+        str: Ruta absoluta del archivo
+    """
+    return os.path.join(
+        app.instance_path, app.config.get("INSTANTANEA_RUTA", "instantanea.bin")
+    )
+
+
+def canciones_populares(limite):
+    """
+    Elige las canciones que entran en la instantánea.
+
+    Args:
+        limite (int): Cantidad máxima de canciones
+
+    Returns:
+        list: IDs de las canciones con más favoritos (en todas las particiones),
+            completados con las más recientes
+    """
+
+    def contar(sesion):
+        return (
+            sesion.query(Favorito.id_cancion, func.count(Favorito.id))
+            .group_by(Favorito.id_cancion)
+            .all()
+        )
+
+    conteo = Counter()
+    for filas in favoritos_shards.en_paralelo(contar):
+        for id_cancion, total in filas:
+            conteo[id_cancion] += total
+
+    ids = [id for (id,) in db.session.query(Cancion.id)]
+    ids.sort(key=lambda id: (-conteo[id], -id))
+    return ids[:limite]
+
+
+def escribir(ruta, limite):
+    """
+    Escribe la instantánea de las canciones más populares.
+
+    El archivo se escribe aparte y se reemplaza de forma atómica, así que los
+    procesos que ya mapearon la versión anterior la siguen leyendo sin errores.
+
+    Args:
+        ruta (str): Ruta del archivo
+        limite (int): Cantidad máxima de canciones
+
+    Returns:
+        dict: Cantidad de canciones, versión y bytes escritos
+
+    Raises:
+        ValueError: Si la base no tiene eventos con los que fechar la instantánea
+    """
+    # La versión se lee antes que las canciones: un cambio posterior a la
+    # lectura tendrá un evento mayor y la invalidará
+    version = db.session.query(func.max(Evento.id)).scalar() or 0
+    if not version:
+        raise ValueError(
+            "La base no tiene eventos registrados: no se puede fechar la instantánea"
+        )
+    huella = _huella(version)
+    ids = sorted(canciones_populares(limite))
+
+    registros = {}
+    for inicio in range(0, len(ids), TAMANO_LOTE):
+        lote = ids[inicio : inicio + TAMANO_LOTE]
+        for cancion in Cancion.query.filter(Cancion.id.in_(lote)):
+            registros[cancion.id] = _codificar(cancion)
+    ids = [id for id in ids if id in registros]
+
+    desplazamientos, posicion = [], 0
+    for id in ids:
+        desplazamientos.append(posicion)
+        posicion += len(registros[id])
+
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, "wb") as archivo:
+        archivo.write(
+            _CABECERA.pack(FIRMA, FORMATO, len(ids), version, huella, time.time())
+        )
+        archivo.write(struct.pack(f"<{len(ids)}I", *ids))
+        archivo.write(struct.pack(f"<{len(ids)}I", *desplazamientos))
+        for id in ids:
+            archivo.write(registros[id])
+        total = archivo.tell()
+    os.replace(temporal, ruta)
+    return {"canciones": len(ids), "version": version, "bytes": total}
+
+
+class Mapa:
+    """
+    Instantánea mapeada en memoria, de solo lectura.
+
+    Args:
+        ruta (str): Ruta del archivo
+
+    Raises:
+        ValueError: Si el archivo no es una instantánea de este formato o no
+            tiene versión
+    """
+
+    def __init__(self, ruta):
+        with open(ruta, "rb") as archivo:
+            self._mmap = mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < _CABECERA.size:
+            raise ValueError(f"Instantánea truncada: {ruta}")
+        (firma, formato, cantidad, self.version, self.huella, self.generada) = (
+            _CABECERA.unpack_from(self._mmap)
+        )
+        if firma != FIRMA or formato != FORMATO:
+            raise ValueError(f"Formato de instantánea desconocido: {ruta}")
+        if not self.version:
+            raise ValueError(f"Instantánea sin versión: {ruta}")
+        if hasattr(self._mmap, "madvise"):
+            # Pedir al sistema que lea el archivo ya, no en la primera petición
+            self._mmap.madvise(mmap.MADV_WILLNEED)
+
+        inicio = _CABECERA.size
+        if len(self._mmap) < inicio + 8 * cantidad:
+            raise ValueError(f"Instantánea truncada: {ruta}")
+        vista = memoryview(self._mmap)
+        self._ids = vista[inicio : inicio + 4 * cantidad].cast("I")
+        self._desplazamientos = vista[
+            inicio + 4 * cantidad : inicio + 8 * cantidad
+        ].cast("I")
+        self._registros = vista[inicio + 8 * cantidad :]
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, id):
+        posicion = bisect.bisect_left(self._ids, id)
+        return posicion < len(self._ids) and self._ids[posicion] == id
+
+    def cancion(self, id):
+        """
+        Busca una canción por su ID.
+
+        Args:
+            id (int): ID de la canción
+
+        Returns:
+            dict: Columnas de la canción, o None si no está en la instantánea
+        """
+        posicion = bisect.bisect_left(self._ids, id)
+        if posicion == len(self._ids) or self._ids[posicion] != id:
+            return None
+        return _decodificar(self._registros, self._desplazamientos[posicion], id)
+
+    @property
+    def bytes(self):
+        """int: Tamaño del archivo mapeado."""
+        return len(self._mmap)
+
+
+class Instantanea:
+    """
+    Extensión que sirve lecturas de canciones desde la instantánea mapeada.
+    """
+
+    def init_app(self, app):
+        """
+        Mapea la instantánea de la aplicación, si el archivo existe.
+
+        Args:
+            app (Flask): Aplicación a la que se asocia la instantánea.
+        """
+        ruta = ruta_archivo(app)
+        mapa = None
+        if os.path.exists(ruta):
+            try:
+                mapa = Mapa(ruta)
+            except (OSError, ValueError) as e:
+                app.logger.warning("No se usa la instantánea %s: %s", ruta, e)
+        app.extensions["instantanea"] = {
+            "ruta": ruta,
+            "mapa": mapa,
+            "vigente": mapa is not None,
+            "ultimo_evento": mapa.version if mapa else 0,
+            "revisada": None,
+            "invalidadas": set(),
+            "aciertos": 0,
+            "fallos": 0,
+            "lock": threading.Lock(),
+        }
+
+    @property
+    def _estado(self):
+        return current_app.extensions["instantanea"]
+
+    def _revisar(self, estado):
+        """Lee del registro de cambios las canciones modificadas desde la versión."""
+        intervalo = current_app.config.get("INSTANTANEA_REVISION", 0)
+        ahora = time.monotonic()
+        if estado["revisada"] is not None and ahora - estado["revisada"] < intervalo:
+            return
+        maximo = db.session.query(func.max(Evento.id)).scalar() or 0
+        mapa = estado["mapa"]
+        if estado["revisada"] is None and (
+            maximo < mapa.version or _huella(mapa.version) != mapa.huella
+        ):
+            current_app.logger.warning(
+                "La instantánea %s no corresponde a esta base; se ignora",
+                estado["ruta"],
+            )
+            estado["vigente"] = False
+            return
+        modificadas = []
+        if maximo > estado["ultimo_evento"]:
+            # Solo importan las canciones de la instantánea: las altas y las
+            # que no están se consultan siempre en la base
+            modificadas = [
+                id
+                for (id,) in db.session.query(Evento.id_registro).filter(
+                    Evento.id > estado["ultimo_evento"],
+                    Evento.id <= maximo,
+                    Evento.tabla == "cancion",
+                )
+                if id in mapa
+            ]
+        with estado["lock"]:
+            estado["invalidadas"].update(modificadas)
+            estado["ultimo_evento"] = max(estado["ultimo_evento"], maximo)
+            estado["revisada"] = ahora
+
+    def cancion(self, id):
+        """
+        Obtiene una canción de la instantánea si sus datos siguen vigentes.
+
+        Args:
+            id (int): ID de la canción
+
+        Returns:
+            dict: Columnas de la canción, o None si hay que consultar la base
+        """
+        estado = self._estado
+        if not estado["vigente"]:
+            return None
+        self._revisar(estado)
+        cancion = None
+        if estado["vigente"] and id not in estado["invalidadas"]:
+            cancion = estado["mapa"].cancion(id)
+        with estado["lock"]:
+            estado["aciertos" if cancion else "fallos"] += 1
+        return cancion
+
+    def descartar(self, ids):
+        """
+        Deja de servir canciones desde la instantánea (cambiadas en este proceso).
+
+        Args:
+            ids (iterable): IDs de las canciones
+        """
+        estado = self._estado
+        mapa = estado["mapa"]
+        if mapa is None:
+            return
+        with estado["lock"]:
+            estado["invalidadas"].update(id for id in ids if id in mapa)
+
+    def metricas(self):
+        """
+        Obtiene el estado y el uso de la instantánea.
+
+        Returns:
+            dict: Ruta, vigencia, versión, tamaño y aciertos de la instantánea
+        """
+        estado = self._estado
+        mapa = estado["mapa"]
+        return {
+            "ruta": estado["ruta"],
+            "activa": estado["vigente"],
+            "version": mapa.version if mapa else None,
+            "generada": datetime.utcfromtimestamp(mapa.generada) if mapa else None,
+            "canciones": len(mapa) if mapa else 0,
+            "bytes": mapa.bytes if mapa else 0,
+            "invalidadas": len(estado["invalidadas"]),
+            "aciertos": estado["aciertos"],
+            "fallos": estado["fallos"],
+        }
+
+
+instantanea = Instantanea()
+"""Instancia de Instantanea usada por los recursos de la API."""
+
+
+@event.listens_for(Session, "after_flush")
+def _descartar_cambios(session, flush_context):
+    """Deja de servir desde la instantánea las canciones editadas o eliminadas."""
+    if not has_app_context() or "instantanea" not in current_app.extensions:
+        return
+    ids = [
+        instancia.id for instancia in session.deleted if isinstance(instancia, Cancion)
+    ] + [
+        instancia.id
+        for instancia in session.dirty
+        if isinstance(instancia, Cancion)
+        and session.is_modified(instancia, include_collections=False)
+    ]
+    if ids:
+        instantanea.descartar(ids)
@@ -17,9 +17,13 @@ class Usuario(db.Model):
     correo = db.Column(db.String(100), unique=True, nullable=False)
     fecha_registro = db.Column(db.DateTime, default=datetime.utcnow)
 
-    # Relación con favoritos
+    # Relación con favoritos. La base de datos los borra en cascada
+    # (ON DELETE CASCADE), así que el ORM no los carga al eliminar el usuario.
     favoritos = db.relationship(
-        "Favorito", back_populates="usuario", cascade="all, delete-orphan"
+        "Favorito",
+        back_populates="usuario",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
     )
 
     def __repr__(self):
@@ -40,9 +44,12 @@ class Cancion(db.Model):
     genero = db.Column(db.String(50))
     fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
 
-    # Relación con favoritos
+    # Relación con favoritos (borrado en cascada por la base de datos)
     favoritos = db.relationship(
-        "Favorito", back_populates="cancion", cascade="all, delete-orphan"
+        "Favorito",
+        back_populates="cancion",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
     )
 
     def __repr__(self):
@@ -55,8 +62,12 @@ class Favorito(db.Model):
     """
 
     id = db.Column(db.Integer, primary_key=True)
-    id_usuario = db.Column(db.Integer, db.ForeignKey("usuario.id"), nullable=False)
-    id_cancion = db.Column(db.Integer, db.ForeignKey("cancion.id"), nullable=False)
+    id_usuario = db.Column(
+        db.Integer, db.ForeignKey("usuario.id", ondelete="CASCADE"), nullable=False
+    )
+    id_cancion = db.Column(
+        db.Integer, db.ForeignKey("cancion.id", ondelete="CASCADE"), nullable=False
+    )
     fecha_marcado = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Relaciones
@@ -70,3 +81,190 @@ class Favorito(db.Model):
 
     def __repr__(self):
         return f"<Favorito: Usuario {self.id_usuario} - Canción {self.id_cancion}>"
+
+
+class Playlist(db.Model):
+    """
+    Modelo para representar una lista ordenada de canciones de un usuario.
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    id_usuario = db.Column(
+        db.Integer, db.ForeignKey("usuario.id", ondelete="CASCADE"), nullable=False
+    )
+    nombre = db.Column(db.String(100), nullable=False)
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    # Cambia con cada rebalanceo: las claves calculadas antes ya no sirven
+    version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+    __table_args__ = (db.Index("ix_playlist_usuario", "id_usuario", "id"),)
+
+    def __repr__(self):
+        return f"<Playlist {self.nombre}>"
+
+
+class PlaylistItem(db.Model):
+    """
+    Modelo para una canción dentro de una playlist.
+
+    El orden lo da `rango`, una clave que se compara en orden lexicográfico
+    (ver `playlists`); una misma canción puede aparecer varias veces.
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    id_playlist = db.Column(
+        db.Integer, db.ForeignKey("playlist.id", ondelete="CASCADE"), nullable=False
+    )
+    id_cancion = db.Column(
+        db.Integer, db.ForeignKey("cancion.id", ondelete="CASCADE"), nullable=False
+    )
+    # Se ordena byte a byte: requiere una intercalación binaria (la de SQLite)
+    rango = db.Column(db.String(64), nullable=False)
+    fecha_agregado = db.Column(db.DateTime, default=datetime.utcnow)
+
+    cancion = db.relationship("Cancion")
+
+    __table_args__ = (
+        db.UniqueConstraint("id_playlist", "rango", name="uq_playlist_rango"),
+    )
+
+    def __repr__(self):
+        return f"<PlaylistItem {self.id_playlist}:{self.rango}>"
+
+
+class EstadisticaUsuario(db.Model):
+    """
+    Modelo para los agregados de la biblioteca de favoritos de un usuario.
+
+    Cada fila acumula un total por dimensión y clave, por ejemplo
+    ("genero", "Rock") -> 12 canciones o ("duracion", "") -> 3600 segundos.
+    Se mantienen al marcar o desmarcar favoritos y al editar canciones.
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    id_usuario = db.Column(
+        db.Integer, db.ForeignKey("usuario.id", ondelete="CASCADE"), nullable=False
+    )
+    dimension = db.Column(db.String(20), nullable=False)  # canciones, duracion, ...
+    clave = db.Column(db.String(100), nullable=False, default="")
+    total = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "id_usuario", "dimension", "clave", name="uq_estadistica_usuario"
+        ),
+    )
+
+    def __repr__(self):
+        return f"<EstadisticaUsuario {self.id_usuario} {self.dimension}:{self.clave}>"
+
+
+class FirmaCancion(db.Model):
+    """
+    Modelo para la firma MinHash del título y artista de una canción.
+
+    La firma completa se usa para estimar la similitud entre dos canciones;
+    sus bandas se guardan en `BandaCancion` para encontrar candidatas sin
+    comparar contra todo el catálogo.
+    """
+
+    id_cancion = db.Column(
+        db.Integer, db.ForeignKey("cancion.id", ondelete="CASCADE"), primary_key=True
+    )
+    firma = db.Column(db.LargeBinary, nullable=False)  # Valores MinHash (uint32)
+
+    def __repr__(self):
+        return f"<FirmaCancion {self.id_cancion}>"
+
+
+class BandaCancion(db.Model):
+    """
+    Modelo para las bandas LSH de la firma de una canción.
+
+    Dos canciones con el mismo `valor` en la misma `banda` son candidatas a
+    estar duplicadas.
+    """
+
+    id_cancion = db.Column(
+        db.Integer, db.ForeignKey("cancion.id", ondelete="CASCADE"), primary_key=True
+    )
+    banda = db.Column(db.Integer, primary_key=True)
+    valor = db.Column(db.Integer, nullable=False)  # Hash de las filas de la banda
+
+    __table_args__ = (db.Index("ix_banda_cancion_valor", "banda", "valor"),)
+
+    def __repr__(self):
+        return f"<BandaCancion {self.id_cancion} {self.banda}:{self.valor}>"
+
+
+class Evento(db.Model):
+    """
+    Modelo para el registro de cambios (change feed) de catálogo y favoritos.
+
+    Es una tabla de solo inserción: cada alta, modificación o baja de un
+    usuario, canción o favorito añade una fila. El `id` autoincremental es la
+    secuencia que usan los consumidores para reanudar la lectura.
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    tabla = db.Column(db.String(50), nullable=False)
+    operacion = db.Column(db.String(20), nullable=False)  # crear, actualizar, eliminar
+    id_registro = db.Column(db.Integer, nullable=False)
+    datos = db.Column(db.Text)  # Estado del registro serializado en JSON
+    fecha = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<Evento {self.id}: {self.operacion} {self.tabla} {self.id_registro}>"
+
+
+class Trabajo(db.Model):
+    """
+    Modelo para un trabajo de la cola en segundo plano.
+
+    Se guarda en su propia base SQLite (bind `trabajos`) para que las escrituras
+    de la cola no compitan con las de la base principal.
+    """
+
+    __bind_key__ = "trabajos"
+
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False)
+    argumentos = db.Column(db.Text, nullable=False, default="{}")  # JSON
+    estado = db.Column(
+        db.String(20), nullable=False, default="pendiente"
+    )  # pendiente, en_curso, completado, fallido
+    intentos = db.Column(db.Integer, nullable=False, default=0)
+    max_intentos = db.Column(db.Integer, nullable=False, default=3)
+    resultado = db.Column(db.Text)  # JSON
+    error = db.Column(db.Text)
+    trabajador = db.Column(db.String(50))
+    disponible_desde = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_inicio = db.Column(db.DateTime)
+    fecha_fin = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index("ix_trabajo_estado", "estado", "disponible_desde", "id"),
+    )
+
+    def __repr__(self):
+        return f"<Trabajo {self.id}: {self.tipo} ({self.estado})>"
+
+
+class TrabajoAplicado(db.Model):
+    """
+    Modelo que marca, en la base principal, los trabajos cuyos cambios ya se
+    confirmaron.
+
+    La marca se confirma en la misma transacción que los cambios de la tarea:
+    si el trabajador muere antes de dar el trabajo por completado, el
+    reintento encuentra la marca y no repite la tarea.
+    """
+
+    # ID del trabajo y su fecha de creación, por si la base de la cola se recrea
+    clave = db.Column(db.String(64), primary_key=True)
+    resultado = db.Column(db.Text)  # JSON
+    fecha = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<TrabajoAplicado {self.clave}>"
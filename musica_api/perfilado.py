@@ -0,0 +1,279 @@
+"""
+Módulo de perfilado estadístico de peticiones.
+
+Es opcional: solo se activa con `PERFILADO_ACTIVO` y un `PERFILADO_TOKEN` no
+vacío. Entonces se perfila una fracción de las peticiones
+(`PERFILADO_FRACCION`) y todas las que traen la cabecera `PERFILADO_CABECERA`
+(por defecto `X-Perfilar`) junto con el token en `X-Perfilado-Token`.
+
+Mientras hay peticiones perfiladas, un hilo despierta cada
+`PERFILADO_INTERVALO` segundos, toma la pila de cada hilo perfilado con
+`sys._current_frames()` y la suma a las pilas de su ruta. Las peticiones no
+perfiladas no pagan ningún costo y, sin peticiones perfiladas, el hilo queda
+en espera.
+
+Las pilas acumuladas se exportan en formato collapsed (una línea
+`marco;marco;marco cantidad` por pila, el que usan flamegraph.pl e
+inferno) o como archivo de speedscope, con un perfil por ruta.
+
+Un recurso puede excluirse definiendo el atributo de clase `perfilar = False`.
+"""
+
+import hmac
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, request
+
+ESQUEMA_SPEEDSCOPE = "https://www.speedscope.app/file-format-schema.json"
+"""Esquema del formato de archivo de speedscope."""
+
+PROFUNDIDAD_MAXIMA = 200
+"""Marcos que se conservan de cada pila (los más cercanos a la raíz)."""
+
+
+def _marco(frame):
+    """Identifica un marco por módulo, función, archivo y línea de inicio."""
+    codigo = frame.f_code
+    modulo = frame.f_globals.get("__name__", "?")
+    # co_qualname existe desde Python 3.11
+    nombre = getattr(codigo, "co_qualname", codigo.co_name)
+    return (f"{modulo}:{nombre}", codigo.co_filename, codigo.co_firstlineno)
+
+
+def _pila(frame):
+    """Pila de un hilo, de la raíz al marco actual."""
+    marcos = []
+    while frame is not None:
+        marcos.append(_marco(frame))
+        frame = frame.f_back
+    marcos.reverse()
+    return tuple(marcos[:PROFUNDIDAD_MAXIMA])
+
+
+class Perfilador:
+    """
+    Muestreador de pilas de los hilos que atienden peticiones perfiladas.
+
+    Args:
+        intervalo (float): Segundos entre muestras
+    """
+
+    def __init__(self, intervalo):
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._activos = {}  # id del hilo -> ruta
+        self._pilas = {}  # ruta -> Counter de pilas
+        self._peticiones = Counter()
+        self._hay_activos = threading.Event()
+        self._hilo = None
+        self.errores = 0
+
+    def iniciar(self, ruta):
+        """
+        Empieza a muestrear el hilo actual y atribuye sus muestras a `ruta`.
+
+        Args:
+            ruta (str): Ruta de la petición, p. ej. "GET /api/canciones"
+        """
+        with self._lock:
+            self._activos[threading.get_ident()] = ruta
+            self._peticiones[ruta] += 1
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._muestrear, daemon=True)
+                self._hilo.start()
+        self._hay_activos.set()
+
+    def terminar(self):
+        """Deja de muestrear el hilo actual."""
+        with self._lock:
+            self._activos.pop(threading.get_ident(), None)
+            if not self._activos:
+                self._hay_activos.clear()
+
+    def _muestrear(self):
+        while True:
+            self._hay_activos.wait()
+            time.sleep(self.intervalo)
+            try:
+                self._tomar_muestra()
+            except Exception:
+                # Una muestra fallida no debe detener el hilo muestreador
+                self.errores += 1
+
+    def _tomar_muestra(self):
+        """Suma la pila actual de cada hilo perfilado a las de su ruta."""
+        frames = sys._current_frames()
+        with self._lock:
+            for hilo, ruta in self._activos.items():
+                frame = frames.get(hilo)
+                if frame is not None:
+                    self._pilas.setdefault(ruta, Counter())[_pila(frame)] += 1
+
+    def reiniciar(self):
+        """Descarta las muestras acumuladas."""
+        with self._lock:
+            self._pilas.clear()
+            self._peticiones.clear()
+
+    def resumen(self):
+        """
+        Obtiene las rutas perfiladas.
+
+        Returns:
+            list: Diccionarios con la ruta, peticiones y muestras, de más a
+                menos muestras
+        """
+        with self._lock:
+            filas = [
+                {
+                    "ruta": ruta,
+                    "peticiones": peticiones,
+                    "muestras": sum(self._pilas.get(ruta, {}).values()),
+                }
+                for ruta, peticiones in self._peticiones.items()
+            ]
+        return sorted(filas, key=lambda fila: (-fila["muestras"], fila["ruta"]))
+
+    def pilas(self, ruta=None):
+        """
+        Obtiene una copia de las pilas acumuladas.
+
+        Args:
+            ruta (str, optional): Solo las pilas de esta ruta
+
+        Returns:
+            dict: Ruta -> Counter de pilas
+        """
+        with self._lock:
+            return {
+                r: Counter(pilas)
+                for r, pilas in self._pilas.items()
+                if ruta is None or r == ruta
+            }
+
+    def collapsed(self, ruta=None):
+        """
+        Exporta las pilas en formato collapsed.
+
+        Cada línea empieza con la ruta como marco raíz, de modo que un único
+        flame graph muestra todas las rutas.
+
+        Args:
+            ruta (str, optional): Solo las pilas de esta ruta
+
+        Returns:
+            str: Una línea `ruta;marco;...;marco muestras` por pila
+        """
+        lineas = []
+        for r, pilas in sorted(self.pilas(ruta).items()):
+            for pila, muestras in pilas.most_common():
+                marcos = ";".join(nombre for nombre, _, _ in pila)
+                lineas.append(f"{r};{marcos} {muestras}")
+        return "\n".join(lineas) + ("\n" if lineas else "")
+
+    def speedscope(self, ruta=None):
+        """
+        Exporta las pilas como archivo de speedscope, con un perfil por ruta.
+
+        Args:
+            ruta (str, optional): Solo las pilas de esta ruta
+
+        Returns:
+            dict: Documento JSON del formato de archivo de speedscope
+        """
+        indices = {}
+        marcos = []
+        perfiles = []
+        peso = self.intervalo * 1000
+        for r, pilas in sorted(self.pilas(ruta).items()):
+            muestras, pesos = [], []
+            for pila, cantidad in pilas.most_common():
+                fila = []
+                for marco in pila:
+                    if marco not in indices:
+                        indices[marco] = len(marcos)
+                        nombre, archivo, linea = marco
+                        marcos.append({"name": nombre, "file": archivo, "line": linea})
+                    fila.append(indices[marco])
+                muestras.append(fila)
+                pesos.append(cantidad * peso)
+            perfiles.append(
+                {
+                    "type": "sampled",
+                    "name": r,
+                    "unit": "milliseconds",
+                    "startValue": 0,
+                    "endValue": sum(pesos),
+                    "samples": muestras,
+                    "weights": pesos,
+                }
+            )
+        return {
+            "$schema": ESQUEMA_SPEEDSCOPE,
+            "name": "musica_api",
+            "exporter": "musica_api.perfilado",
+            "shared": {"frames": marcos},
+            "profiles": perfiles,
+        }
+
+
+def _debe_perfilar(fraccion, cabecera, token):
+    """Decide si se perfila la petición actual."""
+    vista = current_app.view_functions.get(request.endpoint)
+    if vista is None or not getattr(
+        getattr(vista, "view_class", None), "perfilar", True
+    ):
+        return False
+    if request.headers.get(cabecera) and token_valido(token):
+        return True
+    return random.random() < fraccion
+
+
+def token_valido(token):
+    """
+    Indica si la petición actual trae el token de perfilado.
+
+    Args:
+        token (str): Token configurado en `PERFILADO_TOKEN`.
+
+    Returns:
+        bool: True si la cabecera `X-Perfilado-Token` coincide con el token
+    """
+    recibido = request.headers.get("X-Perfilado-Token", "")
+    return bool(token) and hmac.compare_digest(recibido, token)
+
+
+def init_app(app):
+    """
+    Activa el perfilado de peticiones si `PERFILADO_ACTIVO` es verdadero.
+
+    Sin `PERFILADO_TOKEN` el perfilado no se activa: los endpoints de
+    administración y la cabecera que fuerza el perfilado quedarían abiertos.
+
+    Args:
+        app (Flask): Aplicación a perfilar.
+    """
+    if not app.config.get("PERFILADO_ACTIVO"):
+        return
+    token = app.config.get("PERFILADO_TOKEN")
+    if not token:
+        app.logger.warning("No se activa el perfilado: falta PERFILADO_TOKEN")
+        return
+
+    perfilador = Perfilador(app.config.get("PERFILADO_INTERVALO", 0.005))
+    app.extensions["perfilado"] = perfilador
+    fraccion = app.config.get("PERFILADO_FRACCION", 0.01)
+    cabecera = app.config.get("PERFILADO_CABECERA", "X-Perfilar")
+
+    @app.before_request
+    def iniciar_perfilado():
+        if _debe_perfilar(fraccion, cabecera, token):
+            perfilador.iniciar(f"{request.method} {request.url_rule.rule}")
+
+    @app.teardown_request
+    def terminar_perfilado(exc):
+        perfilador.terminar()
@@ -0,0 +1,195 @@
+"""
+Módulo de claves de orden (rangos) de las playlists.
+
+El orden de las canciones de una playlist no se guarda como posición entera,
+que obligaría a renumerar O(n) filas en cada inserción o movimiento, sino como
+una clave de texto (`PlaylistItem.rango`) que se compara en orden
+lexicográfico. Para insertar o mover una canción entre otras dos basta con
+calcular una clave entre las de sus vecinas con `rango_entre`, así que cada
+operación modifica una sola fila.
+
+Las claves usan los dígitos `0-9A-Za-z`, cuyo orden ASCII coincide con su
+valor, y nunca terminan en `0`, de modo que siempre existe una clave entre dos
+claves distintas. Las inserciones repetidas en el mismo hueco alargan las
+claves; cuando una supera `PLAYLIST_RANGO_MAXIMO` caracteres, la playlist se
+rebalancea en segundo plano con claves cortas y equidistantes.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from sqlalchemy import update
+
+from .extensions import db
+from .models import Playlist, PlaylistItem
+
+DIGITOS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+"""Dígitos de las claves, en orden ASCII."""
+
+_BASE = len(DIGITOS)
+
+
+def rango_entre(antes=None, despues=None):
+    """
+    Calcula una clave estrictamente entre otras dos.
+
+    Args:
+        antes (str, optional): Clave anterior (None: inicio de la playlist)
+        despues (str, optional): Clave siguiente (None: final de la playlist)
+
+    Returns:
+        str: Clave mayor que `antes` y menor que `despues`
+
+    Raises:
+        ValueError: Si `antes` no es menor que `despues`
+    """
+    antes = antes or ""
+    if despues is not None and antes >= despues:
+        raise ValueError(f"Claves fuera de orden: {antes!r} >= {despues!r}")
+
+    prefijo = ""
+    if despues is not None:
+        # Prefijo común (completando `antes` con ceros)
+        n = 0
+        while (antes[n] if n < len(antes) else "0") == despues[n]:
+            n += 1
+        prefijo, antes, despues = despues[:n], antes[n:], despues[n:]
+
+    digito_antes = DIGITOS.index(antes[0]) if antes else 0
+    digito_despues = DIGITOS.index(despues[0]) if despues is not None else _BASE
+    if digito_despues - digito_antes > 1:
+        return prefijo + DIGITOS[(digito_antes + digito_despues) // 2]
+    if despues is not None and len(despues) > 1:
+        return prefijo + despues[0]
+    return prefijo + DIGITOS[digito_antes] + rango_entre(antes[1:], None)
+
+
+def rangos_uniformes(cantidad):
+    """
+    Genera claves cortas y equidistantes para rebalancear una playlist.
+
+    Args:
+        cantidad (int): Cantidad de claves
+
+    Returns:
+        list: Claves en orden creciente, todas de la misma longitud como máximo
+    """
+    longitud = 1
+    while _BASE**longitud < (cantidad + 1) * _BASE:
+        longitud += 1
+    paso = _BASE**longitud // (cantidad + 1)
+
+    rangos = []
+    for i in range(1, cantidad + 1):
+        valor, digitos = i * paso, []
+        for _ in range(longitud):
+            valor, resto = divmod(valor, _BASE)
+            digitos.append(DIGITOS[resto])
+        rangos.append("".join(reversed(digitos)).rstrip("0"))
+    return rangos
+
+
+def rebalancear(id_playlist):
+    """
+    Reasigna claves cortas y equidistantes a todas las canciones de una playlist.
+
+    Lo primero que hace es incrementar `Playlist.version`, con lo que toma el
+    bloqueo de escritura antes de leer las claves. Las inserciones y
+    movimientos comprueban la versión en su misma transacción y se reintentan
+    si cambió, así que una clave calculada con las claves anteriores nunca se
+    confirma entre las nuevas.
+
+    Args:
+        id_playlist (int): ID de la playlist
+
+    Returns:
+        int: Cantidad de canciones rebalanceadas
+    """
+    actualizadas = db.session.execute(
+        update(Playlist)
+        .where(Playlist.id == id_playlist)
+        .values(version=Playlist.version + 1)
+    ).rowcount
+    if not actualizadas:
+        db.session.rollback()
+        return 0
+    items = (
+        PlaylistItem.query.filter_by(id_playlist=id_playlist)
+        .order_by(PlaylistItem.rango)
+        .all()
+    )
+    # Dos pasadas para no violar la unicidad de (playlist, rango) a mitad de camino
+    for item in items:
+        item.rango = f"~{item.id}"
+    db.session.flush()
+    for item, rango in zip(items, rangos_uniformes(len(items))):
+        item.rango = rango
+    db.session.commit()
+    return len(items)
+
+
+class Rebalanceador:
+    """
+    Ejecuta los rebalanceos de playlists en un hilo en segundo plano.
+
+    Un rebalanceo ya programado para una playlist no se vuelve a programar
+    hasta que termina.
+    """
+
+    def init_app(self, app):
+        """
+        Crea el ejecutor de rebalanceos de la aplicación.
+
+        Args:
+            app (Flask): Aplicación a la que se asocia el ejecutor.
+        """
+        app.extensions["playlists"] = {
+            "ejecutor": ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="rebalanceo"
+            ),
+            "pendientes": {},
+            "lock": threading.Lock(),
+        }
+
+    def necesita(self, rango):
+        """Indica si una clave es lo bastante larga como para rebalancear."""
+        return len(rango) > current_app.config.get("PLAYLIST_RANGO_MAXIMO", 12)
+
+    def programar(self, id_playlist):
+        """
+        Programa el rebalanceo de una playlist.
+
+        Args:
+            id_playlist (int): ID de la playlist
+
+        Returns:
+            Future: Rebalanceo en curso o programado
+        """
+        app = current_app._get_current_object()
+        estado = app.extensions["playlists"]
+
+        def ejecutar():
+            try:
+                with app.app_context():
+                    return rebalancear(id_playlist)
+            finally:
+                with estado["lock"]:
+                    estado["pendientes"].pop(id_playlist, None)
+
+        with estado["lock"]:
+            if id_playlist not in estado["pendientes"]:
+                estado["pendientes"][id_playlist] = estado["ejecutor"].submit(ejecutar)
+            return estado["pendientes"][id_playlist]
+
+    def esperar(self):
+        """Espera a que terminen los rebalanceos programados."""
+        estado = current_app.extensions["playlists"]
+        with estado["lock"]:
+            futuros = list(estado["pendientes"].values())
+        for futuro in futuros:
+            futuro.result()
+
+
+rebalanceador = Rebalanceador()
+"""Instancia de Rebalanceador usada por los recursos de la API."""
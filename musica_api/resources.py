@@ -3,24 +3,326 @@ Módulo de recursos de la API.
 Define los endpoints, controladores y la lógica de negocio de la API.
 """
 
-from flask import request
-from flask_restx import Resource, Namespace
+import json
+from collections import Counter
+from functools import wraps
+from flask import Response, current_app, g, request, stream_with_context
+from flask_restx import Resource, Namespace, marshal
+from flask_restx.utils import unpack
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, load_only
 from .api_models import (
     usuario_model,
     usuario_base,
     cancion_model,
     cancion_base,
+    cancion_popular_model,
+    cancion_creada_model,
+    duplicado_model,
+    metrica_cache_model,
+    metrica_instantanea_model,
+    metrica_coalescencia_model,
+    ruta_perfilada_model,
+    playlist_input,
+    playlist_model,
+    playlists_pagina_model,
+    playlist_posicion_input,
+    playlist_item_input,
+    playlist_item_model,
+    playlist_items_pagina_model,
+    eventos_model,
+    canciones_eliminar_input,
+    usuarios_eliminar_input,
+    eliminacion_model,
+    estadisticas_model,
+    estadisticas_reconstruir_input,
+    canciones_importar_input,
+    trabajo_model,
+    trabajo_aceptado_model,
     favorito_model,
     favorito_input,
     favoritos_usuario_model,
     mensaje_model,
 )
 from .extensions import db
-from .models import Usuario, Cancion, Favorito
+from .models import Usuario, Cancion, Favorito, Playlist, PlaylistItem, Trabajo
+from .sharding import favoritos_shards
+from .cache import anotar_bajas, cache_identidad
+from .eventos import (
+    esperar_eventos,
+    registrar_bajas,
+    registrar_bajas_favoritos,
+    serializar_evento,
+)
+from .tendencias import VENTANAS, tendencias
+from .playlists import rango_entre, rebalanceador
+from .instantanea import instantanea
+from . import duplicados, estadisticas, perfilado, trabajos
 
 # Namespace para agrupar los recursos de la API
 ns = Namespace("api", description="Operaciones de la API de música")
 
+# Cantidad de IDs por sentencia en las eliminaciones en lote
+TAMANO_LOTE = 500
+
+# Tamaño máximo de página en la paginación por cursor
+LIMITE_PAGINA_MAXIMO = 100
+
+# Intentos de calcular y guardar una clave de orden que chocó con otra escritura
+INTENTOS_RANGO = 5
+
+
+def _campos_solicitados(modelo):
+    """
+    Lee el parámetro `fields` (p. ej. `?fields=id,titulo`) de la petición.
+
+    Args:
+        modelo (Model): Modelo de API cuyos campos se pueden seleccionar
+
+    Returns:
+        list: Campos solicitados, o None si no se indicó el parámetro
+    """
+    if "campos" not in g:
+        valor = request.args.get("fields")
+        g.campos = [c.strip() for c in valor.split(",") if c.strip()] if valor else None
+        desconocidos = [c for c in g.campos or [] if c not in modelo.resolved]
+        if desconocidos:
+            ns.abort(400, f"Campos desconocidos: {', '.join(desconocidos)}")
+    return g.campos
+
+
+def _solo_campos(query, clase, modelo):
+    """
+    Restringe las columnas que carga una consulta a los campos solicitados.
+
+    Args:
+        query (Query): Consulta sobre `clase`
+        clase (type): Modelo SQLAlchemy consultado
+        modelo (Model): Modelo de API de la respuesta
+
+    Returns:
+        Query: Consulta con `load_only` si se indicó `fields`
+    """
+    campos = _campos_solicitados(modelo)
+    if not campos:
+        return query
+    return query.options(load_only(*[getattr(clase, campo) for campo in campos]))
+
+
+MASCARA_DOC = {
+    "in": "header",
+    "type": "string",
+    "format": "mask",
+    "description": "Máscara de campos opcional (si no se usa `fields`)",
+}
+"""Documentación de la cabecera de máscara que respeta `_marshal_campos`."""
+
+
+def _marshal_campos(modelo, as_list=False):
+    """
+    Igual que `ns.marshal_with`, pero recorta la respuesta a los campos del
+    parámetro `fields` usando las máscaras de Flask-RESTX.
+
+    Args:
+        modelo (Model): Modelo de API de la respuesta
+        as_list (bool): Indica que la respuesta es una lista (documentación)
+
+    Returns:
+        function: Decorador que documenta el modelo y el parámetro `fields`
+    """
+
+    def decorador(funcion):
+        @ns.response(200, "Success", [modelo] if as_list else modelo)
+        @ns.doc(params={"X-Fields": MASCARA_DOC})
+        @ns.param("fields", "Campos a devolver separados por comas (p. ej. id,titulo)")
+        @wraps(funcion)
+        def wrapper(*args, **kwargs):
+            datos, codigo, cabeceras = unpack(funcion(*args, **kwargs))
+            campos = _campos_solicitados(modelo)
+            if campos:
+                mascara = "{" + ",".join(campos) + "}"
+            else:
+                mascara = request.headers.get(current_app.config["RESTX_MASK_HEADER"])
+            return marshal(datos, modelo, mask=mascara), codigo, cabeceras
+
+        return wrapper
+
+    return decorador
+
+
+def _eliminar_en_lote(clase, query, columna_favorito):
+    """
+    Elimina con SQL masivo las filas que devuelve una consulta.
+
+    Los favoritos de la base principal los borra la propia base de datos
+    (ON DELETE CASCADE); los de las particiones se borran en paralelo.
+
+    Args:
+        clase (type): `Usuario` o `Cancion`
+        query (Query): Consulta que selecciona las filas a eliminar
+        columna_favorito (Column): Columna de `Favorito` que referencia a `clase`
+
+    Returns:
+        int: Cantidad de filas eliminadas
+    """
+    ids = [id for (id,) in query.with_entities(clase.id)]
+    lotes = [ids[i : i + TAMANO_LOTE] for i in range(0, len(ids), TAMANO_LOTE)]
+
+    try:
+        if clase is Cancion:
+            estadisticas.descontar_canciones(ids)
+        for lote in lotes:
+            if not favoritos_shards.activo:
+                registrar_bajas_favoritos(db.session, columna_favorito.in_(lote))
+            clase.query.filter(clase.id.in_(lote)).delete(synchronize_session=False)
+        registrar_bajas(clase.__tablename__, ids)
+        anotar_bajas(clase, ids)
+        if clase is Cancion:
+            instantanea.descartar(ids)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        ns.abort(400, f"Error al eliminar en lote: {str(e)}")
+
+    if favoritos_shards.activo and ids:
+
+        def eliminar(sesion):
+            for lote in lotes:
+                registrar_bajas_favoritos(sesion, columna_favorito.in_(lote))
+                sesion.query(Favorito).filter(columna_favorito.in_(lote)).delete(
+                    synchronize_session=False
+                )
+            sesion.commit()
+
+        favoritos_shards.en_paralelo(eliminar)
+        if clase is Cancion:
+            trabajos.encolar("reconstruir_estadisticas")
+    return len(ids)
+
+
+def _confirmar(sesion, id_usuario, id_cancion, signo):
+    """
+    Confirma la base principal y la partición de un favorito.
+
+    Las estadísticas de usuario viven en la base principal, así que con
+    sharding un mismo cambio toca dos sesiones. Se confirma primero la base
+    principal: si después falla la partición, el favorito no cambia y se
+    devuelve a las estadísticas lo que se les había sumado o restado.
+
+    Args:
+        sesion (Session): Sesión de la partición del favorito
+        id_usuario (int): ID del usuario del favorito
+        id_cancion (int): ID de la canción del favorito
+        signo (int): 1 si se marcó el favorito, -1 si se desmarcó
+    """
+    db.session.commit()
+    if sesion is db.session:
+        return
+    try:
+        sesion.commit()
+    except Exception:
+        sesion.rollback()
+        estadisticas.ajustar_favorito(id_usuario, id_cancion, -signo)
+        db.session.commit()
+        raise
+
+
+def _fila_inexistente(error):
+    """
+    Indica si un error de integridad se debe a una clave foránea rota.
+
+    La caché de identidad puede dar por existente una fila borrada por otro
+    proceso hasta su próxima revisión; entonces la base rechaza la escritura.
+
+    Args:
+        error (Exception): Error capturado al confirmar
+
+    Returns:
+        bool: True si la fila referenciada ya no existe
+    """
+    return isinstance(error, IntegrityError) and "FOREIGN KEY" in str(error.orig)
+
+
+def _revertir(sesion):
+    """Revierte la partición de un favorito y la base principal."""
+    sesion.rollback()
+    if sesion is not db.session:
+        db.session.rollback()
+
+
+def _prefiere_asincrono():
+    """Indica si la petición pide respuesta asíncrona (`Prefer: respond-async`)."""
+    preferencias = request.headers.get("Prefer", "")
+    return "respond-async" in [p.strip() for p in preferencias.split(",")]
+
+
+def _trabajo_aceptado(tipo, **argumentos):
+    """
+    Encola un trabajo y prepara la respuesta 202 que lo anuncia.
+
+    Args:
+        tipo (str): Tipo de trabajo
+        **argumentos: Argumentos de la tarea
+
+    Returns:
+        tuple: Datos del trabajo, 202 y cabecera `Location` con su URL
+    """
+    try:
+        trabajo = trabajos.encolar(tipo, **argumentos)
+    except Exception as e:
+        db.session.rollback()
+        ns.abort(400, f"Error al encolar el trabajo: {str(e)}")
+    url = f"{request.script_root}{ns.path}/trabajos/{trabajo.id}"
+    return (
+        {"id_trabajo": trabajo.id, "estado": trabajo.estado, "url": url},
+        202,
+        {"Location": url},
+    )
+
+
+def _duplicado_respuesta(cancion, similitud):
+    """
+    Prepara una canción duplicada para serializarla con `duplicado_model`.
+
+    Args:
+        cancion (Cancion): Canción similar
+        similitud (float): Similitud estimada
+
+    Returns:
+        dict: Datos básicos de la canción y su similitud
+    """
+    return {
+        "id": cancion.id,
+        "titulo": cancion.titulo,
+        "artista": cancion.artista,
+        "similitud": similitud,
+    }
+
+
+def _favorito_respuesta(favorito):
+    """
+    Prepara un favorito para serializarlo con `favorito_model`.
+
+    El favorito puede venir de una partición distinta a la base principal, por lo
+    que el usuario y la canción se cargan desde `db.session` y el ID se expone
+    en su forma global.
+
+    Args:
+        favorito (Favorito): Favorito cargado desde su partición
+
+    Returns:
+        dict: Datos del favorito con el usuario y la canción anidados
+    """
+    return {
+        "id": favoritos_shards.id_global(favorito),
+        "id_usuario": favorito.id_usuario,
+        "id_cancion": favorito.id_cancion,
+        "fecha_marcado": favorito.fecha_marcado,
+        "usuario": db.session.get(Usuario, favorito.id_usuario),
+        "cancion": db.session.get(Cancion, favorito.id_cancion),
+    }
+
 
 # Recurso para probar la API
 @ns.route("/ping")
@@ -74,10 +376,11 @@ def get(self):
 @ns.response(404, "Usuario no encontrado")
 class UsuarioAPI(Resource):
     @ns.doc("Obtener un usuario por su ID")
-    @ns.marshal_with(usuario_model)
+    @_marshal_campos(usuario_model)
     def get(self, id):
         """Obtiene un usuario por su ID"""
-        return Usuario.query.get_or_404(id), 200
+        query = _solo_campos(Usuario.query, Usuario, usuario_model)
+        return query.filter_by(id=id).first_or_404(), 200
 
     @ns.doc("Actualizar un usuario")
     @ns.expect(usuario_base)
@@ -101,19 +404,42 @@ class UsuarioAPI(Resource):
             db.session.rollback()
             ns.abort(400, f"Error al actualizar usuario: {str(e)}")
 
-    @ns.doc("Eliminar un usuario")
+    @ns.doc(
+        "Eliminar un usuario",
+        params={
+            "Prefer": {
+                "in": "header",
+                "description": "respond-async para eliminarlo en segundo plano",
+            }
+        },
+    )
     @ns.response(204, "Usuario eliminado con éxito")
+    @ns.response(202, "Eliminación encolada", trabajo_aceptado_model)
     def delete(self, id):
-        """Elimina un usuario existente"""
+        """Elimina un usuario existente (en segundo plano con Prefer: respond-async)"""
         usuario = Usuario.query.get_or_404(id)
+        # Con muchos favoritos el borrado en cascada es lento: se delega a un
+        # trabajador que los borra por lotes
+        if _prefiere_asincrono():
+            return _trabajo_aceptado("eliminar_usuario", id_usuario=id)
         try:
+            if not favoritos_shards.activo:
+                registrar_bajas_favoritos(db.session, Favorito.id_usuario == id)
             db.session.delete(usuario)
             db.session.commit()
-            return {}, 204
         except Exception as e:
             db.session.rollback()
             ns.abort(400, f"Error al eliminar usuario: {str(e)}")
 
+        # Con sharding los favoritos no están en la base principal y el
+        # cascade del ORM no los alcanza: se borran en su partición.
+        if favoritos_shards.activo:
+            sesion = favoritos_shards.sesion_usuario(id)
+            registrar_bajas_favoritos(sesion, Favorito.id_usuario == id)
+            sesion.query(Favorito).filter_by(id_usuario=id).delete()
+            sesion.commit()
+        return {}, 204
+
 
 # Recursos para Canciones
 @ns.route("/canciones")
@@ -122,23 +448,22 @@ class CancionListAPI(Resource):
     @ns.param("page", "Número de página (por defecto 1)")
     @ns.param("per_page", "Cantidad por página (por defecto 4)")
     @ns.response(200, "Lista de canciones obtenida con éxito")
-    @ns.marshal_list_with(cancion_model)
+    @_marshal_campos(cancion_model, as_list=True)
     def get(self):
         """Obtiene todas las canciones registradas (paginadas)"""
         page = int(request.args.get("page", 1))
         per_page = int(request.args.get("per_page", 4))
 
-        canciones = Cancion.query.paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        query = _solo_campos(Cancion.query, Cancion, cancion_model)
+        canciones = query.paginate(page=page, per_page=per_page, error_out=False)
         return canciones.items, 200
 
     @ns.doc("Crear una nueva canción")
     @ns.expect(cancion_base)
     @ns.response(201, "Canción creada con éxito")
-    @ns.marshal_with(cancion_model)
+    @ns.marshal_with(cancion_creada_model)
     def post(self):
-        """Crea una nueva canción"""
+        """Crea una nueva canción y señala sus posibles duplicados"""
         data = request.json
 
         cancion = Cancion(
@@ -152,22 +477,57 @@ class CancionListAPI(Resource):
 
         try:
             db.session.add(cancion)
+            db.session.flush()
+            posibles = duplicados.buscar_duplicados(cancion)
+            duplicados.indexar(cancion)
             db.session.commit()
-            return cancion, 201
         except Exception as e:
             db.session.rollback()
             ns.abort(400, f"Error al crear canción: {str(e)}")
 
+        respuesta = {c.key: getattr(cancion, c.key) for c in Cancion.__table__.columns}
+        respuesta["posibles_duplicados"] = [
+            _duplicado_respuesta(otra, valor) for otra, valor in posibles
+        ]
+        return respuesta, 201
+
+
+@ns.route("/canciones/importar")
+class CancionImportarAPI(Resource):
+    @ns.doc("Importar un catálogo de canciones en segundo plano")
+    @ns.expect(canciones_importar_input)
+    @ns.response(202, "Importación encolada")
+    @ns.response(400, "No se indicaron canciones")
+    @ns.marshal_with(trabajo_aceptado_model, code=202)
+    def post(self):
+        """Encola la creación de un lote de canciones"""
+        canciones = (request.json or {}).get("canciones")
+        if not canciones:
+            ns.abort(400, "Indique al menos una canción")
+        faltantes = [
+            i
+            for i, c in enumerate(canciones)
+            if not c.get("titulo") or not c.get("artista")
+        ]
+        if faltantes:
+            ns.abort(400, f"Canciones sin título o artista: {faltantes}")
+        return _trabajo_aceptado("importar_canciones", canciones=canciones)
+
 
 @ns.route("/canciones/<int:id>")
 @ns.param("id", "Identificador único de la canción")
 @ns.response(404, "Canción no encontrada")
 class CancionAPI(Resource):
     @ns.doc("Obtener una canción por su ID")
-    @ns.marshal_with(cancion_model)
+    @_marshal_campos(cancion_model)
     def get(self, id):
         """Obtiene una canción por su ID"""
-        return Cancion.query.get_or_404(id), 200
+        # Las canciones populares se leen de la instantánea mapeada en memoria
+        cancion = instantanea.cancion(id)
+        if cancion is not None:
+            return cancion, 200
+        query = _solo_campos(Cancion.query, Cancion, cancion_model)
+        return query.filter_by(id=id).first_or_404(), 200
 
     @ns.doc("Actualizar una canción")
     @ns.expect(cancion_base)
@@ -176,6 +536,7 @@ class CancionAPI(Resource):
         """Actualiza una canción existente"""
         cancion = Cancion.query.get_or_404(id)
         data = request.json
+        antes = estadisticas.contribucion(cancion)
 
         cancion.titulo = data.get("titulo", cancion.titulo)
         cancion.artista = data.get("artista", cancion.artista)
@@ -185,7 +546,18 @@ class CancionAPI(Resource):
         cancion.genero = data.get("genero", cancion.genero)
 
         try:
+            if {"titulo", "artista"} & set(data):
+                duplicados.indexar(cancion)
+            cambios = estadisticas.diferencia(antes, estadisticas.contribucion(cancion))
+            if cambios and not favoritos_shards.activo:
+                # Se resta la contribución anterior antes de escribir la canción
+                with db.session.no_autoflush:
+                    estadisticas.sumar_favoritos(-1, Favorito.id_cancion == id)
+                estadisticas.sumar_favoritos(1, Favorito.id_cancion == id)
             db.session.commit()
+            # Con sharding los favoritos no se pueden unir con la canción
+            if cambios and favoritos_shards.activo:
+                trabajos.encolar("reconstruir_estadisticas")
             return cancion
         except Exception as e:
             db.session.rollback()
@@ -197,13 +569,146 @@ class CancionAPI(Resource):
         """Elimina una canción existente"""
         cancion = Cancion.query.get_or_404(id)
         try:
+            estadisticas.descontar_canciones([id])
+            if not favoritos_shards.activo:
+                registrar_bajas_favoritos(db.session, Favorito.id_cancion == id)
             db.session.delete(cancion)
             db.session.commit()
-            return {}, 204
         except Exception as e:
             db.session.rollback()
             ns.abort(400, f"Error al eliminar canción: {str(e)}")
 
+        # Los favoritos de la canción pueden estar en cualquier partición
+        if favoritos_shards.activo:
+
+            def eliminar(sesion):
+                registrar_bajas_favoritos(sesion, Favorito.id_cancion == id)
+                sesion.query(Favorito).filter_by(id_cancion=id).delete()
+                sesion.commit()
+
+            favoritos_shards.en_paralelo(eliminar)
+            trabajos.encolar("reconstruir_estadisticas")
+        return {}, 204
+
+
+@ns.route("/canciones/<int:id>/duplicados")
+@ns.param("id", "Identificador único de la canción")
+@ns.response(404, "Canción no encontrada")
+class CancionDuplicadosAPI(Resource):
+    @ns.doc("Obtener las canciones que probablemente duplican a otra")
+    @ns.param("umbral", "Similitud mínima entre 0 y 1 (por defecto DUPLICADOS_UMBRAL)")
+    @ns.marshal_list_with(duplicado_model)
+    def get(self, id):
+        """Obtiene los posibles duplicados de una canción"""
+        cancion = Cancion.query.get_or_404(id)
+        umbral = request.args.get("umbral", type=float)
+        if umbral is not None and not 0 <= umbral <= 1:
+            ns.abort(400, "El umbral debe estar entre 0 y 1")
+        return [
+            _duplicado_respuesta(otra, valor)
+            for otra, valor in duplicados.buscar_duplicados(cancion, umbral)
+        ], 200
+
+
+@ns.route("/canciones/eliminar")
+class CancionEliminarLoteAPI(Resource):
+    @ns.doc("Eliminar canciones en lote por IDs o filtros")
+    @ns.expect(canciones_eliminar_input)
+    @ns.response(400, "No se indicó ningún criterio")
+    @ns.marshal_with(eliminacion_model)
+    def post(self):
+        """Elimina en una sola operación las canciones que cumplen los criterios"""
+        data = request.json or {}
+        if not any(data.get(c) for c in ("ids", "titulo", "artista", "genero")):
+            ns.abort(400, "Indique al menos un criterio de eliminación")
+
+        query = Cancion.query
+        if data.get("ids"):
+            query = query.filter(Cancion.id.in_(data["ids"]))
+        if data.get("titulo"):
+            query = query.filter(Cancion.titulo.ilike(f"%{data['titulo']}%"))
+        if data.get("artista"):
+            query = query.filter(Cancion.artista.ilike(f"%{data['artista']}%"))
+        if data.get("genero"):
+            query = query.filter(Cancion.genero == data["genero"])
+
+        eliminados = _eliminar_en_lote(Cancion, query, Favorito.id_cancion)
+        return {"eliminados": eliminados}, 200
+
+
+@ns.route("/canciones/tendencias")
+class CancionTendenciasAPI(Resource):
+    @ns.doc("Listar las canciones más marcadas como favoritas en una ventana de tiempo")
+    @ns.param("ventana", "Ventana de tiempo: 1h, 24h o 7d (por defecto 24h)")
+    @ns.param("limite", "Cantidad de canciones a devolver (por defecto 10)")
+    @ns.response(400, "Ventana no válida")
+    @ns.marshal_list_with(cancion_popular_model)
+    def get(self):
+        """Obtiene las canciones en tendencia según sus marcas recientes"""
+        ventana = request.args.get("ventana", "24h")
+        limite = int(request.args.get("limite", 10))
+        if ventana not in VENTANAS:
+            ns.abort(400, f"Ventana no válida; use {', '.join(VENTANAS)}")
+
+        ranking = tendencias.top(ventana, limite)
+        canciones = {
+            cancion.id: cancion
+            for cancion in Cancion.query.filter(
+                Cancion.id.in_([id_cancion for id_cancion, _ in ranking])
+            )
+        }
+        return [
+            {
+                "id": id_cancion,
+                "titulo": canciones[id_cancion].titulo,
+                "artista": canciones[id_cancion].artista,
+                "favoritos": total,
+            }
+            for id_cancion, total in ranking
+            if id_cancion in canciones
+        ], 200
+
+
+# Ranking de canciones más populares
+@ns.route("/canciones/populares")
+class CancionPopularesAPI(Resource):
+    @ns.doc("Listar las canciones más marcadas como favoritas")
+    @ns.param("limite", "Cantidad de canciones a devolver (por defecto 10)")
+    @ns.marshal_list_with(cancion_popular_model)
+    def get(self):
+        """Obtiene las canciones con más favoritos, sumando todas las particiones"""
+        limite = int(request.args.get("limite", 10))
+
+        def contar(sesion):
+            return (
+                sesion.query(Favorito.id_cancion, func.count(Favorito.id))
+                .group_by(Favorito.id_cancion)
+                .all()
+            )
+
+        conteo = Counter()
+        for filas in favoritos_shards.en_paralelo(contar):
+            for id_cancion, total in filas:
+                conteo[id_cancion] += total
+
+        ranking = conteo.most_common(limite)
+        canciones = {
+            cancion.id: cancion
+            for cancion in Cancion.query.filter(
+                Cancion.id.in_([id_cancion for id_cancion, _ in ranking])
+            )
+        }
+        return [
+            {
+                "id": id_cancion,
+                "titulo": canciones[id_cancion].titulo,
+                "artista": canciones[id_cancion].artista,
+                "favoritos": total,
+            }
+            for id_cancion, total in ranking
+            if id_cancion in canciones
+        ], 200
+
 
 # Recursos para buscar canciones
 @ns.route("/canciones/buscar")
@@ -212,14 +717,14 @@ class CancionBusquedaAPI(Resource):
     @ns.param("titulo", "Título de la canción (búsqueda parcial)")
     @ns.param("artista", "Nombre del artista (búsqueda parcial)")
     @ns.param("genero", "Género musical (búsqueda exacta)")
-    @ns.marshal_list_with(cancion_model)
+    @_marshal_campos(cancion_model, as_list=True)
     def get(self):
         """Busca canciones por título, artista o género"""
         titulo = request.args.get("titulo")
         artista = request.args.get("artista")
         genero = request.args.get("genero")
 
-        query = Cancion.query
+        query = _solo_campos(Cancion.query, Cancion, cancion_model)
 
         if titulo:
             query = query.filter(Cancion.titulo.ilike(f"%{titulo}%"))
@@ -238,12 +743,13 @@ class UsuarioListAPI(Resource):
     @ns.param("page", "Número de página (por defecto 1)")
     @ns.param("per_page", "Cantidad por página (por defecto 4)")
     @ns.response(200, "Lista de usuarios obtenida con éxito")
-    @ns.marshal_list_with(usuario_model)
+    @_marshal_campos(usuario_model, as_list=True)
     def get(self):
         """Obtiene todos los usuarios registrados (paginados)"""
         page = int(request.args.get("page", 1))
         per_page = int(request.args.get("per_page", 4))
-        usuarios = Usuario.query.paginate(page=page, per_page=per_page, error_out=False)
+        query = _solo_campos(Usuario.query, Usuario, usuario_model)
+        usuarios = query.paginate(page=page, per_page=per_page, error_out=False)
         return usuarios.items, 200
 
     @ns.doc("Marcar una canción como favorita")
@@ -255,18 +761,23 @@ class UsuarioListAPI(Resource):
     def post(self):
         """Marca una canción como favorita para un usuario"""
         data = request.json
+        if not all(
+            isinstance(data.get(c), int) and not isinstance(data.get(c), bool)
+            for c in ("id_usuario", "id_cancion")
+        ):
+            ns.abort(400, "id_usuario e id_cancion deben ser números enteros")
 
-        usuario = Usuario.query.get(data["id_usuario"])
-        cancion = Cancion.query.get(data["id_cancion"])
-
-        if not usuario:
+        if not cache_identidad.existe(Usuario, data["id_usuario"]):
             ns.abort(404, "Usuario no encontrado")
-        if not cancion:
+        if not cache_identidad.existe(Cancion, data["id_cancion"]):
             ns.abort(404, "Canción no encontrada")
 
-        favorito_existente = Favorito.query.filter_by(
-            id_usuario=data["id_usuario"], id_cancion=data["id_cancion"]
-        ).first()
+        sesion = favoritos_shards.sesion_usuario(data["id_usuario"])
+        favorito_existente = (
+            sesion.query(Favorito)
+            .filter_by(id_usuario=data["id_usuario"], id_cancion=data["id_cancion"])
+            .first()
+        )
 
         if favorito_existente:
             ns.abort(400, "La canción ya está marcada como favorita para este usuario")
@@ -276,14 +787,40 @@ class UsuarioListAPI(Resource):
         )
 
         try:
-            db.session.add(favorito)
-            db.session.commit()
-            return favorito, 201
+            sesion.add(favorito)
+            sesion.flush()
+            estadisticas.ajustar_favorito(favorito.id_usuario, favorito.id_cancion, 1)
+            _confirmar(sesion, favorito.id_usuario, favorito.id_cancion, 1)
+            return _favorito_respuesta(favorito), 201
         except Exception as e:
-            db.session.rollback()
+            _revertir(sesion)
+            if _fila_inexistente(e):
+                ns.abort(404, "Usuario o canción no encontrada")
             ns.abort(400, f"Error al marcar como favorito: {str(e)}")
 
 
+@ns.route("/usuarios/eliminar")
+class UsuarioEliminarLoteAPI(Resource):
+    @ns.doc("Eliminar usuarios en lote por IDs o filtros")
+    @ns.expect(usuarios_eliminar_input)
+    @ns.response(400, "No se indicó ningún criterio")
+    @ns.marshal_with(eliminacion_model)
+    def post(self):
+        """Elimina en una sola operación los usuarios que cumplen los criterios"""
+        data = request.json or {}
+        if not any(data.get(c) for c in ("ids", "correo")):
+            ns.abort(400, "Indique al menos un criterio de eliminación")
+
+        query = Usuario.query
+        if data.get("ids"):
+            query = query.filter(Usuario.id.in_(data["ids"]))
+        if data.get("correo"):
+            query = query.filter(Usuario.correo.ilike(f"%{data['correo']}%"))
+
+        eliminados = _eliminar_en_lote(Usuario, query, Favorito.id_usuario)
+        return {"eliminados": eliminados}, 200
+
+
 @ns.route("/favoritos/<int:id>")
 @ns.param("id", "Identificador único del favorito")
 @ns.response(404, "Favorito no encontrado")
@@ -292,19 +829,29 @@ class FavoritoAPI(Resource):
     @ns.marshal_with(favorito_model)
     def get(self, id):
         """Obtiene un registro de favorito por su ID"""
-        return Favorito.query.get_or_404(id), 200
+        sesion, id_local = favoritos_shards.ubicar(id)
+        favorito = sesion.get(Favorito, id_local)
+        if not favorito:
+            ns.abort(404, "Favorito no encontrado")
+        return _favorito_respuesta(favorito), 200
 
     @ns.doc("Eliminar un favorito")
     @ns.response(204, "Favorito eliminado con éxito")
     def delete(self, id):
         """Elimina un registro de favorito existente"""
-        favorito = Favorito.query.get_or_404(id)
+        sesion, id_local = favoritos_shards.ubicar(id)
+        favorito = sesion.get(Favorito, id_local)
+        if not favorito:
+            ns.abort(404, "Favorito no encontrado")
+        id_usuario, id_cancion = favorito.id_usuario, favorito.id_cancion
         try:
-            db.session.delete(favorito)
-            db.session.commit()
+            # Se resta mientras el favorito existe para unirlo con su canción
+            estadisticas.ajustar_favorito(id_usuario, id_cancion, -1)
+            sesion.delete(favorito)
+            _confirmar(sesion, id_usuario, id_cancion, -1)
             return {}, 204
         except Exception as e:
-            db.session.rollback()
+            _revertir(sesion)
             ns.abort(400, f"Error al eliminar favorito: {str(e)}")
 
 
@@ -318,14 +865,26 @@ class UsuarioFavoritosAPI(Resource):
         """Obtiene todas las canciones favoritas de un usuario"""
         usuario = Usuario.query.get_or_404(id)
 
-        favoritos = Favorito.query.filter_by(id_usuario=id).all()
+        sesion = favoritos_shards.sesion_usuario(id)
+        ids_canciones = [
+            id_cancion
+            for (id_cancion,) in sesion.query(Favorito.id_cancion)
+            .filter_by(id_usuario=id)
+            .order_by(Favorito.id)
+        ]
+        # Las canciones están en la base principal: se cargan en una sola consulta
+        canciones = {
+            cancion.id: cancion
+            for cancion in Cancion.query.filter(Cancion.id.in_(ids_canciones))
+        }
         canciones_favoritas = [
             {
-                "id": favorito.cancion.id,
-                "titulo": favorito.cancion.titulo,
-                "artista": favorito.cancion.artista,
+                "id": canciones[id_cancion].id,
+                "titulo": canciones[id_cancion].titulo,
+                "artista": canciones[id_cancion].artista,
             }
-            for favorito in favoritos
+            for id_cancion in ids_canciones
+            if id_cancion in canciones
         ]
 
         return {
@@ -334,6 +893,30 @@ class UsuarioFavoritosAPI(Resource):
         }, 200
 
 
+@ns.route("/usuarios/<int:id>/estadisticas")
+@ns.param("id", "Identificador único del usuario")
+@ns.response(404, "Usuario no encontrado")
+class UsuarioEstadisticasAPI(Resource):
+    @ns.doc("Obtener las estadísticas de favoritos de un usuario")
+    @ns.marshal_with(estadisticas_model)
+    def get(self, id):
+        """Obtiene las estadísticas de la biblioteca de favoritos de un usuario"""
+        usuario = Usuario.query.get_or_404(id)
+        return estadisticas.resumen(usuario), 200
+
+
+@ns.route("/estadisticas/reconstruir")
+class EstadisticasReconstruirAPI(Resource):
+    @ns.doc("Reconstruir las estadísticas de usuario en segundo plano")
+    @ns.expect(estadisticas_reconstruir_input)
+    @ns.response(202, "Reconstrucción encolada")
+    @ns.marshal_with(trabajo_aceptado_model, code=202)
+    def post(self):
+        """Encola el recálculo de las estadísticas a partir de los favoritos"""
+        id_usuario = (request.get_json(silent=True) or {}).get("id_usuario")
+        return _trabajo_aceptado("reconstruir_estadisticas", id_usuario=id_usuario)
+
+
 @ns.route("/usuarios/<int:id_usuario>/favoritos/<int:id_cancion>")
 @ns.param("id_usuario", "Identificador único del usuario")
 @ns.param("id_cancion", "Identificador único de la canción")
@@ -344,17 +927,17 @@ class UsuarioCancionFavoritoAPI(Resource):
     @ns.response(404, "Usuario o canción no encontrada")
     def post(self, id_usuario, id_cancion):
         """Marca una canción como favorita para un usuario"""
-        usuario = Usuario.query.get(id_usuario)
-        cancion = Cancion.query.get(id_cancion)
-
-        if not usuario:
+        if not cache_identidad.existe(Usuario, id_usuario):
             ns.abort(404, "Usuario no encontrado")
-        if not cancion:
+        if not cache_identidad.existe(Cancion, id_cancion):
             ns.abort(404, "Canción no encontrada")
 
-        favorito = Favorito.query.filter_by(
-            id_usuario=id_usuario, id_cancion=id_cancion
-        ).first()
+        sesion = favoritos_shards.sesion_usuario(id_usuario)
+        favorito = (
+            sesion.query(Favorito)
+            .filter_by(id_usuario=id_usuario, id_cancion=id_cancion)
+            .first()
+        )
 
         if favorito:
             ns.abort(400, "La canción ya está marcada como favorita para este usuario")
@@ -362,11 +945,15 @@ class UsuarioCancionFavoritoAPI(Resource):
         favorito = Favorito(id_usuario=id_usuario, id_cancion=id_cancion)
 
         try:
-            db.session.add(favorito)
-            db.session.commit()
+            sesion.add(favorito)
+            sesion.flush()
+            estadisticas.ajustar_favorito(id_usuario, id_cancion, 1)
+            _confirmar(sesion, id_usuario, id_cancion, 1)
             return {"mensaje": "Canción marcada como favorita"}, 201
         except Exception as e:
-            db.session.rollback()
+            _revertir(sesion)
+            if _fila_inexistente(e):
+                ns.abort(404, "Usuario o canción no encontrada")
             ns.abort(400, f"Error al marcar como favorito: {str(e)}")
 
     @ns.doc("Eliminar una canción de favoritos")
@@ -374,19 +961,495 @@ class UsuarioCancionFavoritoAPI(Resource):
     @ns.response(404, "Relación de favorito no encontrada")
     def delete(self, id_usuario, id_cancion):
         """Elimina una canción de favoritos para un usuario"""
-        favorito = Favorito.query.filter_by(
-            id_usuario=id_usuario, id_cancion=id_cancion
-        ).first_or_404("Relación de favorito no encontrada")
+        sesion = favoritos_shards.sesion_usuario(id_usuario)
+        favorito = (
+            sesion.query(Favorito)
+            .filter_by(id_usuario=id_usuario, id_cancion=id_cancion)
+            .first()
+        )
+        if not favorito:
+            ns.abort(404, "Relación de favorito no encontrada")
 
+        id_usuario, id_cancion = favorito.id_usuario, favorito.id_cancion
         try:
-            db.session.delete(favorito)
-            db.session.commit()
+            # Se resta mientras el favorito existe para unirlo con su canción
+            estadisticas.ajustar_favorito(id_usuario, id_cancion, -1)
+            sesion.delete(favorito)
+            _confirmar(sesion, id_usuario, id_cancion, -1)
             return {}, 204
         except Exception as e:
-            db.session.rollback()
+            _revertir(sesion)
             ns.abort(400, f"Error al eliminar favorito: {str(e)}")
 
 
+# Recursos para Playlists
+def _limite_pagina():
+    """Lee el parámetro `limite` de una petición paginada (entre 1 y 100)."""
+    limite = request.args.get("limite", 20, type=int)
+    return max(1, min(limite, LIMITE_PAGINA_MAXIMO))
+
+
+def _rango_para(id_playlist, data, mover=None):
+    """
+    Calcula la clave de orden para colocar una canción según `antes_de` o
+    `despues_de`.
+
+    Solo consulta el elemento de referencia y su vecino, con el índice
+    (id_playlist, rango).
+
+    Args:
+        id_playlist (int): ID de la playlist
+        data (dict): Datos de la petición
+        mover (PlaylistItem, optional): Elemento que se mueve (se ignora como vecino)
+
+    Returns:
+        str: Clave de orden para el elemento
+    """
+    antes_de, despues_de = data.get("antes_de"), data.get("despues_de")
+    if antes_de is not None and despues_de is not None:
+        ns.abort(400, "Indique solo uno de antes_de o despues_de")
+
+    query = PlaylistItem.query.filter_by(id_playlist=id_playlist)
+    if mover is not None:
+        query = query.filter(PlaylistItem.id != mover.id)
+
+    referencia = None
+    if antes_de is not None or despues_de is not None:
+        id_referencia = antes_de if antes_de is not None else despues_de
+        if mover is not None and id_referencia == mover.id:
+            ns.abort(400, "Un elemento no puede colocarse junto a sí mismo")
+        referencia = query.filter(PlaylistItem.id == id_referencia).first()
+        if referencia is None:
+            ns.abort(404, "Elemento de referencia no encontrado en la playlist")
+
+    if antes_de is not None:
+        anterior = (
+            query.filter(PlaylistItem.rango < referencia.rango)
+            .order_by(PlaylistItem.rango.desc())
+            .first()
+        )
+        return rango_entre(anterior.rango if anterior else None, referencia.rango)
+
+    if despues_de is not None:
+        desde = referencia.rango
+        query = query.filter(PlaylistItem.rango > desde)
+    else:
+        # Al final: después del último elemento
+        ultimo = query.order_by(PlaylistItem.rango.desc()).first()
+        return rango_entre(ultimo.rango if ultimo else None, None)
+    siguiente = query.order_by(PlaylistItem.rango).first()
+    return rango_entre(desde, siguiente.rango if siguiente else None)
+
+
+def _guardar_rango(id_playlist, item, data, mensaje, mover=None):
+    """
+    Calcula la clave de orden de un elemento y confirma la inserción o el
+    movimiento; programa un rebalanceo si la clave quedó demasiado larga.
+
+    SQLite no tiene `SELECT ... FOR UPDATE`, así que hay dos carreras posibles
+    entre leer las claves vecinas y confirmar:
+
+    - Otra escritura calcula la misma clave y la segunda choca con
+      `uq_playlist_rango`.
+    - Un rebalanceo confirma claves nuevas: la clave calculada pertenece al
+      espacio anterior y quedaría en otra posición. Se detecta porque cambió
+      `Playlist.version`, que se comprueba con un UPDATE en la misma
+      transacción.
+
+    En ambos casos se revierte, se recalcula la clave con lo ya confirmado y
+    se reintenta, hasta `INTENTOS_RANGO` veces.
+
+    Args:
+        id_playlist (int): ID de la playlist
+        item (PlaylistItem): Elemento nuevo o que se mueve
+        data (dict): Datos de la petición (`antes_de` o `despues_de`)
+        mensaje (str): Prefijo del mensaje de error
+        mover (PlaylistItem, optional): Elemento que se mueve
+    """
+    for _ in range(INTENTOS_RANGO):
+        version = db.session.query(Playlist.version).filter_by(id=id_playlist).scalar()
+        item.rango = _rango_para(id_playlist, data, mover=mover)
+        db.session.add(item)
+        try:
+            vigente = db.session.execute(
+                update(Playlist)
+                .where(Playlist.id == id_playlist, Playlist.version == version)
+                .values(version=version)
+            ).rowcount
+            if vigente:
+                db.session.commit()
+                break
+            db.session.rollback()
+            error = "la playlist se rebalanceó durante la operación"
+        except IntegrityError as e:
+            db.session.rollback()
+            if _fila_inexistente(e):
+                ns.abort(404, "Playlist o canción no encontrada")
+            if "rango" not in str(e.orig):
+                ns.abort(400, f"{mensaje}: {str(e)}")
+            error = str(e)
+        except Exception as e:
+            db.session.rollback()
+            ns.abort(400, f"{mensaje}: {str(e)}")
+    else:
+        ns.abort(400, f"{mensaje}: {error}")
+    if rebalanceador.necesita(item.rango):
+        rebalanceador.programar(id_playlist)
+
+
+@ns.route("/usuarios/<int:id>/playlists")
+@ns.param("id", "Identificador único del usuario")
+@ns.response(404, "Usuario no encontrado")
+class UsuarioPlaylistsAPI(Resource):
+    @ns.doc("Listar las playlists de un usuario (paginación por cursor)")
+    @ns.param("despues", "Devolver las playlists con ID mayor que este (cursor)")
+    @ns.param("limite", "Cantidad por página (por defecto 20, máximo 100)")
+    @ns.marshal_with(playlists_pagina_model)
+    def get(self, id):
+        """Obtiene una página de playlists de un usuario"""
+        if not cache_identidad.existe(Usuario, id):
+            ns.abort(404, "Usuario no encontrado")
+        limite = _limite_pagina()
+        query = Playlist.query.filter_by(id_usuario=id)
+        despues = request.args.get("despues", type=int)
+        if despues is not None:
+            query = query.filter(Playlist.id > despues)
+        playlists = query.order_by(Playlist.id).limit(limite + 1).all()
+        hay_mas = len(playlists) > limite
+        playlists = playlists[:limite]
+        return {
+            "playlists": playlists,
+            "siguiente": playlists[-1].id if hay_mas else None,
+        }, 200
+
+    @ns.doc("Crear una playlist")
+    @ns.expect(playlist_input)
+    @ns.response(201, "Playlist creada con éxito")
+    @ns.marshal_with(playlist_model)
+    def post(self, id):
+        """Crea una playlist vacía para un usuario"""
+        if not cache_identidad.existe(Usuario, id):
+            ns.abort(404, "Usuario no encontrado")
+        playlist = Playlist(id_usuario=id, nombre=request.json["nombre"])
+        try:
+            db.session.add(playlist)
+            db.session.commit()
+            return playlist, 201
+        except Exception as e:
+            db.session.rollback()
+            if _fila_inexistente(e):
+                ns.abort(404, "Usuario no encontrado")
+            ns.abort(400, f"Error al crear playlist: {str(e)}")
+
+
+@ns.route("/playlists/<int:id>")
+@ns.param("id", "Identificador único de la playlist")
+@ns.response(404, "Playlist no encontrada")
+class PlaylistAPI(Resource):
+    @ns.doc("Obtener una playlist por su ID")
+    @ns.marshal_with(playlist_model)
+    def get(self, id):
+        """Obtiene una playlist por su ID"""
+        return Playlist.query.get_or_404(id), 200
+
+    @ns.doc("Renombrar una playlist")
+    @ns.expect(playlist_input)
+    @ns.marshal_with(playlist_model)
+    def put(self, id):
+        """Cambia el nombre de una playlist"""
+        playlist = Playlist.query.get_or_404(id)
+        playlist.nombre = request.json.get("nombre", playlist.nombre)
+        try:
+            db.session.commit()
+            return playlist
+        except Exception as e:
+            db.session.rollback()
+            ns.abort(400, f"Error al actualizar playlist: {str(e)}")
+
+    @ns.doc("Eliminar una playlist")
+    @ns.response(204, "Playlist eliminada con éxito")
+    def delete(self, id):
+        """Elimina una playlist y sus elementos"""
+        playlist = Playlist.query.get_or_404(id)
+        try:
+            db.session.delete(playlist)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            ns.abort(400, f"Error al eliminar playlist: {str(e)}")
+        return {}, 204
+
+
+@ns.route("/playlists/<int:id>/canciones")
+@ns.param("id", "Identificador único de la playlist")
+@ns.response(404, "Playlist no encontrada")
+class PlaylistCancionesAPI(Resource):
+    @ns.doc("Listar las canciones de una playlist en orden (paginación por cursor)")
+    @ns.param("despues", "ID del último elemento de la página anterior (cursor)")
+    @ns.param("limite", "Cantidad por página (por defecto 20, máximo 100)")
+    @ns.marshal_with(playlist_items_pagina_model)
+    def get(self, id):
+        """Obtiene una página de canciones de una playlist"""
+        Playlist.query.get_or_404(id)
+        limite = _limite_pagina()
+        query = PlaylistItem.query.filter_by(id_playlist=id).options(
+            joinedload(PlaylistItem.cancion)
+        )
+        # El cursor es el ID del elemento y no su clave, que un rebalanceo
+        # cambia: se continúa desde la clave que el elemento tenga ahora
+        despues = request.args.get("despues", type=int)
+        if despues is not None:
+            rango = (
+                db.session.query(PlaylistItem.rango)
+                .filter_by(id=despues, id_playlist=id)
+                .scalar()
+            )
+            if rango is None:
+                ns.abort(404, "Elemento del cursor no encontrado en la playlist")
+            query = query.filter(PlaylistItem.rango > rango)
+        items = query.order_by(PlaylistItem.rango).limit(limite + 1).all()
+        hay_mas = len(items) > limite
+        items = items[:limite]
+        return {
+            "canciones": items,
+            "siguiente": items[-1].id if hay_mas else None,
+        }, 200
+
+    @ns.doc("Agregar una canción a una playlist")
+    @ns.expect(playlist_item_input)
+    @ns.response(201, "Canción agregada a la playlist")
+    @ns.response(404, "Playlist, canción o elemento de referencia no encontrado")
+    @ns.marshal_with(playlist_item_model)
+    def post(self, id):
+        """Agrega una canción al final o junto a otro elemento de la playlist"""
+        data = request.json
+        if not cache_identidad.existe(Cancion, data["id_cancion"]):
+            ns.abort(404, "Canción no encontrada")
+        Playlist.query.get_or_404(id)
+        item = PlaylistItem(id_playlist=id, id_cancion=data["id_cancion"])
+        _guardar_rango(id, item, data, "Error al agregar a la playlist")
+        return item, 201
+
+
+@ns.route("/playlists/<int:id>/canciones/<int:id_item>")
+@ns.param("id", "Identificador único de la playlist")
+@ns.param("id_item", "Identificador del elemento dentro de la playlist")
+@ns.response(404, "Playlist o elemento no encontrado")
+class PlaylistItemAPI(Resource):
+    @ns.doc("Mover una canción dentro de la playlist")
+    @ns.expect(playlist_posicion_input)
+    @ns.marshal_with(playlist_item_model)
+    def put(self, id, id_item):
+        """Mueve un elemento delante o detrás de otro (o al final)"""
+        Playlist.query.get_or_404(id)
+        item = PlaylistItem.query.filter_by(id=id_item, id_playlist=id).first()
+        if item is None:
+            ns.abort(404, "Elemento no encontrado en la playlist")
+        _guardar_rango(
+            id, item, request.json or {}, "Error al mover en la playlist", mover=item
+        )
+        return item
+
+    @ns.doc("Quitar una canción de la playlist")
+    @ns.response(204, "Elemento eliminado de la playlist")
+    def delete(self, id, id_item):
+        """Quita un elemento de la playlist"""
+        eliminados = PlaylistItem.query.filter_by(id=id_item, id_playlist=id).delete()
+        if not eliminados:
+            db.session.rollback()
+            ns.abort(404, "Elemento no encontrado en la playlist")
+        db.session.commit()
+        return {}, 204
+
+
+# Recursos para Trabajos en segundo plano
+@ns.route("/trabajos")
+class TrabajoListAPI(Resource):
+    # El estado de la cola cambia sin pasar por esta petición
+    coalescer = False
+
+    @ns.doc("Listar los trabajos más recientes")
+    @ns.param("estado", "Filtrar por estado (pendiente, en_curso, completado, fallido)")
+    @ns.param("tipo", "Filtrar por tipo de trabajo")
+    @ns.param("limite", f"Cantidad de trabajos (máximo {LIMITE_PAGINA_MAXIMO})")
+    @ns.marshal_list_with(trabajo_model)
+    def get(self):
+        """Obtiene los trabajos más recientes, del último al primero"""
+        query = Trabajo.query
+        if request.args.get("estado"):
+            query = query.filter_by(estado=request.args["estado"])
+        if request.args.get("tipo"):
+            query = query.filter_by(tipo=request.args["tipo"])
+        query = query.order_by(Trabajo.id.desc()).limit(_limite_pagina())
+        return [trabajos.serializar(trabajo) for trabajo in query], 200
+
+
+@ns.route("/trabajos/<int:id>")
+@ns.param("id", "Identificador único del trabajo")
+@ns.response(404, "Trabajo no encontrado")
+class TrabajoAPI(Resource):
+    coalescer = False
+
+    @ns.doc("Obtener el estado de un trabajo")
+    @ns.marshal_with(trabajo_model)
+    def get(self, id):
+        """Obtiene el estado, los intentos y el resultado de un trabajo"""
+        return trabajos.serializar(Trabajo.query.get_or_404(id)), 200
+
+
+@ns.route("/cache/identidad")
+class CacheIdentidadAPI(Resource):
+    @ns.doc("Métricas de la caché de identidad de usuarios y canciones")
+    @ns.marshal_list_with(metrica_cache_model)
+    def get(self):
+        """Obtiene el tamaño en memoria y la tasa de aciertos de la caché"""
+        return cache_identidad.metricas(), 200
+
+
+@ns.route("/instantanea")
+class InstantaneaAPI(Resource):
+    coalescer = False
+
+    @ns.doc("Estado de la instantánea de canciones mapeada en memoria")
+    @ns.marshal_with(metrica_instantanea_model)
+    def get(self):
+        """Obtiene la versión, el tamaño y la tasa de aciertos de la instantánea"""
+        return instantanea.metricas(), 200
+
+
+@ns.route("/coalescencia")
+class CoalescenciaAPI(Resource):
+    # Las métricas no deben contarse a sí mismas
+    coalescer = False
+
+    @ns.doc("Métricas de coalescencia de peticiones GET idénticas")
+    @ns.marshal_with(metrica_coalescencia_model)
+    def get(self):
+        """Obtiene cuántas peticiones GET se ejecutaron y cuántas se coalescieron"""
+        return current_app.extensions["coalescencia"].metricas(), 200
+
+
+def _perfilador():
+    """
+    Obtiene el perfilador de la aplicación para los endpoints de administración.
+
+    Responde 404 si el perfilado no está activo y 403 si la petición no trae el
+    `PERFILADO_TOKEN` en la cabecera `X-Perfilado-Token`.
+
+    Returns:
+        Perfilador: Perfilador de la aplicación
+    """
+    perfilador = current_app.extensions.get("perfilado")
+    if perfilador is None:
+        ns.abort(
+            404, "El perfilado no está activo (PERFILADO_ACTIVO y PERFILADO_TOKEN)"
+        )
+    if not perfilado.token_valido(current_app.config.get("PERFILADO_TOKEN")):
+        ns.abort(403, "Token de perfilado no válido")
+    return perfilador
+
+
+@ns.route("/perfilado")
+class PerfiladoAPI(Resource):
+    # Los endpoints del perfilador no se perfilan ni se coalescen
+    perfilar = False
+    coalescer = False
+
+    @ns.doc("Resumen de las rutas perfiladas")
+    @ns.marshal_list_with(ruta_perfilada_model)
+    def get(self):
+        """Obtiene las rutas perfiladas con sus peticiones y muestras"""
+        return _perfilador().resumen(), 200
+
+    @ns.doc("Descartar las muestras acumuladas")
+    @ns.response(204, "Muestras descartadas")
+    def delete(self):
+        """Descarta las muestras acumuladas"""
+        _perfilador().reiniciar()
+        return {}, 204
+
+
+@ns.route("/perfilado/collapsed")
+class PerfiladoCollapsedAPI(Resource):
+    perfilar = False
+    coalescer = False
+
+    @ns.doc("Pilas en formato collapsed (flamegraph.pl, inferno)")
+    @ns.param("ruta", "Solo esta ruta, p. ej. 'GET /api/canciones'")
+    def get(self):
+        """Exporta las pilas muestreadas como texto collapsed"""
+        pilas = _perfilador().collapsed(request.args.get("ruta"))
+        return Response(pilas, mimetype="text/plain")
+
+
+@ns.route("/perfilado/speedscope")
+class PerfiladoSpeedscopeAPI(Resource):
+    perfilar = False
+    coalescer = False
+
+    @ns.doc("Pilas como archivo de speedscope, un perfil por ruta")
+    @ns.param("ruta", "Solo esta ruta, p. ej. 'GET /api/canciones'")
+    def get(self):
+        """Exporta las pilas muestreadas para abrirlas en speedscope.app"""
+        return _perfilador().speedscope(request.args.get("ruta")), 200
+
+
+# Registro de cambios para consumidores externos
+@ns.route("/eventos")
+class EventoListAPI(Resource):
+    @ns.doc("Leer el registro de cambios a partir de una secuencia")
+    @ns.param("desde", "Última secuencia procesada (por defecto 0)")
+    @ns.param("limite", "Cantidad máxima de eventos (por defecto 100)")
+    @ns.param("espera", "Segundos a esperar si no hay eventos nuevos (por defecto 0)")
+    @ns.marshal_with(eventos_model)
+    def get(self):
+        """Obtiene los cambios posteriores a `desde` (long-poll si se indica `espera`)"""
+        desde = int(request.args.get("desde", 0))
+        limite = int(request.args.get("limite", 100))
+        espera = float(request.args.get("espera", 0))
+
+        eventos = esperar_eventos(desde, limite, espera)
+        return {
+            "eventos": [serializar_evento(evento) for evento in eventos],
+            "ultimo": eventos[-1].id if eventos else desde,
+        }, 200
+
+
+@ns.route("/eventos/stream")
+class EventoStreamAPI(Resource):
+    # Cada cliente mantiene su propio flujo abierto
+    coalescer = False
+
+    @ns.doc("Recibir el registro de cambios como Server-Sent Events")
+    @ns.param("desde", "Última secuencia procesada (o cabecera Last-Event-ID)")
+    @ns.param(
+        "espera", "Segundos sin eventos antes de cerrar el flujo (por defecto 30)"
+    )
+    def get(self):
+        """Emite los cambios como text/event-stream; el ID de cada evento es su secuencia"""
+        desde = int(request.headers.get("Last-Event-ID", request.args.get("desde", 0)))
+        espera = float(request.args.get("espera", 30))
+
+        def generar():
+            ultimo = desde
+            while True:
+                eventos = esperar_eventos(ultimo, 100, espera)
+                if not eventos:
+                    # El cliente se reconecta enviando Last-Event-ID
+                    yield ": sin cambios\n\n"
+                    return
+                for evento in eventos:
+                    datos = json.dumps(serializar_evento(evento))
+                    yield f"id: {evento.id}\nevent: {evento.tabla}\ndata: {datos}\n\n"
+                ultimo = eventos[-1].id
+
+        return Response(
+            stream_with_context(generar()),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache"},
+        )
+
+
 @ns.route("/")
 class Home(Resource):
     @ns.doc("Página principal de la API")
@@ -0,0 +1,152 @@
+"""
+Módulo de particionado (sharding) de la tabla de favoritos.
+
+Cuando la configuración `FAVORITOS_SHARDS` contiene una o más URIs de base de
+datos, las filas de `Favorito` se reparten entre esas bases según un hash del
+`id_usuario`. Todos los favoritos de un mismo usuario viven en la misma
+partición, por lo que las operaciones de un usuario tocan una sola base y la
+restricción única (id_usuario, id_cancion) se sigue cumpliendo localmente.
+
+Si no hay particiones configuradas se usa la sesión principal `db.session`, de
+modo que los recursos funcionan igual en ambos modos.
+"""
+
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from .extensions import db
+from .models import Favorito
+
+
+class FavoritoShards:
+    """
+    Extensión que enruta las filas de `Favorito` a la partición correspondiente.
+
+    Los identificadores de favorito expuestos por la API son globales: codifican
+    la partición como `id_local * total + indice`. Con una sola partición (modo
+    sin sharding) el identificador global coincide con el local.
+    """
+
+    def init_app(self, app):
+        """
+        Crea los motores y sesiones de cada partición configurada.
+
+        Args:
+            app (Flask): Aplicación a la que se asocian las particiones.
+        """
+        sesiones = []
+        for uri in app.config.get("FAVORITOS_SHARDS") or []:
+            engine = create_engine(uri)
+            Favorito.__table__.create(engine, checkfirst=True)
+            sesiones.append(scoped_session(sessionmaker(bind=engine)))
+
+        app.extensions["favoritos_shards"] = sesiones
+
+        @app.teardown_appcontext
+        def cerrar_sesiones(exc):
+            for sesion in sesiones:
+                sesion.remove()
+
+    @property
+    def _sesiones(self):
+        return current_app.extensions.get("favoritos_shards", [])
+
+    @property
+    def activo(self):
+        """bool: True si los favoritos están repartidos en particiones."""
+        return bool(self._sesiones)
+
+    @property
+    def total(self):
+        """int: Número de particiones (1 cuando el sharding está desactivado)."""
+        return len(self._sesiones) or 1
+
+    def indice(self, id_usuario):
+        """
+        Calcula la partición que corresponde a un usuario.
+
+        Args:
+            id_usuario (int): ID del usuario
+
+        Returns:
+            int: Índice de la partición
+        """
+        return zlib.crc32(str(id_usuario).encode()) % self.total
+
+    def sesion(self, indice):
+        """
+        Obtiene la sesión de una partición.
+
+        Args:
+            indice (int): Índice de la partición
+
+        Returns:
+            Session: Sesión de la partición, o `db.session` si no hay sharding
+        """
+        if not self.activo:
+            return db.session
+        return self._sesiones[indice]
+
+    def sesion_usuario(self, id_usuario):
+        """Obtiene la sesión de la partición donde viven los favoritos del usuario."""
+        return self.sesion(self.indice(id_usuario))
+
+    def id_global(self, favorito):
+        """
+        Convierte el ID local de un favorito en su ID global.
+
+        Args:
+            favorito (Favorito): Favorito cargado desde su partición
+
+        Returns:
+            int: Identificador global expuesto por la API
+        """
+        return favorito.id * self.total + self.indice(favorito.id_usuario)
+
+    def ubicar(self, id_global):
+        """
+        Descompone un ID global en partición e ID local.
+
+        Args:
+            id_global (int): Identificador global del favorito
+
+        Returns:
+            tuple: (sesión de la partición, ID local)
+        """
+        id_local, indice = divmod(id_global, self.total)
+        return self.sesion(indice), id_local
+
+    def en_paralelo(self, funcion):
+        """
+        Ejecuta una función sobre todas las particiones en paralelo.
+
+        Args:
+            funcion (callable): Recibe una sesión y devuelve un resultado
+
+        Returns:
+            list: Resultado de cada partición
+        """
+        if not self.activo:
+            return [funcion(db.session)]
+
+        # Cada hilo tiene su propio contexto de aplicación, para que los
+        # eventos de la sesión (p. ej. los del registro de cambios) vean la app
+        app = current_app._get_current_object()
+
+        def ejecutar(sesion):
+            with app.app_context():
+                try:
+                    return funcion(sesion)
+                finally:
+                    sesion.remove()
+
+        with ThreadPoolExecutor(max_workers=self.total) as executor:
+            return list(executor.map(ejecutar, self._sesiones))
+
+
+favoritos_shards = FavoritoShards()
+"""Instancia de FavoritoShards usada por los recursos de la API."""
@@ -0,0 +1,259 @@
+"""
+Módulo de canciones en tendencia por ventanas de tiempo.
+
+Los recursos de favoritos registran cada marca (y cada desmarca) en cubetas
+de tiempo según `Favorito.fecha_marcado`: cubetas de un minuto para la ventana
+de una hora y cubetas de una hora para las ventanas de 24 horas y 7 días. Cada
+ventana mantiene además el total acumulado por canción, de modo que el top-k se
+obtiene de esos totales sin recorrer la tabla de favoritos.
+
+Las cubetas que salen de una ventana se restan de su total y se descartan
+(compactación). La compactación se ejecuta antes de cada lectura y también en
+un hilo en segundo plano, así que la memoria queda acotada a 60 cubetas de
+minuto y 168 de hora.
+
+Los contadores viven en memoria de cada proceso, pero todos siguen el mismo
+registro de cambios (`Evento`): al usarse por primera vez se cargan con los
+favoritos de los últimos 7 días y la marca (último `Evento.id`) que les
+corresponde, y antes de cada lectura se aplican las altas y bajas de favoritos
+registradas después de esa marca. Así cuentan también los cambios de otros
+procesos y las bajas en cascada o en lote. Con sharding, los eventos de las
+particiones se publican tras confirmarlas, así que un favorito que cambia
+justo durante la carga inicial puede contarse de más o de menos.
+"""
+
+import calendar
+import heapq
+import json
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from operator import itemgetter
+
+from flask import current_app
+from sqlalchemy import func
+
+from .extensions import db
+from .models import Evento, Favorito
+from .sharding import favoritos_shards
+
+VENTANAS = {"1h": (60, 60), "24h": (3600, 24), "7d": (3600, 168)}
+"""Ventanas disponibles: nombre -> (segundos por cubeta, cantidad de cubetas)."""
+
+INTENTOS_CARGA = 3
+"""Lecturas de la carga inicial si el registro cambia mientras se lee."""
+
+
+def _ultimo_evento():
+    """int: Último `Evento.id` confirmado (0 si no hay eventos)."""
+    return db.session.query(func.max(Evento.id)).scalar() or 0
+
+
+def _segundos(momento):
+    """Convierte una fecha UTC sin zona horaria en segundos desde la época."""
+    return calendar.timegm(momento.utctimetuple())
+
+
+class ContadorTendencias:
+    """
+    Cubetas de tiempo y totales por ventana de las marcas de favorito.
+
+    Invariante: el total de cada ventana es la suma de sus cubetas con inicio
+    mayor o igual que el corte de esa ventana.
+    """
+
+    def __init__(self, ahora=None):
+        ahora = int(time.time() if ahora is None else ahora)
+        self._lock = threading.Lock()
+        self._cubetas = {tamano: {} for tamano, _ in VENTANAS.values()}
+        self._totales = {ventana: Counter() for ventana in VENTANAS}
+        self._cortes = {ventana: self._corte(ventana, ahora) for ventana in VENTANAS}
+
+    @staticmethod
+    def _corte(ventana, ahora):
+        """Inicio de la cubeta más antigua que pertenece a la ventana."""
+        tamano, cantidad = VENTANAS[ventana]
+        return (ahora // tamano - cantidad + 1) * tamano
+
+    def registrar(self, id_cancion, cantidad, momento):
+        """
+        Suma (o resta) marcas de una canción en el instante indicado.
+
+        Args:
+            id_cancion (int): ID de la canción
+            cantidad (int): 1 al marcar como favorita, -1 al desmarcar
+            momento (datetime): Fecha de marcado (UTC)
+        """
+        segundos = _segundos(momento)
+        with self._lock:
+            for tamano, cubetas in self._cubetas.items():
+                inicio = segundos // tamano * tamano
+                if inicio >= self._corte_minimo(tamano):
+                    cubetas.setdefault(inicio, Counter())[id_cancion] += cantidad
+            for ventana, (tamano, _) in VENTANAS.items():
+                if segundos // tamano * tamano >= self._cortes[ventana]:
+                    self._sumar(self._totales[ventana], {id_cancion: cantidad})
+
+    def _corte_minimo(self, tamano):
+        return min(
+            self._cortes[ventana] for ventana, (t, _) in VENTANAS.items() if t == tamano
+        )
+
+    @staticmethod
+    def _sumar(total, conteo, signo=1):
+        for id_cancion, cantidad in conteo.items():
+            total[id_cancion] += signo * cantidad
+            if total[id_cancion] <= 0:
+                del total[id_cancion]
+
+    def compactar(self, ahora=None):
+        """
+        Resta de cada ventana las cubetas que ya salieron de ella y descarta
+        las cubetas que ninguna ventana necesita.
+
+        Args:
+            ahora (float, optional): Instante actual en segundos desde la época
+        """
+        ahora = int(time.time() if ahora is None else ahora)
+        with self._lock:
+            for ventana, (tamano, _) in VENTANAS.items():
+                nuevo = self._corte(ventana, ahora)
+                for inicio, conteo in self._cubetas[tamano].items():
+                    if self._cortes[ventana] <= inicio < nuevo:
+                        self._sumar(self._totales[ventana], conteo, -1)
+                self._cortes[ventana] = max(self._cortes[ventana], nuevo)
+            for tamano, cubetas in self._cubetas.items():
+                minimo = self._corte_minimo(tamano)
+                for inicio in [i for i in cubetas if i < minimo]:
+                    del cubetas[inicio]
+
+    def top(self, ventana, limite, ahora=None):
+        """
+        Obtiene las canciones con más marcas en una ventana.
+
+        Args:
+            ventana (str): Nombre de la ventana (1h, 24h o 7d)
+            limite (int): Cantidad de canciones a devolver
+            ahora (float, optional): Instante actual en segundos desde la época
+
+        Returns:
+            list: Pares (id_cancion, marcas) ordenados de mayor a menor
+        """
+        self.compactar(ahora)
+        with self._lock:
+            return heapq.nlargest(
+                limite, self._totales[ventana].items(), key=itemgetter(1)
+            )
+
+    @property
+    def cubetas(self):
+        """int: Cantidad de cubetas en memoria."""
+        return sum(len(cubetas) for cubetas in self._cubetas.values())
+
+
+class Tendencias:
+    """
+    Extensión que mantiene un `ContadorTendencias` por aplicación, al día con
+    el registro de cambios.
+    """
+
+    def init_app(self, app):
+        """
+        Prepara el contador de tendencias de la aplicación.
+
+        Args:
+            app (Flask): Aplicación a la que se asocia el contador.
+        """
+        app.extensions["tendencias"] = {
+            "contador": ContadorTendencias(),
+            "cargado": False,
+            "ultimo_evento": 0,
+            "lock": threading.Lock(),
+        }
+
+    def _contador(self):
+        """Obtiene el contador, cargándolo en el primer uso y aplicando los eventos nuevos."""
+        estado = current_app.extensions["tendencias"]
+        with estado["lock"]:
+            if not estado["cargado"]:
+                self._cargar(estado)
+                estado["cargado"] = True
+                self._iniciar_compactacion(
+                    estado["contador"],
+                    current_app.config.get("TENDENCIAS_COMPACTACION", 60),
+                )
+            self._seguir_registro(estado)
+        return estado["contador"]
+
+    @staticmethod
+    def _cargar(estado):
+        """Carga los favoritos de los últimos 7 días y la marca del registro."""
+        desde = datetime.utcnow() - timedelta(days=7)
+
+        def recientes(sesion):
+            return (
+                sesion.query(Favorito.id_cancion, Favorito.fecha_marcado)
+                .filter(Favorito.fecha_marcado >= desde)
+                .all()
+            )
+
+        # La carga corresponde a la marca si no apareció ningún evento mientras
+        # se leían los favoritos; si apareció, se vuelve a leer
+        for _ in range(INTENTOS_CARGA):
+            marca = _ultimo_evento()
+            filas = [
+                fila for f in favoritos_shards.en_paralelo(recientes) for fila in f
+            ]
+            if _ultimo_evento() == marca:
+                break
+
+        contador = ContadorTendencias()
+        for id_cancion, fecha_marcado in filas:
+            contador.registrar(id_cancion, 1, fecha_marcado)
+        estado["contador"] = contador
+        estado["ultimo_evento"] = marca
+
+    @staticmethod
+    def _seguir_registro(estado):
+        """Aplica las altas y bajas de favoritos registradas desde la última lectura."""
+        maximo = _ultimo_evento()
+        if maximo <= estado["ultimo_evento"]:
+            return
+        eventos = (
+            db.session.query(Evento.operacion, Evento.datos)
+            .filter(
+                Evento.id > estado["ultimo_evento"],
+                Evento.id <= maximo,
+                Evento.tabla == "favorito",
+                Evento.operacion.in_(("crear", "eliminar")),
+            )
+            .order_by(Evento.id)
+        )
+        for operacion, datos in eventos:
+            datos = json.loads(datos or "{}")
+            if datos.get("fecha_marcado") is None:
+                continue
+            estado["contador"].registrar(
+                datos["id_cancion"],
+                1 if operacion == "crear" else -1,
+                datetime.fromisoformat(datos["fecha_marcado"]),
+            )
+        estado["ultimo_evento"] = maximo
+
+    @staticmethod
+    def _iniciar_compactacion(contador, intervalo):
+        def compactar_periodicamente():
+            while True:
+                time.sleep(intervalo)
+                contador.compactar()
+
+        threading.Thread(target=compactar_periodicamente, daemon=True).start()
+
+    def top(self, ventana, limite):
+        """Obtiene las canciones con más marcas en la ventana indicada."""
+        return self._contador().top(ventana, limite)
+
+
+tendencias = Tendencias()
+"""Instancia de Tendencias usada por los recursos de la API."""
@@ -0,0 +1,417 @@
+"""
+Módulo de trabajos en segundo plano.
+
+Las operaciones costosas (importar un catálogo, reconstruir estadísticas,
+eliminar un usuario con miles de favoritos) no se ejecutan en la petición:
+se encolan como filas de `Trabajo` y la petición responde 202 con el ID del
+trabajo, cuyo estado se consulta en `/api/trabajos/<id>`.
+
+La cola vive en su propia base SQLite (bind `trabajos`, ver `TRABAJOS_URI`),
+de modo que sobrevive a reinicios y la comparten todos los procesos de la
+máquina. Los trabajadores son procesos aparte (`flask trabajadores`) que:
+
+1. Toman el trabajo pendiente más antiguo con un único `UPDATE ... RETURNING`,
+   así que dos trabajadores nunca toman el mismo trabajo.
+2. Lo ejecutan con la función registrada para su tipo (`@tarea`).
+3. Guardan el resultado, o el error y un nuevo intento tras una espera que se
+   duplica en cada fallo (`TRABAJOS_ESPERA_BASE`), hasta `TRABAJOS_INTENTOS`.
+
+Un trabajo en curso durante más de `TRABAJOS_TIEMPO_MAXIMO` segundos se
+considera abandonado (su trabajador murió) y vuelve a la cola. Por eso la
+ejecución es "al menos una vez". Para que un reintento no repita cambios ya
+confirmados, la última transacción de la tarea incluye una fila de
+`TrabajoAplicado`; si el reintento la encuentra, reutiliza su resultado sin
+volver a ejecutar la tarea. Las tareas que confirman por partes (como
+`eliminar_usuario`) deben poder retomarse desde donde quedaron.
+
+Las cachés en memoria de otros procesos (p. ej. `cache_identidad`) se enteran
+de las bajas que hace un trabajador por el registro de cambios.
+"""
+
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import traceback
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event, select, update
+
+from .extensions import db
+from .models import Cancion, Favorito, Trabajo, TrabajoAplicado, Usuario
+from .eventos import registrar_bajas_favoritos
+from .sharding import favoritos_shards
+from . import duplicados, estadisticas
+
+TAMANO_LOTE = 500
+"""Favoritos por sentencia al eliminar un usuario."""
+
+PENDIENTE = "pendiente"
+EN_CURSO = "en_curso"
+COMPLETADO = "completado"
+FALLIDO = "fallido"
+
+_tareas = {}
+"""Tipo de trabajo -> función que lo ejecuta."""
+
+
+def tarea(tipo):
+    """
+    Registra una función como ejecutora de un tipo de trabajo.
+
+    La función recibe los argumentos del trabajo como argumentos con nombre,
+    se ejecuta en un contexto de aplicación y devuelve un resultado
+    serializable en JSON.
+
+    Args:
+        tipo (str): Tipo de trabajo, p. ej. "eliminar_usuario"
+    """
+
+    def decorador(funcion):
+        _tareas[tipo] = funcion
+        return funcion
+
+    return decorador
+
+
+def tipos():
+    """list: Tipos de trabajo registrados."""
+    return sorted(_tareas)
+
+
+def encolar(tipo, **argumentos):
+    """
+    Encola un trabajo y lo confirma en la base de la cola.
+
+    Args:
+        tipo (str): Tipo de trabajo registrado con `@tarea`
+        **argumentos: Argumentos de la tarea (serializables en JSON)
+
+    Returns:
+        Trabajo: Trabajo pendiente
+
+    Raises:
+        ValueError: Si el tipo no está registrado
+    """
+    if tipo not in _tareas:
+        raise ValueError(f"Tipo de trabajo desconocido: {tipo}")
+    trabajo = Trabajo(
+        tipo=tipo,
+        argumentos=json.dumps(argumentos),
+        max_intentos=current_app.config.get("TRABAJOS_INTENTOS", 3),
+        disponible_desde=datetime.utcnow(),
+    )
+    db.session.add(trabajo)
+    db.session.commit()
+    return trabajo
+
+
+def _recuperar_abandonados(ahora):
+    """Devuelve a la cola (o da por fallidos) los trabajos abandonados."""
+    limite = ahora - timedelta(
+        seconds=current_app.config.get("TRABAJOS_TIEMPO_MAXIMO", 3600)
+    )
+    abandonados = (Trabajo.estado == EN_CURSO, Trabajo.fecha_inicio < limite)
+    db.session.execute(
+        update(Trabajo)
+        .where(*abandonados, Trabajo.intentos < Trabajo.max_intentos)
+        .values(estado=PENDIENTE, disponible_desde=ahora, trabajador=None)
+    )
+    db.session.execute(
+        update(Trabajo)
+        .where(*abandonados, Trabajo.intentos >= Trabajo.max_intentos)
+        .values(estado=FALLIDO, fecha_fin=ahora, error="Trabajo abandonado")
+    )
+
+
+def tomar(trabajador):
+    """
+    Toma el trabajo pendiente más antiguo que ya puede ejecutarse.
+
+    Args:
+        trabajador (str): Nombre del trabajador que lo toma
+
+    Returns:
+        Trabajo: Trabajo marcado como en curso, o None si no hay ninguno
+    """
+    ahora = datetime.utcnow()
+    _recuperar_abandonados(ahora)
+    siguiente = (
+        select(Trabajo.id)
+        .where(Trabajo.estado == PENDIENTE, Trabajo.disponible_desde <= ahora)
+        .order_by(Trabajo.disponible_desde, Trabajo.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    id_trabajo = db.session.execute(
+        update(Trabajo)
+        .where(Trabajo.id == siguiente, Trabajo.estado == PENDIENTE)
+        .values(
+            estado=EN_CURSO,
+            intentos=Trabajo.intentos + 1,
+            fecha_inicio=ahora,
+            trabajador=trabajador,
+        )
+        .returning(Trabajo.id)
+    ).scalar()
+    db.session.commit()
+    return db.session.get(Trabajo, id_trabajo) if id_trabajo else None
+
+
+def ejecutar(trabajo):
+    """
+    Ejecuta un trabajo en curso y guarda su resultado o su error.
+
+    Si la tarea falla, sus cambios se revierten y el trabajo vuelve a la
+    cola con espera exponencial, salvo que haya agotado sus intentos. Si sus
+    cambios ya se habían confirmado en un intento anterior (hay una fila de
+    `TrabajoAplicado`), no se repite y se reutiliza su resultado.
+
+    Args:
+        trabajo (Trabajo): Trabajo devuelto por `tomar`
+
+    Returns:
+        Trabajo: El mismo trabajo, ya completado, fallido o pendiente
+    """
+    clave = f"{trabajo.id}:{trabajo.fecha_creacion.isoformat()}"
+    try:
+        aplicado = db.session.get(TrabajoAplicado, clave)
+        if aplicado:
+            resultado = aplicado.resultado
+        else:
+            funcion = _tareas[trabajo.tipo]
+            resultado = json.dumps(
+                funcion(**json.loads(trabajo.argumentos)), default=str
+            )
+            db.session.add(TrabajoAplicado(clave=clave, resultado=resultado))
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        ahora = datetime.utcnow()
+        trabajo.error = f"{type(e).__name__}: {e}"
+        current_app.logger.error(
+            "Trabajo %s (%s) falló en el intento %s:\n%s",
+            trabajo.id,
+            trabajo.tipo,
+            trabajo.intentos,
+            traceback.format_exc(),
+        )
+        if trabajo.intentos < trabajo.max_intentos:
+            espera = current_app.config.get("TRABAJOS_ESPERA_BASE", 2) * 2 ** (
+                trabajo.intentos - 1
+            )
+            trabajo.estado = PENDIENTE
+            trabajo.disponible_desde = ahora + timedelta(seconds=espera)
+        else:
+            trabajo.estado = FALLIDO
+            trabajo.fecha_fin = ahora
+    else:
+        trabajo.estado = COMPLETADO
+        trabajo.resultado = resultado
+        trabajo.error = None
+        trabajo.fecha_fin = datetime.utcnow()
+    db.session.commit()
+    return trabajo
+
+
+def procesar_pendientes(trabajador="local", limite=None):
+    """
+    Ejecuta en el proceso actual los trabajos que ya pueden ejecutarse.
+
+    Útil en pruebas y scripts; en producción los ejecutan los procesos de
+    `flask trabajadores`.
+
+    Args:
+        trabajador (str): Nombre con el que se marcan los trabajos
+        limite (int, optional): Máximo de trabajos a ejecutar
+
+    Returns:
+        int: Cantidad de trabajos ejecutados
+    """
+    ejecutados = 0
+    while limite is None or ejecutados < limite:
+        trabajo = tomar(trabajador)
+        if trabajo is None:
+            break
+        ejecutar(trabajo)
+        ejecutados += 1
+    return ejecutados
+
+
+def serializar(trabajo):
+    """
+    Prepara un trabajo para serializarlo con `trabajo_model`.
+
+    Args:
+        trabajo (Trabajo): Trabajo de la cola
+
+    Returns:
+        dict: Columnas del trabajo con argumentos y resultado decodificados
+    """
+    datos = {c.key: getattr(trabajo, c.key) for c in Trabajo.__table__.columns}
+    datos["argumentos"] = json.loads(trabajo.argumentos or "{}")
+    datos["resultado"] = json.loads(trabajo.resultado) if trabajo.resultado else None
+    return datos
+
+
+def _sqlite_concurrente(dbapi_connection, connection_record):
+    """Permite que varios procesos lean la cola mientras uno escribe."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+
+def init_app(app):
+    """
+    Prepara la base de la cola de trabajos.
+
+    Args:
+        app (Flask): Aplicación cuya configuración define `TRABAJOS_URI`.
+    """
+    with app.app_context():
+        engine = db.engines["trabajos"]
+        if engine.dialect.name == "sqlite" and engine.url.database not in (
+            None,
+            "",
+            ":memory:",
+        ):
+            event.listen(engine, "connect", _sqlite_concurrente)
+
+
+# Bucle de los procesos trabajadores
+
+
+def _trabajar(config, nombre, detener):
+    """Punto de entrada de un proceso trabajador."""
+    from . import create_app
+
+    # Ctrl+C lo recibe el proceso principal, que avisa con `detener`
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    app = create_app(config_extra=config)
+    with app.app_context():
+        sondeo = app.config.get("TRABAJOS_SONDEO", 1)
+        app.logger.info("Trabajador %s iniciado", nombre)
+        while not detener.is_set():
+            try:
+                if not procesar_pendientes(nombre, limite=1):
+                    detener.wait(sondeo)
+            except Exception:
+                db.session.rollback()
+                app.logger.exception("Error en el trabajador %s", nombre)
+                detener.wait(sondeo)
+            finally:
+                db.session.remove()
+
+
+def iniciar_trabajadores(procesos=None):
+    """
+    Inicia procesos trabajadores con la configuración de la aplicación actual.
+
+    Los procesos se crean con `spawn`: cada uno construye su propia
+    aplicación y sus propias conexiones.
+
+    Args:
+        procesos (int, optional): Cantidad de procesos. Por defecto
+            `TRABAJOS_PROCESOS`.
+
+    Returns:
+        tuple: (lista de procesos, Event que los detiene al activarse)
+    """
+    procesos = procesos or current_app.config.get("TRABAJOS_PROCESOS", 2)
+    contexto = multiprocessing.get_context("spawn")
+    detener = contexto.Event()
+    config = {clave: valor for clave, valor in current_app.config.items()}
+    prefijo = f"{socket.gethostname()}:{os.getpid()}"
+    lista = [
+        contexto.Process(
+            target=_trabajar,
+            args=(config, f"{prefijo}/{i}", detener),
+            name=f"trabajador-{i}",
+        )
+        for i in range(procesos)
+    ]
+    for proceso in lista:
+        proceso.start()
+    return lista, detener
+
+
+# Tareas
+
+
+@tarea("eliminar_usuario")
+def eliminar_usuario(id_usuario):
+    """
+    Elimina un usuario borrando antes sus favoritos por lotes.
+
+    Cada lote se confirma por separado para no bloquear la tabla de favoritos
+    con una única sentencia enorme. Si el trabajo se repite, continúa donde
+    quedó.
+    """
+    sesion = (
+        favoritos_shards.sesion_usuario(id_usuario)
+        if favoritos_shards.activo
+        else db.session
+    )
+    favoritos = 0
+    while True:
+        ids = [
+            id
+            for (id,) in sesion.query(Favorito.id)
+            .filter_by(id_usuario=id_usuario)
+            .limit(TAMANO_LOTE)
+        ]
+        if not ids:
+            break
+        registrar_bajas_favoritos(sesion, Favorito.id.in_(ids))
+        sesion.query(Favorito).filter(Favorito.id.in_(ids)).delete(
+            synchronize_session=False
+        )
+        sesion.commit()
+        favoritos += len(ids)
+
+    usuario = db.session.get(Usuario, id_usuario)
+    if usuario is not None:
+        db.session.delete(usuario)
+    return {"eliminado": usuario is not None, "favoritos": favoritos}
+
+
+@tarea("importar_canciones")
+def importar_canciones(canciones):
+    """
+    Crea canciones en una sola transacción y las indexa para detectar duplicados.
+
+    Al ser una única transacción, un fallo no deja canciones a medias; la
+    marca de `TrabajoAplicado` confirmada con ella evita que un reintento las
+    vuelva a crear.
+    """
+    creadas = []
+    for datos in canciones:
+        cancion = Cancion(
+            titulo=datos["titulo"],
+            artista=datos["artista"],
+            album=datos.get("album"),
+            duracion=datos.get("duracion"),
+            año=datos.get("año"),
+            genero=datos.get("genero"),
+        )
+        db.session.add(cancion)
+        creadas.append(cancion)
+    db.session.flush()
+    for cancion in creadas:
+        duplicados.indexar(cancion)
+    return {"importadas": len(creadas), "ids": [c.id for c in creadas]}
+
+
+@tarea("reconstruir_estadisticas")
+def reconstruir_estadisticas(id_usuario=None):
+    """Recalcula las estadísticas de usuario a partir de los favoritos."""
+    return {"usuarios": estadisticas.reconstruir(id_usuario)}
+
+
+@tarea("indexar_duplicados")
+def indexar_duplicados():
+    """Indexa las canciones que aún no tienen firma de duplicados."""
+    return {"indexadas": duplicados.indexar_pendientes()}
@@ -0,0 +1,126 @@
+"""
+Fábricas de datos sintéticos para las pruebas.
+
+Insertan con SQL masivo (`INSERT ... RETURNING` por lotes), por lo que sirven
+para sembrar decenas de miles de filas en poco tiempo. Al no pasar por las
+instancias de la sesión, no generan eventos ni actualizan datos derivados
+(estadísticas, firmas de duplicados); si una prueba los necesita, debe
+reconstruirlos (p. ej. con `estadisticas.reconstruir()`).
+
+Los datos son deterministas para una misma `semilla`. Deben llamarse dentro de
+un contexto de aplicación.
+"""
+
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from musica_api.extensions import db
+from musica_api.models import Cancion, Favorito, Usuario
+
+TAMANO_LOTE = 1000
+"""Filas por sentencia INSERT."""
+
+GENEROS = ("Rock", "Pop", "Jazz", "Salsa", "Cumbia", "Reggaetón", "Clásica")
+
+
+def _insertar(modelo, filas):
+    """Inserta filas por lotes y devuelve sus IDs en el mismo orden."""
+    ids = []
+    for inicio in range(0, len(filas), TAMANO_LOTE):
+        lote = filas[inicio : inicio + TAMANO_LOTE]
+        ids.extend(
+            db.session.scalars(
+                insert(modelo).returning(modelo.id, sort_by_parameter_order=True),
+                lote,
+            )
+        )
+    return ids
+
+
+def crear_usuarios(cantidad, prefijo="usuario"):
+    """
+    Crea usuarios sintéticos.
+
+    Args:
+        cantidad (int): Cantidad de usuarios
+        prefijo (str): Prefijo del nombre y del correo (deben ser únicos)
+
+    Returns:
+        list: IDs de los usuarios creados
+    """
+    return _insertar(
+        Usuario,
+        [
+            {"nombre": f"{prefijo.title()} {i}", "correo": f"{prefijo}{i}@test.com"}
+            for i in range(cantidad)
+        ],
+    )
+
+
+def crear_canciones(cantidad, semilla=0):
+    """
+    Crea canciones sintéticas con artistas, géneros, años y duraciones variados.
+
+    Args:
+        cantidad (int): Cantidad de canciones
+        semilla (int): Semilla de los valores aleatorios
+
+    Returns:
+        list: IDs de las canciones creadas
+    """
+    azar = random.Random(semilla)
+    return _insertar(
+        Cancion,
+        [
+            {
+                "titulo": f"Canción {i}",
+                "artista": f"Artista {azar.randrange(max(cantidad // 10, 1))}",
+                "album": f"Álbum {azar.randrange(max(cantidad // 5, 1))}",
+                "duracion": azar.randint(90, 420),
+                "año": azar.randint(1960, 2024),
+                "genero": azar.choice(GENEROS),
+            }
+            for i in range(cantidad)
+        ],
+    )
+
+
+def crear_favoritos(ids_usuarios, ids_canciones, por_usuario, semilla=0):
+    """
+    Marca canciones al azar como favoritas, sin repetir pares.
+
+    Las canciones se eligen con sesgo hacia las primeras de la lista, de modo
+    que haya canciones claramente más populares que otras. Las fechas de
+    marcado se reparten en los últimos 30 días.
+
+    Args:
+        ids_usuarios (list): Usuarios que marcan favoritos
+        ids_canciones (list): Canciones elegibles
+        por_usuario (int): Favoritos por usuario
+        semilla (int): Semilla de los valores aleatorios
+
+    Returns:
+        int: Cantidad de favoritos creados
+    """
+    azar = random.Random(semilla)
+    ahora = datetime.utcnow()
+    por_usuario = min(por_usuario, len(ids_canciones))
+    pesos = [1 / (posicion + 1) for posicion in range(len(ids_canciones))]
+    filas = []
+    for id_usuario in ids_usuarios:
+        elegidas = set()
+        while len(elegidas) < por_usuario:
+            elegidas.update(
+                azar.choices(ids_canciones, pesos, k=por_usuario - len(elegidas))
+            )
+        filas.extend(
+            {
+                "id_usuario": id_usuario,
+                "id_cancion": id_cancion,
+                "fecha_marcado": ahora - timedelta(minutes=azar.randrange(43200)),
+            }
+            for id_cancion in sorted(elegidas)
+        )
+    return len(_insertar(Favorito, filas))
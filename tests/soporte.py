@@ -0,0 +1,124 @@
+"""
+Infraestructura compartida por las pruebas.
+
+La aplicación y el esquema se crean una sola vez por proceso de pruebas, sobre
+una base SQLite en memoria. Cada prueba de `PruebaTransaccional` se ejecuta
+dentro de una transacción de una conexión propia: las sesiones de la prueba
+(incluidas las de cada petición del cliente de pruebas) trabajan sobre
+SAVEPOINTs de esa transacción, y al terminar la prueba se revierte todo.
+"""
+
+import unittest
+
+from flask.globals import app_ctx
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from musica_api import create_app
+from musica_api.cache import cache_identidad
+from musica_api.extensions import db
+from musica_api.tendencias import tendencias
+
+_aplicacion = None
+
+
+class _SesionPrueba(Session):
+    """
+    Sesión que usa la conexión de la prueba en curso para la base principal.
+
+    Los modelos de otras bases (p. ej. la cola de trabajos) usan su engine.
+    """
+
+    def get_bind(self, *args, **kwargs):
+        bind = super().get_bind(*args, **kwargs)
+        return self.bind if bind is self.bind.engine else bind
+
+
+def _contexto_actual():
+    """Identifica el contexto de aplicación activo (una sesión por contexto)."""
+    return id(app_ctx._get_current_object())
+
+
+def _habilitar_savepoints(engine):
+    """
+    Hace que pysqlite respete BEGIN y SAVEPOINT.
+
+    pysqlite abre y confirma transacciones por su cuenta, lo que rompe los
+    SAVEPOINT. Se desactiva ese comportamiento y SQLAlchemy emite el BEGIN.
+    """
+    with engine.connect() as conexion:
+        conexion.connection.driver_connection.isolation_level = None
+
+    @event.listens_for(engine, "connect")
+    def sin_transacciones_implicitas(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def emitir_begin(conexion):
+        conexion.exec_driver_sql("BEGIN")
+
+
+def aplicacion():
+    """
+    Obtiene la aplicación compartida por las pruebas, creándola la primera vez.
+
+    Returns:
+        Flask: Aplicación de pruebas con el esquema ya creado
+    """
+    global _aplicacion
+    if _aplicacion is None:
+        _aplicacion = create_app(
+            "testing",
+            config_extra={
+                "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+                "SQLALCHEMY_BINDS": {"trabajos": "sqlite:///:memory:"},
+            },
+        )
+        with _aplicacion.app_context():
+            _habilitar_savepoints(db.engine)
+    return _aplicacion
+
+
+class PruebaTransaccional(unittest.TestCase):
+    """
+    Clase base para pruebas sobre la aplicación compartida.
+
+    Cada prueba ve la base vacía (o con lo que cree `_crear_datos_prueba`) y
+    sus cambios se revierten al terminar, aunque los recursos hagan commit.
+    """
+
+    def setUp(self):
+        """Abre la transacción de la prueba y reinicia el estado en memoria."""
+        self.app = aplicacion()
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            self._conexion = db.engine.connect()
+        self._transaccion = self._conexion.begin()
+        self._sesion_original = db.session
+        fabrica = sessionmaker(
+            class_=_SesionPrueba,
+            db=db,
+            bind=self._conexion,
+            join_transaction_mode="create_savepoint",
+        )
+        db.session = scoped_session(fabrica, scopefunc=_contexto_actual)
+
+        # Cachés por proceso que no deben sobrevivir a la reversión
+        cache_identidad.init_app(self.app)
+        tendencias.init_app(self.app)
+
+        with self.app.app_context():
+            self._crear_datos_prueba()
+
+    def tearDown(self):
+        """Revierte todo lo que hizo la prueba."""
+        with self.app.app_context():
+            db.session.remove()
+        db.session = self._sesion_original
+        self._transaccion.rollback()
+        self._conexion.close()
+
+    def _crear_datos_prueba(self):
+        """Crea los datos iniciales de cada prueba (ninguno por defecto)."""
@@ -3,37 +3,57 @@ Módulo de pruebas para la API.
 Contiene pruebas unitarias y de integración para verificar el funcionamiento correcto de la API.
 """
 
+import gzip
+import os
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
 import unittest
 import json
+from collections import Counter
+from sqlalchemy import delete, event, text
+from werkzeug.http import parse_accept_header
 from musica_api import create_app
-from musica_api.extensions import db
-from musica_api.models import Usuario, Cancion, Favorito
+from musica_api.cache import MapaBitsIds, cache_identidad
+from musica_api.codificacion import elegir_codificacion, msgpack
+from musica_api.duplicados import (
+    agrupar_duplicados,
+    calcular_firma,
+    normalizar,
+    similitud,
+)
+from musica_api.estadisticas import reconstruir
+from musica_api.eventos import registrar_bajas
+from musica_api.instantanea import Mapa, escribir, instantanea
+from musica_api.perfilado import Perfilador
+from musica_api.playlists import (
+    rango_entre,
+    rangos_uniformes,
+    rebalancear,
+    rebalanceador,
+)
+from musica_api.tendencias import ContadorTendencias
+from musica_api import perfilado, resources, trabajos
+from musica_api.extensions import db, tablas_sin_cascada
+from musica_api.models import (
+    Usuario,
+    Cancion,
+    Evento,
+    Favorito,
+    Playlist,
+    PlaylistItem,
+    Trabajo,
+)
+from fabricas import crear_canciones, crear_favoritos, crear_usuarios
+from soporte import PruebaTransaccional
 
 
-class TestAPI(unittest.TestCase):
+class TestAPI(PruebaTransaccional):
     """Clase base para las pruebas de la API."""
 
-    def setUp(self):
-        """Prepara el entorno de prueba antes de cada test."""
-        # Configurar la aplicación para pruebas
-        self.app = create_app()
-        self.app.config["TESTING"] = True
-        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
-
-        # Crear un cliente de prueba
-        self.client = self.app.test_client()
-
-        # Crear contexto de aplicación
-        with self.app.app_context():
-            db.create_all()
-            self._crear_datos_prueba()
-
-    def tearDown(self):
-        """Limpia el entorno después de cada test."""
-        with self.app.app_context():
-            db.session.remove()
-            db.drop_all()
-
     def _crear_datos_prueba(self):
         """Crea datos de prueba en la base de datos."""
         # Crear usuarios
@@ -134,5 +154,1686 @@ class TestFavoritos(TestAPI):
         self.assertEqual(data["canciones_favoritas"][0]["titulo"], "Canción Test 1")
 
 
+class TestFavoritosSharding(unittest.TestCase):
+    """Pruebas de los favoritos repartidos en varias bases SQLite."""
+
+    def setUp(self):
+        """Crea una aplicación con tres particiones de favoritos en archivos temporales."""
+        self.directorio = tempfile.TemporaryDirectory()
+        shards = [
+            "sqlite:///" + os.path.join(self.directorio.name, f"favoritos_{i}.db")
+            for i in range(3)
+        ]
+        self.app = create_app(
+            config_extra={
+                "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+                "SQLALCHEMY_BINDS": {"trabajos": "sqlite:///:memory:"},
+                "FAVORITOS_SHARDS": shards,
+            }
+        )
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            db.session.add_all(
+                [
+                    Usuario(nombre=f"Usuario {i}", correo=f"u{i}@test.com")
+                    for i in range(6)
+                ]
+                + [Cancion(titulo="Canción A", artista="Artista A")]
+                + [Cancion(titulo="Canción B", artista="Artista B")]
+            )
+            db.session.commit()
+
+        # Todos los usuarios marcan la canción 1; los tres primeros, también la 2
+        for id_usuario in range(1, 7):
+            self.client.post(f"/api/usuarios/{id_usuario}/favoritos/1")
+        for id_usuario in range(1, 4):
+            self.client.post(f"/api/usuarios/{id_usuario}/favoritos/2")
+
+    def tearDown(self):
+        """Elimina las bases temporales de las particiones."""
+        self.directorio.cleanup()
+
+    def test_favoritos_repartidos(self):
+        """Los favoritos se guardan en la partición de su usuario."""
+        with self.app.app_context():
+            sesiones = self.app.extensions["favoritos_shards"]
+            por_particion = [sesion.query(Favorito).count() for sesion in sesiones]
+            self.assertEqual(sum(por_particion), 9)
+            self.assertGreater(len([n for n in por_particion if n]), 1)
+            self.assertEqual(db.session.query(Favorito).count(), 0)
+
+    def test_listar_favoritos_usuario(self):
+        """El listado de favoritos lee de la partición correcta."""
+        response = self.client.get("/api/usuarios/2/favoritos")
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        titulos = [c["titulo"] for c in data["canciones_favoritas"]]
+        self.assertEqual(titulos, ["Canción A", "Canción B"])
+
+    def test_populares_suma_particiones(self):
+        """El ranking de popularidad suma los conteos de todas las particiones."""
+        response = self.client.get("/api/canciones/populares")
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual([(c["id"], c["favoritos"]) for c in data], [(1, 6), (2, 3)])
+
+    def test_favorito_por_id_global(self):
+        """El ID global de un favorito permite obtenerlo y eliminarlo."""
+        response = self.client.post(
+            "/api/usuarios",
+            data=json.dumps({"id_usuario": 5, "id_cancion": 2}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+        id_favorito = json.loads(response.data)["id"]
+
+        response = self.client.get(f"/api/favoritos/{id_favorito}")
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual((data["id_usuario"], data["id_cancion"]), (5, 2))
+        self.assertEqual(data["usuario"]["nombre"], "Usuario 4")
+
+        response = self.client.delete(f"/api/favoritos/{id_favorito}")
+        self.assertEqual(response.status_code, 204)
+        response = self.client.get(f"/api/favoritos/{id_favorito}")
+        self.assertEqual(response.status_code, 404)
+
+    def test_reconstruir_estadisticas(self):
+        """La reconstrucción lee los favoritos de todas las particiones."""
+        with self.app.app_context():
+            self.assertEqual(reconstruir(), 6)
+        for id_usuario, canciones in ((1, 2), (6, 1)):
+            response = self.client.get(f"/api/usuarios/{id_usuario}/estadisticas")
+            self.assertEqual(json.loads(response.data)["canciones"], canciones)
+
+    def test_eliminar_cancion_limpia_particiones(self):
+        """Al eliminar una canción se borran sus favoritos en todas las particiones."""
+        response = self.client.delete("/api/canciones/1")
+        self.assertEqual(response.status_code, 204)
+        response = self.client.get("/api/canciones/populares")
+        data = json.loads(response.data)
+        self.assertEqual([(c["id"], c["favoritos"]) for c in data], [(2, 3)])
+        # Las bajas de cada partición se publican en el registro de cambios
+        with self.app.app_context():
+            bajas = Evento.query.filter_by(tabla="favorito", operacion="eliminar")
+            self.assertEqual(bajas.count(), 6)
+
+
+class TestCacheIdentidad(PruebaTransaccional):
+    """Pruebas de la caché de existencia de usuarios y canciones."""
+
+    def _crear_datos_prueba(self):
+        """Crea un usuario y una canción y registra las consultas posteriores."""
+        db.session.add_all(
+            [
+                Usuario(nombre="Usuario", correo="usuario@test.com"),
+                Cancion(titulo="Canción", artista="Artista"),
+            ]
+        )
+        db.session.commit()
+        self.consultas = []
+        event.listen(db.engine, "before_cursor_execute", self._registrar_consulta)
+        self.addCleanup(
+            event.remove, db.engine, "before_cursor_execute", self._registrar_consulta
+        )
+
+    def _registrar_consulta(self, conn, cursor, statement, *args):
+        self.consultas.append(statement)
+
+    def test_mapa_bits(self):
+        """El mapa de bits agrega, descarta y acota los IDs."""
+        ids = MapaBitsIds(max_id=1000)
+        self.assertTrue(ids.agregar(7))
+        self.assertFalse(ids.agregar(1001))
+        self.assertIn(7, ids)
+        self.assertNotIn(8, ids)
+        ids.descartar(7)
+        self.assertNotIn(7, ids)
+        self.assertEqual(len(ids), 0)
+
+    def test_existencia_sin_consultar_usuario_ni_cancion(self):
+        """Tras la carga inicial, marcar un favorito no consulta nada antes de buscarlo."""
+        self.app.config["CACHE_IDENTIDAD_REVISION"] = 60
+        self.addCleanup(self.app.config.__setitem__, "CACHE_IDENTIDAD_REVISION", 1.0)
+        self.client.post("/api/usuarios/1/favoritos/1")
+        self.client.delete("/api/usuarios/1/favoritos/1")
+        self.consultas.clear()
+
+        response = self.client.post("/api/usuarios/1/favoritos/1")
+        self.assertEqual(response.status_code, 201)
+        # Sin contar el control de transacciones de la prueba (BEGIN, SAVEPOINT)
+        consultas = [c for c in self.consultas if c.startswith(("SELECT", "INSERT"))]
+        self.assertIn("FROM favorito", consultas[0])
+
+    def test_coherencia_con_altas_y_bajas(self):
+        """Las canciones creadas o eliminadas se reflejan en la caché."""
+        self.client.post("/api/usuarios/1/favoritos/1")
+        response = self.client.post(
+            "/api/canciones",
+            data=json.dumps({"titulo": "Nueva", "artista": "Artista"}),
+            content_type="application/json",
+        )
+        id_cancion = json.loads(response.data)["id"]
+
+        response = self.client.post(f"/api/usuarios/1/favoritos/{id_cancion}")
+        self.assertEqual(response.status_code, 201)
+
+        self.client.delete(f"/api/canciones/{id_cancion}")
+        response = self.client.post(f"/api/usuarios/1/favoritos/{id_cancion}")
+        self.assertEqual(response.status_code, 404)
+
+    def test_bajas_de_otro_proceso(self):
+        """Las bajas de otro proceso se detectan al escribir o al revisar el registro."""
+        self.app.config["CACHE_IDENTIDAD_REVISION"] = 60
+        self.addCleanup(self.app.config.__setitem__, "CACHE_IDENTIDAD_REVISION", 1.0)
+        self.client.post("/api/usuarios/1/favoritos/1")
+        with self.app.app_context():
+            # Simula otro proceso: borra y registra la baja sin avisar a la caché
+            db.session.execute(delete(Cancion).where(Cancion.id == 1))
+            registrar_bajas("cancion", [1])
+            db.session.commit()
+
+        # Antes de la revisión la caché acierta, pero la clave foránea lo impide
+        response = self.client.post("/api/usuarios/1/favoritos/1")
+        self.assertEqual(response.status_code, 404)
+        with self.app.app_context():
+            self.assertEqual(Favorito.query.count(), 0)
+
+            self.app.config["CACHE_IDENTIDAD_REVISION"] = 0
+            self.assertFalse(cache_identidad.existe(Cancion, 1))
+
+    def test_id_no_entero(self):
+        """Un ID que no es entero no existe y el endpoint responde 400."""
+        with self.app.app_context():
+            for id in ("1", None, 1.0, True):
+                self.assertFalse(cache_identidad.existe(Cancion, id))
+        response = self.client.post(
+            "/api/usuarios",
+            data=json.dumps({"id_usuario": "1", "id_cancion": 1}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_metricas(self):
+        """El endpoint de métricas informa memoria y aciertos por modelo."""
+        self.client.post("/api/usuarios/1/favoritos/1")
+        response = self.client.get("/api/cache/identidad")
+        self.assertEqual(response.status_code, 200)
+        data = {m["modelo"]: m for m in json.loads(response.data)}
+        self.assertEqual(data["Usuario"]["ids"], 1)
+        self.assertEqual(data["Cancion"]["aciertos"], 1)
+        self.assertGreater(data["Cancion"]["memoria_bytes"], 0)
+
+
+class TestEventos(PruebaTransaccional):
+    """Pruebas del registro de cambios (change feed)."""
+
+    def _crear_datos_prueba(self):
+        """Crea un usuario."""
+        db.session.add(Usuario(nombre="Usuario", correo="usuario@test.com"))
+        db.session.commit()
+
+    def _leer(self, desde=0):
+        response = self.client.get(f"/api/eventos?desde={desde}")
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.data)
+
+    def test_registro_de_cambios(self):
+        """Las altas, modificaciones y bajas se registran en orden."""
+        inicio = self._leer()["ultimo"]
+        self.client.post(
+            "/api/canciones",
+            data=json.dumps({"titulo": "Canción", "artista": "Artista"}),
+            content_type="application/json",
+        )
+        self.client.put(
+            "/api/canciones/1",
+            data=json.dumps({"titulo": "Canción editada"}),
+            content_type="application/json",
+        )
+        self.client.post("/api/usuarios/1/favoritos/1")
+        self.client.delete("/api/canciones/1")
+
+        data = self._leer(inicio)
+        cambios = [(e["tabla"], e["operacion"]) for e in data["eventos"]]
+        self.assertEqual(
+            cambios,
+            [
+                ("cancion", "crear"),
+                ("cancion", "actualizar"),
+                ("favorito", "crear"),
+                ("favorito", "eliminar"),
+                ("cancion", "eliminar"),
+            ],
+        )
+        self.assertEqual(data["eventos"][1]["datos"]["titulo"], "Canción editada")
+        # La baja en cascada describe el favorito igual que su alta
+        self.assertEqual(data["eventos"][3]["datos"], data["eventos"][2]["datos"])
+
+        # Reanudar desde la última secuencia solo devuelve cambios nuevos
+        self.assertEqual(self._leer(data["ultimo"])["eventos"], [])
+
+    def test_long_poll_sin_cambios(self):
+        """Sin cambios nuevos, la espera vence y devuelve la misma secuencia."""
+        ultimo = self._leer()["ultimo"]
+        response = self.client.get(f"/api/eventos?desde={ultimo}&espera=0.2")
+        data = json.loads(response.data)
+        self.assertEqual(data, {"eventos": [], "ultimo": ultimo})
+
+    def test_stream_reanudable(self):
+        """El flujo SSE usa la secuencia como ID y respeta Last-Event-ID."""
+        response = self.client.get("/api/eventos/stream?espera=0")
+        self.assertEqual(response.mimetype, "text/event-stream")
+        cuerpo = response.get_data(as_text=True)
+        self.assertIn("id: 1\nevent: usuario\n", cuerpo)
+
+        response = self.client.get(
+            "/api/eventos/stream?espera=0", headers={"Last-Event-ID": "1"}
+        )
+        self.assertNotIn("id: 1\n", response.get_data(as_text=True))
+
+
+class TestCodificacion(PruebaTransaccional):
+    """Pruebas de compresión y negociación de formato de las respuestas."""
+
+    def _crear_datos_prueba(self):
+        """Crea un catálogo de 100 canciones."""
+        db.session.add_all(
+            [
+                Cancion(titulo=f"Canción {i}", artista="Artista", genero="Rock")
+                for i in range(100)
+            ]
+        )
+        db.session.commit()
+
+    def test_gzip_en_respuestas_grandes(self):
+        """Las respuestas grandes se comprimen si el cliente acepta gzip."""
+        url = "/api/canciones?per_page=100"
+        plano = self.client.get(url)
+        response = self.client.get(url, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+        self.assertLess(len(response.data), len(plano.data))
+        self.assertEqual(gzip.decompress(response.data), plano.data)
+
+    def test_calidad_de_las_codificaciones(self):
+        """Gana la codificación con mayor q; el orden del servidor solo desempata."""
+        compresores = dict.fromkeys(("zstd", "br", "gzip"))
+        casos = {
+            "gzip;q=1, br;q=0.1": "gzip",
+            "gzip, br, zstd": "zstd",
+            "gzip;q=0.5, *;q=0.8": "zstd",
+            "br;q=0.9, zstd;q=0": "br",
+            "identity": None,
+        }
+        for cabecera, esperada in casos.items():
+            aceptadas = parse_accept_header(cabecera)
+            self.assertEqual(elegir_codificacion(aceptadas, compresores), esperada)
+
+        url = "/api/canciones?per_page=100"
+        response = self.client.get(url, headers={"Accept-Encoding": "gzip, br;q=0.1"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+
+    def test_respuestas_pequenas_sin_comprimir(self):
+        """Las respuestas por debajo del umbral no se comprimen."""
+        response = self.client.get("/api/ping", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", response.headers)
+
+    @unittest.skipUnless(msgpack, "msgpack no está instalado")
+    def test_msgpack_mismo_esquema(self):
+        """MessagePack devuelve los mismos datos que JSON."""
+        url = "/api/canciones/buscar?genero=Rock"
+        response = self.client.get(url, headers={"Accept": "application/msgpack"})
+        self.assertEqual(response.mimetype, "application/msgpack")
+        self.assertEqual(
+            msgpack.unpackb(response.data), json.loads(self.client.get(url).data)
+        )
+
+
+class TestCamposSeleccionados(TestAPI):
+    """Pruebas del parámetro `fields` en canciones y usuarios."""
+
+    def test_listar_canciones_con_campos(self):
+        """El listado devuelve solo los campos pedidos."""
+        response = self.client.get("/api/canciones?fields=id,titulo")
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data[0], {"id": 1, "titulo": "Canción Test 1"})
+
+    def test_consulta_restringida_a_columnas(self):
+        """Solo se leen de la base las columnas solicitadas."""
+        consultas = []
+        with self.app.app_context():
+            engine = db.engine
+        escuchar = lambda *args: consultas.append(args[2])  # noqa: E731
+        event.listen(engine, "before_cursor_execute", escuchar)
+        try:
+            response = self.client.get("/api/canciones/1?fields=titulo")
+        finally:
+            event.remove(engine, "before_cursor_execute", escuchar)
+        self.assertEqual(json.loads(response.data), {"titulo": "Canción Test 1"})
+        select = [c for c in consultas if "FROM cancion" in c][0]
+        self.assertNotIn("cancion.album", select)
+
+    def test_buscar_y_usuario_con_campos(self):
+        """La búsqueda y el detalle de usuario también admiten `fields`."""
+        response = self.client.get("/api/canciones/buscar?genero=Pop&fields=artista")
+        self.assertEqual(json.loads(response.data), [{"artista": "Artista Test 2"}])
+        response = self.client.get("/api/usuarios/1?fields=id,correo")
+        self.assertEqual(
+            json.loads(response.data), {"id": 1, "correo": "usuario1@test.com"}
+        )
+
+    def test_campo_desconocido(self):
+        """Los campos que no existen en el modelo se rechazan."""
+        response = self.client.get("/api/canciones?fields=id,letra")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("letra", json.loads(response.data)["message"])
+
+
+class TestEliminacion(TestAPI):
+    """Pruebas del borrado en cascada y de la eliminación en lote."""
+
+    def test_eliminar_usuario_borra_favoritos_en_la_base(self):
+        """La base de datos borra los favoritos sin que el ORM los cargue."""
+        consultas = []
+        with self.app.app_context():
+            engine = db.engine
+        escuchar = lambda *args: consultas.append(args[2])  # noqa: E731
+        event.listen(engine, "before_cursor_execute", escuchar)
+        try:
+            response = self.client.delete("/api/usuarios/1")
+        finally:
+            event.remove(engine, "before_cursor_execute", escuchar)
+        self.assertEqual(response.status_code, 204)
+        # Solo se leen para registrar sus bajas, dentro de la misma sentencia
+        self.assertFalse(
+            [c for c in consultas if "FROM favorito" in c and "INSERT" not in c]
+        )
+        with self.app.app_context():
+            self.assertEqual(Favorito.query.count(), 0)
+
+    def test_eliminar_canciones_por_filtro(self):
+        """La eliminación en lote por filtro borra canciones y sus favoritos."""
+        response = self.client.post(
+            "/api/canciones/eliminar",
+            data=json.dumps({"genero": "Rock"}),
+            content_type="application/json",
+        )
+        self.assertEqual(json.loads(response.data), {"eliminados": 1})
+        with self.app.app_context():
+            self.assertEqual(Cancion.query.count(), 1)
+            self.assertEqual(Favorito.query.count(), 0)
+
+    def test_eliminar_usuarios_por_ids(self):
+        """La eliminación en lote por IDs actualiza la caché de identidad."""
+        response = self.client.post("/api/usuarios/2/favoritos/2")
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.post(
+            "/api/usuarios/eliminar",
+            data=json.dumps({"ids": [1, 2, 99]}),
+            content_type="application/json",
+        )
+        self.assertEqual(json.loads(response.data), {"eliminados": 2})
+        response = self.client.post("/api/usuarios/2/favoritos/2")
+        self.assertEqual(response.status_code, 404)
+
+    def test_eliminar_sin_criterios(self):
+        """Sin criterios no se elimina nada."""
+        response = self.client.post(
+            "/api/canciones/eliminar",
+            data=json.dumps({}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class TestCoalescencia(unittest.TestCase):
+    """Pruebas de la coalescencia de peticiones GET idénticas."""
+
+    def setUp(self):
+        """Crea una aplicación cuyas consultas tardan 0,3 segundos."""
+        self.app = create_app(
+            config_extra={
+                "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+                "SQLALCHEMY_BINDS": {"trabajos": "sqlite:///:memory:"},
+            }
+        )
+        with self.app.app_context():
+            db.session.add(Cancion(titulo="Viral", artista="Artista", genero="Pop"))
+            db.session.commit()
+            event.listen(
+                db.engine, "before_cursor_execute", lambda *args: time.sleep(0.3)
+            )
+
+    def test_peticiones_identicas_concurrentes(self):
+        """Las peticiones idénticas simultáneas comparten un solo cómputo."""
+        respuestas = []
+
+        def pedir():
+            respuesta = self.app.test_client().get("/api/canciones/buscar?genero=Pop")
+            respuestas.append((respuesta.status_code, respuesta.data))
+
+        hilos = [threading.Thread(target=pedir) for _ in range(8)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(len(set(respuestas)), 1)
+        self.assertEqual(respuestas[0][0], 200)
+        data = json.loads(self.app.test_client().get("/api/coalescencia").data)
+        self.assertEqual(data["ejecutadas"] + data["coalescidas"], 8)
+        self.assertGreater(data["coalescidas"], 0)
+
+    def test_peticiones_distintas_no_se_comparten(self):
+        """Peticiones con parámetros distintos se ejecutan por separado."""
+        cliente = self.app.test_client()
+        cliente.get("/api/canciones/buscar?genero=Pop")
+        cliente.get("/api/canciones/buscar?genero=Rock")
+        data = json.loads(cliente.get("/api/coalescencia").data)
+        self.assertEqual(data, {"ejecutadas": 2, "coalescidas": 0, "proporcion": 0.0})
+
+
+class TestTendencias(TestAPI):
+    """Pruebas de las canciones en tendencia por ventanas de tiempo."""
+
+    def test_ventanas_y_compactacion(self):
+        """Cada ventana cuenta solo sus cubetas y las vencidas se descartan."""
+        ahora = datetime(2025, 6, 1, 12, 0)
+        segundos = (ahora - datetime(1970, 1, 1)).total_seconds()
+        contador = ContadorTendencias(ahora=segundos)
+        contador.registrar(1, 1, ahora - timedelta(minutes=10))
+        contador.registrar(2, 1, ahora - timedelta(hours=3))
+        contador.registrar(2, 1, ahora - timedelta(hours=5))
+        contador.registrar(3, 1, ahora - timedelta(days=3))
+
+        self.assertEqual(contador.top("1h", 10, segundos), [(1, 1)])
+        self.assertEqual(contador.top("24h", 10, segundos), [(2, 2), (1, 1)])
+        self.assertEqual(contador.top("7d", 10, segundos), [(2, 2), (1, 1), (3, 1)])
+
+        # Cinco días después solo queda la marca más antigua fuera de toda ventana
+        despues = segundos + 5 * 24 * 3600
+        self.assertEqual(contador.top("7d", 10, despues), [(2, 2), (1, 1)])
+        self.assertEqual(contador.top("24h", 10, despues), [])
+        self.assertLessEqual(contador.cubetas, 168)
+
+    def test_endpoint_tendencias(self):
+        """Las marcas y desmarcas se reflejan en el endpoint de tendencias."""
+        self.client.post("/api/usuarios/2/favoritos/2")
+        self.client.post("/api/usuarios/1/favoritos/2")
+        self.client.delete("/api/usuarios/1/favoritos/1")
+
+        response = self.client.get("/api/canciones/tendencias?ventana=1h")
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual([(c["id"], c["favoritos"]) for c in data], [(2, 2)])
+
+    def test_carga_y_bajas_en_lote(self):
+        """La carga no cuenta dos veces y las bajas en lote restan sus favoritos."""
+        # Marcas anteriores a la primera lectura: solo las cuenta la carga
+        self.client.post("/api/usuarios/1/favoritos/2")
+        self.client.post("/api/usuarios/2/favoritos/2")
+        response = self.client.get("/api/canciones/tendencias?ventana=1h")
+        data = json.loads(response.data)
+        self.assertEqual([(c["id"], c["favoritos"]) for c in data], [(2, 2), (1, 1)])
+
+        # Baja en lote de un usuario: sus favoritos se borran en cascada
+        self.client.post(
+            "/api/usuarios/eliminar",
+            data=json.dumps({"ids": [1]}),
+            content_type="application/json",
+        )
+        response = self.client.get("/api/canciones/tendencias?ventana=1h")
+        data = json.loads(response.data)
+        self.assertEqual([(c["id"], c["favoritos"]) for c in data], [(2, 1)])
+
+    def test_ventana_no_valida(self):
+        """Las ventanas no definidas se rechazan."""
+        response = self.client.get("/api/canciones/tendencias?ventana=2h")
+        self.assertEqual(response.status_code, 400)
+
+
+class TestEstadisticas(TestAPI):
+    """Pruebas de las estadísticas de favoritos por usuario."""
+
+    def setUp(self):
+        super().setUp()
+        # El favorito de los datos de prueba se creó fuera de la API
+        with self.app.app_context():
+            reconstruir()
+
+    def _estadisticas(self, id_usuario=1):
+        response = self.client.get(f"/api/usuarios/{id_usuario}/estadisticas")
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.data)
+
+    def test_resumen(self):
+        """El endpoint devuelve totales y distribuciones del usuario."""
+        data = self._estadisticas()
+        self.assertEqual(data["usuario"]["id"], 1)
+        self.assertEqual(data["canciones"], 1)
+        self.assertEqual(data["duracion_segundos"], 180)
+        self.assertEqual(data["duracion_total"], "03:00")
+        self.assertEqual(data["generos"], [{"nombre": "Rock", "canciones": 1}])
+        self.assertEqual(data["decadas"], [{"nombre": "2020s", "canciones": 1}])
+        self.assertEqual(
+            data["artistas_principales"],
+            [{"nombre": "Artista Test 1", "canciones": 1}],
+        )
+
+    def test_marcar_y_desmarcar(self):
+        """Marcar y desmarcar favoritos ajusta los agregados."""
+        self.client.post("/api/usuarios/1/favoritos/2")
+        data = self._estadisticas()
+        self.assertEqual(data["canciones"], 2)
+        self.assertEqual(data["duracion_total"], "07:00")
+        self.assertEqual(len(data["generos"]), 2)
+
+        self.client.delete("/api/usuarios/1/favoritos/1")
+        data = self._estadisticas()
+        self.assertEqual(data["canciones"], 1)
+        self.assertEqual(data["generos"], [{"nombre": "Pop", "canciones": 1}])
+
+    def test_editar_y_eliminar_cancion(self):
+        """Editar o eliminar una canción actualiza a quienes la tienen como favorita."""
+        self.client.post("/api/usuarios/2/favoritos/1")
+        self.client.put(
+            "/api/canciones/1",
+            data=json.dumps({"genero": "Jazz", "año": 1995, "duracion": 200}),
+            content_type="application/json",
+        )
+        for id_usuario in (1, 2):
+            data = self._estadisticas(id_usuario)
+            self.assertEqual(data["generos"], [{"nombre": "Jazz", "canciones": 1}])
+            self.assertEqual(data["decadas"], [{"nombre": "1990s", "canciones": 1}])
+            self.assertEqual(data["duracion_segundos"], 200)
+
+        self.client.delete("/api/canciones/1")
+        data = self._estadisticas(2)
+        self.assertEqual(data["canciones"], 0)
+        self.assertEqual(data["generos"], [])
+
+    def test_eliminar_en_lote_descuenta(self):
+        """El borrado en lote resta las canciones a todos sus usuarios."""
+        self.client.post("/api/usuarios/1/favoritos/2")
+        self.client.post("/api/usuarios/2/favoritos/2")
+        self.client.post(
+            "/api/canciones/eliminar",
+            data=json.dumps({"ids": [2]}),
+            content_type="application/json",
+        )
+        for id_usuario, canciones in ((1, 1), (2, 0)):
+            self.assertEqual(self._estadisticas(id_usuario)["canciones"], canciones)
+        self.assertEqual(
+            self._estadisticas(1)["generos"], [{"nombre": "Rock", "canciones": 1}]
+        )
+
+    def test_reconstruir_coincide_con_incremental(self):
+        """Reconstruir desde los favoritos da los mismos agregados."""
+        self.client.post("/api/usuarios/1/favoritos/2")
+        self.client.post("/api/usuarios/2/favoritos/2")
+        antes = [self._estadisticas(i) for i in (1, 2)]
+
+        resultado = self.app.test_cli_runner().invoke(args=["reconstruir-estadisticas"])
+        self.assertIn("2 usuario(s)", resultado.output)
+        self.assertEqual([self._estadisticas(i) for i in (1, 2)], antes)
+
+    def test_usuario_inexistente(self):
+        """Las estadísticas de un usuario inexistente devuelven 404."""
+        response = self.client.get("/api/usuarios/99/estadisticas")
+        self.assertEqual(response.status_code, 404)
+
+
+class TestDuplicados(TestAPI):
+    """Pruebas de la detección de canciones casi duplicadas."""
+
+    def _crear(self, titulo, artista):
+        response = self.client.post(
+            "/api/canciones",
+            data=json.dumps({"titulo": titulo, "artista": artista}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+        return json.loads(response.data)
+
+    def test_normalizar(self):
+        """La normalización ignora mayúsculas, acentos y calificadores."""
+        self.assertEqual(
+            normalizar("Canción de Amor (Remastered 2011)"), "cancion-de-amor"
+        )
+        self.assertEqual(normalizar("CANCION DE AMOR [Live]"), "cancion-de-amor")
+
+    def test_firma_estima_similitud(self):
+        """Firmas de textos equivalentes coinciden y las de textos distintos no."""
+        firma = calcular_firma("Bohemian Rhapsody", "Queen")
+        self.assertEqual(
+            similitud(firma, calcular_firma("Bohemian Rhapsody (Remastered)", "QUEEN")),
+            1.0,
+        )
+        self.assertLess(
+            similitud(firma, calcular_firma("Yesterday", "The Beatles")), 0.3
+        )
+
+    def test_crear_senala_duplicados(self):
+        """Al crear una canción se señalan las existentes que la duplican."""
+        original = self._crear("Canción de Amor", "Los Ejemplos")
+        self.assertEqual(original["posibles_duplicados"], [])
+
+        copia = self._crear("CANCION DE AMOR (Remastered)", "Los Ejemplos")
+        self.assertEqual(
+            [d["id"] for d in copia["posibles_duplicados"]], [original["id"]]
+        )
+        self.assertEqual(copia["posibles_duplicados"][0]["similitud"], 1.0)
+
+        distinta = self._crear("Otra Canción", "Otro Artista")
+        self.assertEqual(distinta["posibles_duplicados"], [])
+
+        response = self.client.get(f"/api/canciones/{original['id']}/duplicados")
+        self.assertEqual([d["id"] for d in json.loads(response.data)], [copia["id"]])
+
+    def test_editar_reindexa(self):
+        """Editar el título actualiza la firma de la canción."""
+        original = self._crear("Canción de Amor", "Los Ejemplos")
+        otra = self._crear("Otra Canción", "Los Ejemplos")
+        self.client.put(
+            f"/api/canciones/{otra['id']}",
+            data=json.dumps({"titulo": "Canción de amor"}),
+            content_type="application/json",
+        )
+        response = self.client.get(f"/api/canciones/{original['id']}/duplicados")
+        self.assertEqual([d["id"] for d in json.loads(response.data)], [otra["id"]])
+
+    def test_cubetas_grandes_se_ignoran(self):
+        """Las cubetas con más canciones que el máximo no se comparan par a par."""
+        ids = [self._crear("Intro", "Varios")["id"] for _ in range(3)]
+        with self.app.app_context():
+            self.assertIn(ids, agrupar_duplicados())
+            self.app.config["DUPLICADOS_CUBETA_MAXIMA"] = 2
+            self.addCleanup(
+                self.app.config.__setitem__, "DUPLICADOS_CUBETA_MAXIMA", 100
+            )
+            self.assertNotIn(ids, agrupar_duplicados())
+
+    def test_reporte_indexa_y_agrupa(self):
+        """El reporte indexa las canciones cargadas fuera de la API y las agrupa."""
+        with self.app.app_context():
+            db.session.add_all(
+                [
+                    Cancion(titulo="Canción Test 1 (Live)", artista="Artista Test 1"),
+                    Cancion(titulo="canción test 1", artista="ARTISTA TEST 1"),
+                ]
+            )
+            db.session.commit()
+
+        resultado = self.app.test_cli_runner().invoke(args=["reporte-duplicados"])
+        self.assertIn("Canciones indexadas: 4", resultado.output)
+        self.assertIn("Grupos de posibles duplicados: 1", resultado.output)
+        # El grupo reúne la canción de los datos de prueba y sus dos variantes
+        self.assertEqual(resultado.output.lower().count("canción test 1"), 3)
+        self.assertNotIn("Canción Test 2", resultado.output)
+
+
+def _trabajo_lento(segundos):
+    """Consume CPU durante el tiempo indicado (para las pruebas de perfilado)."""
+    fin = time.perf_counter() + segundos
+    while time.perf_counter() < fin:
+        sum(range(100))
+
+
+class TestPerfilado(unittest.TestCase):
+    """Pruebas del perfilado estadístico de peticiones."""
+
+    def setUp(self):
+        """Crea una aplicación con el perfilado activo solo por cabecera."""
+        self.app = create_app(
+            config_extra={
+                "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+                "SQLALCHEMY_BINDS": {"trabajos": "sqlite:///:memory:"},
+                "PERFILADO_ACTIVO": True,
+                "PERFILADO_FRACCION": 0,
+                "PERFILADO_INTERVALO": 0.001,
+                "PERFILADO_TOKEN": "secreto",
+            }
+        )
+        self.client = self.app.test_client()
+        self.perfilador = self.app.extensions["perfilado"]
+        self.token = {"X-Perfilado-Token": "secreto"}
+
+    def test_muestreo_de_pilas(self):
+        """El perfilador atribuye las pilas del hilo perfilado a su ruta."""
+        perfilador = Perfilador(0.001)
+        perfilador.iniciar("GET /prueba")
+        _trabajo_lento(0.05)
+        perfilador.terminar()
+
+        collapsed = perfilador.collapsed()
+        self.assertTrue(collapsed.startswith("GET /prueba;"))
+        self.assertIn("_trabajo_lento", collapsed)
+        self.assertGreater(perfilador.resumen()[0]["muestras"], 0)
+
+    def test_error_al_muestrear(self):
+        """Una muestra que falla no detiene el hilo muestreador."""
+        pila = perfilado._pila
+        fallos = []
+
+        def pila_que_falla(frame):
+            if not fallos:
+                fallos.append(frame)
+                raise AttributeError("co_qualname")
+            return pila(frame)
+
+        perfilado._pila = pila_que_falla
+        self.addCleanup(setattr, perfilado, "_pila", pila)
+        perfilador = Perfilador(0.001)
+        perfilador.iniciar("GET /prueba")
+        _trabajo_lento(0.05)
+        perfilador.terminar()
+
+        self.assertEqual(perfilador.errores, 1)
+        self.assertIn("_trabajo_lento", perfilador.collapsed())
+
+    def test_solo_peticiones_con_cabecera(self):
+        """Con fracción 0 solo se perfilan las peticiones con cabecera y token."""
+        self.client.get("/api/canciones")
+        self.client.get("/api/canciones", headers={"X-Perfilar": "1"})
+        self.client.get("/api/canciones", headers={"X-Perfilar": "1", **self.token})
+        self.client.get("/api/perfilado", headers={"X-Perfilar": "1", **self.token})
+
+        data = json.loads(self.client.get("/api/perfilado", headers=self.token).data)
+        self.assertEqual(
+            [(r["ruta"], r["peticiones"]) for r in data], [("GET /api/canciones", 1)]
+        )
+
+    def test_exportaciones(self):
+        """Las pilas se exportan en formato collapsed y speedscope."""
+        self.perfilador.iniciar("GET /prueba")
+        _trabajo_lento(0.05)
+        self.perfilador.terminar()
+
+        response = self.client.get(
+            "/api/perfilado/collapsed?ruta=GET /prueba", headers=self.token
+        )
+        self.assertEqual(response.mimetype, "text/plain")
+        linea = response.get_data(as_text=True).splitlines()[0]
+        self.assertRegex(linea, r"^GET /prueba;.+ \d+$")
+
+        data = json.loads(
+            self.client.get("/api/perfilado/speedscope", headers=self.token).data
+        )
+        perfil = data["profiles"][0]
+        self.assertEqual(perfil["name"], "GET /prueba")
+        self.assertEqual(len(perfil["samples"]), len(perfil["weights"]))
+        nombres = {data["shared"]["frames"][i]["name"] for i in perfil["samples"][0]}
+        self.assertTrue(any("_trabajo_lento" in n for n in nombres))
+
+        self.client.delete("/api/perfilado", headers=self.token)
+        response = self.client.get("/api/perfilado", headers=self.token)
+        self.assertEqual(json.loads(response.data), [])
+
+    def test_token_y_desactivado(self):
+        """Los endpoints exigen el token y el perfilado no se activa sin él."""
+        self.assertEqual(self.client.get("/api/perfilado").status_code, 403)
+        response = self.client.get(
+            "/api/perfilado", headers={"X-Perfilado-Token": "otro"}
+        )
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get("/api/perfilado", headers=self.token)
+        self.assertEqual(response.status_code, 200)
+
+        for extra in ({}, {"PERFILADO_ACTIVO": True, "PERFILADO_TOKEN": ""}):
+            app = create_app(
+                config_extra={
+                    "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+                    "SQLALCHEMY_BINDS": {"trabajos": "sqlite:///:memory:"},
+                    **extra,
+                }
+            )
+            self.assertNotIn("perfilado", app.extensions)
+            response = app.test_client().get("/api/perfilado", headers=self.token)
+            self.assertEqual(response.status_code, 404)
+
+
+class TestPlaylists(TestAPI):
+    """Pruebas de las playlists ordenadas con claves fraccionarias."""
+
+    def setUp(self):
+        super().setUp()
+        response = self.client.post(
+            "/api/usuarios/1/playlists",
+            data=json.dumps({"nombre": "Para correr"}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.id_playlist = json.loads(response.data)["id"]
+
+    def _agregar(self, id_cancion, **posicion):
+        response = self.client.post(
+            f"/api/playlists/{self.id_playlist}/canciones",
+            data=json.dumps({"id_cancion": id_cancion, **posicion}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+        return json.loads(response.data)["id"]
+
+    def _mover(self, id_item, **posicion):
+        return self.client.put(
+            f"/api/playlists/{self.id_playlist}/canciones/{id_item}",
+            data=json.dumps(posicion),
+            content_type="application/json",
+        )
+
+    def _orden(self):
+        response = self.client.get(
+            f"/api/playlists/{self.id_playlist}/canciones?limite=100"
+        )
+        return [item["id"] for item in json.loads(response.data)["canciones"]]
+
+    def test_rango_entre(self):
+        """Las claves quedan estrictamente entre sus vecinas y no terminan en 0."""
+        rangos = [rango_entre()]
+        for i in range(200):
+            # Alterna inserciones al inicio, al final y en el medio
+            posicion = (0, len(rangos), len(rangos) // 2)[i % 3]
+            antes = rangos[posicion - 1] if posicion > 0 else None
+            despues = rangos[posicion] if posicion < len(rangos) else None
+            nuevo = rango_entre(antes, despues)
+            self.assertFalse(nuevo.endswith("0"))
+            rangos.insert(posicion, nuevo)
+        self.assertEqual(rangos, sorted(rangos))
+        self.assertEqual(len(set(rangos)), len(rangos))
+        self.assertEqual(rango_entre("A", "A1"), "A0V")
+        with self.assertRaises(ValueError):
+            rango_entre("b", "a")
+
+    def test_rangos_uniformes(self):
+        """Las claves de rebalanceo son crecientes y cortas."""
+        rangos = rangos_uniformes(10000)
+        self.assertEqual(rangos, sorted(set(rangos)))
+        self.assertLessEqual(max(len(r) for r in rangos), 4)
+
+    def test_insertar_mover_y_quitar(self):
+        """Las canciones se insertan, mueven y quitan en la posición indicada."""
+        a = self._agregar(1)
+        b = self._agregar(2)
+        c = self._agregar(1, antes_de=a)
+        d = self._agregar(2, despues_de=a)
+        self.assertEqual(self._orden(), [c, a, d, b])
+
+        self.assertEqual(self._mover(c, despues_de=b).status_code, 200)
+        self.assertEqual(self._orden(), [a, d, b, c])
+        self._mover(b)
+        self.assertEqual(self._orden(), [a, d, c, b])
+        self.assertEqual(self._mover(b, antes_de=b).status_code, 400)
+        self.assertEqual(self._mover(b, antes_de=a, despues_de=c).status_code, 400)
+
+        response = self.client.delete(
+            f"/api/playlists/{self.id_playlist}/canciones/{d}"
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self._orden(), [a, c, b])
+
+    def test_mover_escribe_una_fila(self):
+        """Mover una canción actualiza solo su fila (y comprueba la versión)."""
+        ids = [self._agregar(1) for _ in range(5)]
+        escrituras = []
+
+        def registrar(conn, cursor, statement, *args):
+            if statement.lstrip().upper().startswith(("UPDATE", "INSERT", "DELETE")):
+                escrituras.append(statement)
+
+        with self.app.app_context():
+            event.listen(db.engine, "before_cursor_execute", registrar)
+        try:
+            self._mover(ids[4], antes_de=ids[0])
+        finally:
+            with self.app.app_context():
+                event.remove(db.engine, "before_cursor_execute", registrar)
+        tablas = sorted(e.split()[1] for e in escrituras)
+        self.assertEqual(tablas, ["playlist", "playlist_item"])
+        self.assertEqual(self._orden(), [ids[4]] + ids[:4])
+
+    def test_paginacion_por_cursor(self):
+        """Las páginas se recorren con el cursor `siguiente`."""
+        ids = [self._agregar(1 + i % 2) for i in range(5)]
+        vistos, despues = [], ""
+        while True:
+            response = self.client.get(
+                f"/api/playlists/{self.id_playlist}/canciones"
+                f"?limite=2&despues={despues}"
+            )
+            data = json.loads(response.data)
+            vistos.extend(item["id"] for item in data["canciones"])
+            if data["siguiente"] is None:
+                break
+            despues = data["siguiente"]
+        self.assertEqual(vistos, ids)
+
+        for nombre in ("B", "C"):
+            self.client.post(
+                "/api/usuarios/1/playlists",
+                data=json.dumps({"nombre": nombre}),
+                content_type="application/json",
+            )
+        data = json.loads(self.client.get("/api/usuarios/1/playlists?limite=2").data)
+        self.assertEqual(len(data["playlists"]), 2)
+        siguiente = data["siguiente"]
+        data = json.loads(
+            self.client.get(f"/api/usuarios/1/playlists?despues={siguiente}").data
+        )
+        self.assertEqual([p["nombre"] for p in data["playlists"]], ["C"])
+        self.assertIsNone(data["siguiente"])
+
+    def test_rebalanceo_en_segundo_plano(self):
+        """Las claves largas se rebalancean sin cambiar el orden."""
+        self.app.config["PLAYLIST_RANGO_MAXIMO"] = 4
+        self.addCleanup(self.app.config.__setitem__, "PLAYLIST_RANGO_MAXIMO", 12)
+
+        primero = self._agregar(1)
+        ids = [primero]
+        # Insertar siempre detrás del primero alarga las claves. Las pruebas
+        # comparten una sola conexión, así que el ejecutor (de un solo hilo)
+        # queda ocupado hasta que termina la petición y luego se espera a cada
+        # rebalanceo para no leer sus cambios a medio confirmar.
+        ejecutor = self.app.extensions["playlists"]["ejecutor"]
+        for _ in range(30):
+            liberar = threading.Event()
+            ejecutor.submit(liberar.wait)
+            ids.insert(1, self._agregar(2, despues_de=primero))
+            liberar.set()
+            with self.app.app_context():
+                rebalanceador.esperar()
+
+        response = self.client.get(
+            f"/api/playlists/{self.id_playlist}/canciones?limite=100"
+        )
+        items = json.loads(response.data)["canciones"]
+        self.assertEqual([item["id"] for item in items], ids)
+        # Sin rebalanceo, 30 inserciones en el mismo hueco llegan a 7 dígitos
+        self.assertLessEqual(max(len(item["rango"]) for item in items), 4)
+
+    def test_rebalanceo_entre_lectura_y_escritura(self):
+        """Una clave calculada antes de un rebalanceo se recalcula antes de confirmar."""
+        ids = [self._agregar(1) for _ in range(4)]
+        rango_para = resources._rango_para
+        calculados = []
+
+        def rebalancear_al_calcular(*args, **kwargs):
+            calculados.append(rango_para(*args, **kwargs))
+            if len(calculados) == 1:
+                # Un rebalanceo se confirma justo después de leer las vecinas
+                rebalancear(self.id_playlist)
+            return calculados[-1]
+
+        resources._rango_para = rebalancear_al_calcular
+        self.addCleanup(setattr, resources, "_rango_para", rango_para)
+        nuevo = self._agregar(2, despues_de=ids[0])
+
+        self.assertEqual(len(calculados), 2)
+        self.assertEqual(self._orden(), [ids[0], nuevo] + ids[1:])
+
+    def test_cursor_tras_rebalanceo(self):
+        """El cursor sigue siendo válido aunque la playlist se rebalancee."""
+        ids = [self._agregar(1) for _ in range(5)]
+        url = f"/api/playlists/{self.id_playlist}/canciones?limite=2"
+        data = json.loads(self.client.get(url).data)
+        with self.app.app_context():
+            rebalancear(self.id_playlist)
+
+        response = self.client.get(f"{url}&despues={data['siguiente']}")
+        vistos = [item["id"] for item in json.loads(response.data)["canciones"]]
+        self.assertEqual(vistos, ids[2:4])
+
+        self.client.delete(f"/api/playlists/{self.id_playlist}/canciones/{ids[1]}")
+        response = self.client.get(f"{url}&despues={ids[1]}")
+        self.assertEqual(response.status_code, 404)
+
+    def test_borrados_en_cascada(self):
+        """Eliminar una playlist o una canción elimina sus elementos."""
+        self._agregar(1)
+        self._agregar(2)
+        self.client.delete("/api/canciones/2")
+        self.assertEqual(len(self._orden()), 1)
+
+        response = self.client.delete(f"/api/playlists/{self.id_playlist}")
+        self.assertEqual(response.status_code, 204)
+        response = self.client.get(f"/api/playlists/{self.id_playlist}/canciones")
+        self.assertEqual(response.status_code, 404)
+
+
+class TestTrabajos(TestAPI):
+    """Pruebas de la cola de trabajos en segundo plano."""
+
+    def tearDown(self):
+        # La cola está en otra base y no participa de la reversión de la prueba
+        with self.app.app_context():
+            Trabajo.query.delete()
+            db.session.commit()
+        super().tearDown()
+
+    def _trabajo(self, id):
+        response = self.client.get(f"/api/trabajos/{id}")
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.data)
+
+    def test_eliminar_usuario_asincrono(self):
+        """Con Prefer: respond-async el usuario se elimina en un trabajo."""
+        response = self.client.delete(
+            "/api/usuarios/1", headers={"Prefer": "respond-async"}
+        )
+        self.assertEqual(response.status_code, 202)
+        datos = json.loads(response.data)
+        self.assertEqual(datos["estado"], "pendiente")
+        self.assertTrue(response.headers["Location"].endswith(datos["url"]))
+        self.assertEqual(self.client.get("/api/usuarios/1").status_code, 200)
+
+        with self.app.app_context():
+            self.assertEqual(trabajos.procesar_pendientes(), 1)
+            self.assertIsNone(db.session.get(Usuario, 1))
+            self.assertEqual(Favorito.query.filter_by(id_usuario=1).count(), 0)
+
+        trabajo = self._trabajo(datos["id_trabajo"])
+        self.assertEqual(trabajo["estado"], "completado")
+        self.assertEqual(trabajo["intentos"], 1)
+        self.assertEqual(trabajo["resultado"], {"eliminado": True, "favoritos": 1})
+
+        # Sin la cabecera se sigue eliminando en la petición
+        self.assertEqual(self.client.delete("/api/usuarios/2").status_code, 204)
+
+    def test_importar_canciones(self):
+        """La importación se encola y crea e indexa las canciones al ejecutarse."""
+        canciones = [
+            {"titulo": "Importada 1", "artista": "Artista I", "año": 1999},
+            {"titulo": "Importada 2", "artista": "Artista I"},
+        ]
+        response = self.client.post(
+            "/api/canciones/importar",
+            data=json.dumps({"canciones": canciones}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 202)
+        id_trabajo = json.loads(response.data)["id_trabajo"]
+
+        with self.app.app_context():
+            trabajos.procesar_pendientes()
+        trabajo = self._trabajo(id_trabajo)
+        self.assertEqual(trabajo["estado"], "completado")
+        self.assertEqual(trabajo["resultado"]["importadas"], 2)
+        self.assertEqual(trabajo["argumentos"]["canciones"], canciones)
+        for id_cancion in trabajo["resultado"]["ids"]:
+            response = self.client.get(f"/api/canciones/{id_cancion}/duplicados")
+            self.assertEqual(response.status_code, 200)
+
+        response = self.client.post(
+            "/api/canciones/importar",
+            data=json.dumps({"canciones": [{"titulo": "Sin artista"}]}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_reintento_no_repite_la_importacion(self):
+        """Si el trabajador muere tras confirmar las canciones, no se duplican."""
+        canciones = [{"titulo": "Única", "artista": "Artista U"}]
+        with self.app.app_context():
+            trabajo = trabajos.encolar("importar_canciones", canciones=canciones)
+            trabajos.procesar_pendientes()
+            resultado = trabajo.resultado
+            # Simula que el trabajo no llegó a marcarse como completado
+            trabajo.estado, trabajo.resultado = "pendiente", None
+            db.session.commit()
+
+            self.assertEqual(trabajos.procesar_pendientes(), 1)
+            self.assertEqual(trabajo.estado, "completado")
+            self.assertEqual(trabajo.resultado, resultado)
+            self.assertEqual(Cancion.query.filter_by(titulo="Única").count(), 1)
+
+    def test_listar_trabajos(self):
+        """Los trabajos se listan del más reciente al más antiguo y por estado."""
+        for _ in range(3):
+            response = self.client.post("/api/estadisticas/reconstruir")
+            self.assertEqual(response.status_code, 202)
+        with self.app.app_context():
+            trabajos.procesar_pendientes(limite=1)
+
+        lista = json.loads(self.client.get("/api/trabajos").data)
+        self.assertEqual(len(lista), 3)
+        self.assertEqual(
+            [t["id"] for t in lista], sorted((t["id"] for t in lista), reverse=True)
+        )
+        pendientes = json.loads(self.client.get("/api/trabajos?estado=pendiente").data)
+        self.assertEqual(len(pendientes), 2)
+        self.assertEqual(self.client.get("/api/trabajos/999999").status_code, 404)
+
+    def test_reintentos_con_espera(self):
+        """Un trabajo que falla se reintenta con espera creciente hasta agotarse."""
+
+        @trabajos.tarea("prueba_fallida")
+        def fallar():
+            db.session.add(Usuario(nombre="Nunca", correo="nunca@test.com"))
+            db.session.flush()
+            raise RuntimeError("fallo a propósito")
+
+        self.addCleanup(trabajos._tareas.pop, "prueba_fallida", None)
+
+        with self.app.app_context():
+            trabajo = trabajos.encolar("prueba_fallida")
+            esperas = []
+            for _ in range(trabajo.max_intentos):
+                self.assertEqual(trabajos.procesar_pendientes(), 1)
+                # El fallo revierte los cambios de la tarea
+                self.assertIsNone(
+                    Usuario.query.filter_by(correo="nunca@test.com").first()
+                )
+                # No vuelve a tomarse hasta que pasa la espera
+                self.assertEqual(trabajos.procesar_pendientes(), 0)
+                if trabajo.estado == "pendiente":
+                    esperas.append(trabajo.disponible_desde - trabajo.fecha_inicio)
+                    trabajo.disponible_desde = datetime.utcnow()
+                    db.session.commit()
+
+            self.assertEqual(trabajo.estado, "fallido")
+            self.assertEqual(trabajo.intentos, 3)
+            self.assertIn("fallo a propósito", trabajo.error)
+            self.assertEqual(len(esperas), 2)
+            self.assertAlmostEqual(esperas[1] / esperas[0], 2, places=1)
+
+    def test_recuperar_abandonados(self):
+        """Un trabajo en curso cuyo trabajador murió vuelve a la cola."""
+        with self.app.app_context():
+            trabajo = trabajos.encolar("reconstruir_estadisticas")
+            self.assertEqual(trabajos.tomar("muerto").id, trabajo.id)
+            self.assertIsNone(trabajos.tomar("otro"))
+
+            trabajo.fecha_inicio = datetime.utcnow() - timedelta(
+                seconds=self.app.config["TRABAJOS_TIEMPO_MAXIMO"] + 1
+            )
+            db.session.commit()
+            self.assertEqual(trabajos.procesar_pendientes("otro"), 1)
+            self.assertEqual(trabajo.estado, "completado")
+            self.assertEqual(trabajo.trabajador, "otro")
+            self.assertEqual(trabajo.intentos, 2)
+
+    def test_tipo_desconocido(self):
+        """No se pueden encolar tipos sin tarea registrada."""
+        with self.app.app_context():
+            with self.assertRaises(ValueError):
+                trabajos.encolar("no_existe")
+            self.assertIn("eliminar_usuario", trabajos.tipos())
+
+
+class TestPlaylistsConcurrentes(unittest.TestCase):
+    """Pruebas de escrituras concurrentes en una playlist sobre una base en archivo."""
+
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.app = create_app(
+            "testing",
+            config_extra={
+                "SQLALCHEMY_DATABASE_URI": f"sqlite:///{self.directorio.name}/musica.db",
+                "SQLALCHEMY_BINDS": {
+                    "trabajos": f"sqlite:///{self.directorio.name}/trabajos.db"
+                },
+            },
+        )
+        with self.app.app_context():
+            self.ids_canciones = crear_canciones(8)
+            usuario = Usuario(nombre="Usuario", correo="usuario@test.com")
+            db.session.add(usuario)
+            db.session.flush()
+            playlist = Playlist(id_usuario=usuario.id, nombre="Concurrente")
+            db.session.add(playlist)
+            db.session.commit()
+            self.id_playlist = playlist.id
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+        self.directorio.cleanup()
+
+    def test_agregar_al_final_en_paralelo(self):
+        """Los agregados simultáneos al final no chocan con la clave de orden."""
+        barrera = threading.Barrier(len(self.ids_canciones))
+        estados = []
+
+        def agregar(id_cancion):
+            cliente = self.app.test_client()
+            barrera.wait()
+            response = cliente.post(
+                f"/api/playlists/{self.id_playlist}/canciones",
+                data=json.dumps({"id_cancion": id_cancion}),
+                content_type="application/json",
+            )
+            estados.append(response.status_code)
+
+        hilos = [
+            threading.Thread(target=agregar, args=(id,)) for id in self.ids_canciones
+        ]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(estados, [201] * len(self.ids_canciones))
+        with self.app.app_context():
+            rangos = [
+                item.rango
+                for item in PlaylistItem.query.filter_by(id_playlist=self.id_playlist)
+            ]
+        self.assertEqual(len(set(rangos)), len(self.ids_canciones))
+
+
+class TestClavesForaneas(unittest.TestCase):
+    """Pruebas de una base creada antes de declarar ON DELETE CASCADE."""
+
+    def setUp(self):
+        """Crea una base con el esquema original de usuarios y favoritos."""
+        self.directorio = tempfile.TemporaryDirectory()
+        self.ruta = os.path.join(self.directorio.name, "musica.db")
+        conexion = sqlite3.connect(self.ruta)
+        conexion.executescript(
+            """
+            CREATE TABLE usuario (
+                id INTEGER NOT NULL, nombre VARCHAR(100) NOT NULL,
+                correo VARCHAR(100) NOT NULL, fecha_registro DATETIME,
+                PRIMARY KEY (id), UNIQUE (correo));
+            CREATE TABLE cancion (
+                id INTEGER NOT NULL, titulo VARCHAR(200) NOT NULL,
+                artista VARCHAR(100) NOT NULL, album VARCHAR(200),
+                duracion INTEGER, "año" INTEGER, genero VARCHAR(50),
+                fecha_creacion DATETIME, PRIMARY KEY (id));
+            CREATE TABLE favorito (
+                id INTEGER NOT NULL, id_usuario INTEGER NOT NULL,
+                id_cancion INTEGER NOT NULL, fecha_marcado DATETIME,
+                PRIMARY KEY (id),
+                CONSTRAINT uq_usuario_cancion UNIQUE (id_usuario, id_cancion),
+                FOREIGN KEY(id_usuario) REFERENCES usuario (id),
+                FOREIGN KEY(id_cancion) REFERENCES cancion (id));
+            INSERT INTO usuario (nombre, correo) VALUES
+                ('Usuario 1', 'u1@test.com'), ('Usuario 2', 'u2@test.com');
+            INSERT INTO cancion (titulo, artista) VALUES ('Canción', 'Artista');
+            INSERT INTO favorito (id_usuario, id_cancion) VALUES (1, 1), (2, 1);
+            """
+        )
+        conexion.close()
+
+    def tearDown(self):
+        self.directorio.cleanup()
+
+    def _crear_app(self):
+        app = create_app(
+            "testing",
+            config_extra={
+                "SQLALCHEMY_DATABASE_URI": f"sqlite:///{self.ruta}",
+                "SQLALCHEMY_BINDS": {"trabajos": "sqlite:///:memory:"},
+            },
+        )
+        self.addCleanup(self._cerrar, app)
+        return app
+
+    def _cerrar(self, app):
+        with app.app_context():
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+
+    def test_base_sin_cascadas(self):
+        """Sin cascadas no se activan las claves foráneas hasta migrar la base."""
+        with self.assertLogs("musica_api", "WARNING") as registro:
+            app = self._crear_app()
+        self.assertIn("favorito", registro.output[0])
+        response = app.test_client().delete("/api/usuarios/1")
+        self.assertEqual(response.status_code, 204)
+
+        resultado = app.test_cli_runner().invoke(args=["migrar-cascadas"])
+        self.assertIn("Tablas reconstruidas: favorito", resultado.output)
+        # El favorito del usuario borrado quedó huérfano y la migración lo quita
+        self.assertIn("Se eliminaron 1 filas huérfanas", resultado.output)
+
+        app = self._crear_app()
+        with app.app_context():
+            self.assertEqual(tablas_sin_cascada(db.engine), [])
+            self.assertEqual(
+                db.session.execute(text("PRAGMA foreign_keys")).scalar(), 1
+            )
+            self.assertEqual(Favorito.query.count(), 1)
+        response = app.test_client().delete("/api/canciones/1")
+        self.assertEqual(response.status_code, 204)
+        with app.app_context():
+            self.assertEqual(Favorito.query.count(), 0)
+
+
+class TestTrabajadores(unittest.TestCase):
+    """Pruebas de los procesos trabajadores sobre bases en archivos."""
+
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.app = create_app(
+            "testing",
+            config_extra={
+                "SQLALCHEMY_DATABASE_URI": f"sqlite:///{self.directorio.name}/musica.db",
+                "SQLALCHEMY_BINDS": {
+                    "trabajos": f"sqlite:///{self.directorio.name}/trabajos.db"
+                },
+                "TRABAJOS_SONDEO": 0.1,
+            },
+        )
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+        self.directorio.cleanup()
+
+    def test_procesos_trabajadores(self):
+        """Dos procesos reparten la cola sin ejecutar dos veces un trabajo."""
+        with self.app.app_context():
+            ids_usuarios = crear_usuarios(4)
+            crear_favoritos(ids_usuarios, crear_canciones(50), 10)
+            db.session.commit()
+            ids = [
+                trabajos.encolar("eliminar_usuario", id_usuario=id).id
+                for id in ids_usuarios
+            ]
+
+            procesos, detener = trabajos.iniciar_trabajadores(2)
+            try:
+                limite = time.monotonic() + 60
+                while time.monotonic() < limite:
+                    db.session.expire_all()
+                    estados = {
+                        t.estado for t in Trabajo.query.filter(Trabajo.id.in_(ids))
+                    }
+                    if estados == {"completado"}:
+                        break
+                    time.sleep(0.1)
+            finally:
+                detener.set()
+                for proceso in procesos:
+                    proceso.join(30)
+
+            self.assertEqual(estados, {"completado"})
+            self.assertTrue(all(t.intentos == 1 for t in Trabajo.query))
+            self.assertEqual(Usuario.query.count(), 0)
+            self.assertEqual(Favorito.query.count(), 0)
+            self.assertTrue(all(p.exitcode == 0 for p in procesos))
+
+
+class TestInstantanea(TestAPI):
+    """Pruebas de la instantánea de canciones mapeada en memoria."""
+
+    def setUp(self):
+        super().setUp()
+        self.directorio = tempfile.TemporaryDirectory()
+        self.ruta = os.path.join(self.directorio.name, "instantanea.bin")
+        self.configuracion = {
+            clave: self.app.config[clave]
+            for clave in ("INSTANTANEA_RUTA", "INSTANTANEA_REVISION")
+        }
+        self.app.config["INSTANTANEA_RUTA"] = self.ruta
+
+    def tearDown(self):
+        self.app.config.update(self.configuracion)
+        instantanea.init_app(self.app)
+        super().tearDown()
+        self.directorio.cleanup()
+
+    def _mapear(self, limite=10):
+        """Escribe la instantánea y la mapea en la aplicación de pruebas."""
+        with self.app.app_context():
+            datos = escribir(self.ruta, limite)
+        instantanea.init_app(self.app)
+        return datos
+
+    def _metricas(self):
+        return json.loads(self.client.get("/api/instantanea").data)
+
+    def test_formato(self):
+        """Los registros se leen igual que en la base, con nulos y acentos."""
+        with self.app.app_context():
+            db.session.add(Cancion(titulo="Canción ñ", artista="Él"))
+            db.session.commit()
+            datos = escribir(self.ruta, 10)
+            mapa = Mapa(self.ruta)
+
+            self.assertEqual(len(mapa), 3)
+            self.assertEqual(mapa.version, datos["version"])
+            self.assertEqual(mapa.bytes, datos["bytes"])
+            for cancion in Cancion.query:
+                self.assertIn(cancion.id, mapa)
+                self.assertEqual(
+                    mapa.cancion(cancion.id),
+                    {c.key: getattr(cancion, c.key) for c in Cancion.__table__.columns},
+                )
+            self.assertIsNone(mapa.cancion(999999))
+            self.assertNotIn(0, mapa)
+
+        with open(self.ruta, "r+b") as archivo:
+            archivo.write(b"OTRACOSA")
+        with self.assertRaises(ValueError):
+            Mapa(self.ruta)
+
+    def test_servir_desde_instantanea(self):
+        """Las canciones de la instantánea no se consultan en la base."""
+        esperado = json.loads(self.client.get("/api/canciones/1").data)
+        self._mapear()
+
+        consultas = []
+        with self.app.app_context():
+            engine = db.engine
+        escuchar = lambda *args: consultas.append(args[2])  # noqa: E731
+        event.listen(engine, "before_cursor_execute", escuchar)
+        try:
+            response = self.client.get("/api/canciones/1")
+        finally:
+            event.remove(engine, "before_cursor_execute", escuchar)
+
+        self.assertEqual(json.loads(response.data), esperado)
+        self.assertFalse([c for c in consultas if "FROM cancion" in c])
+        response = self.client.get("/api/canciones/1?fields=id,titulo")
+        self.assertEqual(
+            json.loads(response.data), {"id": 1, "titulo": esperado["titulo"]}
+        )
+        self.assertEqual(self.client.get("/api/canciones/999").status_code, 404)
+
+        metricas = self._metricas()
+        self.assertTrue(metricas["activa"])
+        self.assertEqual(metricas["canciones"], 2)
+        self.assertEqual(metricas["aciertos"], 2)
+        self.assertEqual(metricas["fallos"], 1)
+
+    def test_cambios_posteriores(self):
+        """Las canciones cambiadas después de la versión se leen de la base."""
+        self._mapear()
+
+        # Cambio hecho por este proceso: se descarta al confirmarse
+        self.client.put(
+            "/api/canciones/1",
+            data=json.dumps({"titulo": "Título nuevo"}),
+            content_type="application/json",
+        )
+        datos = json.loads(self.client.get("/api/canciones/1").data)
+        self.assertEqual(datos["titulo"], "Título nuevo")
+
+        # Cambio hecho por otro proceso: solo queda en el registro de cambios
+        with self.app.app_context():
+            Cancion.query.filter_by(id=2).update({"genero": "Jazz"})
+            db.session.add(
+                Evento(tabla="cancion", operacion="actualizar", id_registro=2)
+            )
+            db.session.commit()
+        datos = json.loads(self.client.get("/api/canciones/2").data)
+        self.assertEqual(datos["genero"], "Jazz")
+
+        # Bajas en lote
+        self.client.post(
+            "/api/canciones/eliminar",
+            data=json.dumps({"ids": [2]}),
+            content_type="application/json",
+        )
+        self.assertEqual(self.client.get("/api/canciones/2").status_code, 404)
+        self.assertEqual(self._metricas()["invalidadas"], 2)
+
+        # Las altas y las canciones fuera de la instantánea no se acumulan
+        for titulo in ("Nueva", "Otra nueva"):
+            response = self.client.post(
+                "/api/canciones",
+                data=json.dumps({"titulo": titulo, "artista": "Artista"}),
+                content_type="application/json",
+            )
+        id_nueva = json.loads(response.data)["id"]
+        self.client.put(
+            f"/api/canciones/{id_nueva}",
+            data=json.dumps({"titulo": "Nueva editada"}),
+            content_type="application/json",
+        )
+        self.assertEqual(self.client.get("/api/canciones/1").status_code, 200)
+        self.assertEqual(self._metricas()["invalidadas"], 2)
+
+    def test_instantanea_de_otra_base(self):
+        """Una instantánea escrita desde otra base no se usa."""
+        # Base recreada: el evento de la versión existe pero es otro
+        version = self._mapear()["version"]
+        with self.app.app_context():
+            Evento.query.filter_by(id=version).update({"fecha": datetime(2000, 1, 1)})
+            db.session.commit()
+        self.assertEqual(self.client.get("/api/canciones/1").status_code, 200)
+        metricas = self._metricas()
+        self.assertFalse(metricas["activa"])
+        self.assertEqual(metricas["aciertos"], 0)
+
+        # Base con menos eventos que la versión
+        instantanea.init_app(self.app)
+        with self.app.app_context():
+            Evento.query.delete()
+            db.session.commit()
+        self.assertEqual(self.client.get("/api/canciones/1").status_code, 200)
+        self.assertFalse(self._metricas()["activa"])
+
+    def test_sin_eventos(self):
+        """Sin eventos no hay con qué fechar la instantánea: no se escribe ni se usa."""
+        with self.app.app_context():
+            Evento.query.delete()
+            db.session.commit()
+            with self.assertRaises(ValueError):
+                escribir(self.ruta, 10)
+        resultado = self.app.test_cli_runner().invoke(args=["instantanea"])
+        self.assertNotEqual(resultado.exit_code, 0)
+        self.assertIn("no tiene eventos", resultado.output)
+
+        with open(self.ruta, "wb") as archivo:
+            archivo.write(struct.pack("<8sIIQqd", b"MUSICAPI", 1, 0, 0, 0, 0.0))
+        with self.assertRaises(ValueError):
+            Mapa(self.ruta)
+
+    def test_comando(self):
+        """El comando guarda solo las canciones más populares."""
+        resultado = self.app.test_cli_runner().invoke(
+            args=["instantanea", "--canciones", "1"]
+        )
+        self.assertEqual(resultado.exit_code, 0, resultado.output)
+        self.assertIn("1 canciones", resultado.output)
+        mapa = Mapa(self.ruta)
+        # La canción 1 es la única con favoritos
+        self.assertIn(1, mapa)
+        self.assertNotIn(2, mapa)
+
+    def test_sin_instantanea(self):
+        """Sin archivo (o con uno dañado) se lee siempre de la base."""
+        with open(self.ruta, "wb") as archivo:
+            archivo.write(b"corto")
+        instantanea.init_app(self.app)
+        self.assertEqual(self.client.get("/api/canciones/1").status_code, 200)
+        metricas = self._metricas()
+        self.assertFalse(metricas["activa"])
+        self.assertEqual(metricas["canciones"], 0)
+
+
+class TestDatosVolumen(PruebaTransaccional):
+    """Pruebas sobre un catálogo sintético grande sembrado con las fábricas."""
+
+    USUARIOS = 500
+    CANCIONES = 2000
+    FAVORITOS_POR_USUARIO = 20
+
+    def _crear_datos_prueba(self):
+        self.ids_usuarios = crear_usuarios(self.USUARIOS)
+        self.ids_canciones = crear_canciones(self.CANCIONES)
+        crear_favoritos(
+            self.ids_usuarios, self.ids_canciones, self.FAVORITOS_POR_USUARIO
+        )
+        db.session.commit()
+
+    def test_fabricas(self):
+        """Las fábricas crean la cantidad pedida de filas."""
+        with self.app.app_context():
+            self.assertEqual(Usuario.query.count(), self.USUARIOS)
+            self.assertEqual(Cancion.query.count(), self.CANCIONES)
+            self.assertEqual(
+                Favorito.query.count(), self.USUARIOS * self.FAVORITOS_POR_USUARIO
+            )
+
+    def test_populares_coincide_con_conteo(self):
+        """El ranking de populares coincide con el conteo de la tabla."""
+        with self.app.app_context():
+            conteo = Counter(id for (id,) in db.session.query(Favorito.id_cancion))
+        response = self.client.get("/api/canciones/populares?limite=5")
+        data = json.loads(response.data)
+        self.assertEqual(
+            [c["favoritos"] for c in data], [n for _, n in conteo.most_common(5)]
+        )
+
+    def test_favoritos_de_usuario_con_consultas_constantes(self):
+        """Listar los favoritos de un usuario no hace una consulta por canción."""
+        consultas = []
+
+        def registrar(conn, cursor, statement, *args):
+            consultas.append(statement)
+
+        with self.app.app_context():
+            event.listen(db.engine, "before_cursor_execute", registrar)
+        try:
+            response = self.client.get(
+                f"/api/usuarios/{self.ids_usuarios[0]}/favoritos"
+            )
+        finally:
+            with self.app.app_context():
+                event.remove(db.engine, "before_cursor_execute", registrar)
+
+        data = json.loads(response.data)
+        self.assertEqual(len(data["canciones_favoritas"]), self.FAVORITOS_POR_USUARIO)
+        self.assertLessEqual(
+            len([c for c in consultas if c.lstrip().upper().startswith("SELECT")]), 3
+        )
+
+    def test_estadisticas_reconstruidas(self):
+        """Las estadísticas reconstruidas cuentan todos los favoritos sembrados."""
+        consultas = []
+
+        def registrar(conn, cursor, statement, *args):
+            if statement.lstrip().upper().startswith(("SELECT", "INSERT", "DELETE")):
+                consultas.append(statement)
+
+        with self.app.app_context():
+            engine = db.engine
+            event.listen(engine, "before_cursor_execute", registrar)
+            try:
+                self.assertEqual(reconstruir(), self.USUARIOS)
+            finally:
+                event.remove(engine, "before_cursor_execute", registrar)
+        # Un borrado, un upsert por dimensión y el conteo de usuarios
+        self.assertLessEqual(len(consultas), 7)
+        response = self.client.get(f"/api/usuarios/{self.ids_usuarios[0]}/estadisticas")
+        data = json.loads(response.data)
+        self.assertEqual(data["canciones"], self.FAVORITOS_POR_USUARIO)
+        self.assertEqual(
+            sum(g["canciones"] for g in data["generos"]), self.FAVORITOS_POR_USUARIO
+        )
+
+
 if __name__ == "__main__":
     unittest.main()